@@ -170,8 +170,12 @@ class XPlanUmringPlugin(object):
         self.dlg.cb_ags.setEditable(True)
         completer = QCompleter(self.bezeichnung_ags, self.dlg.cb_ags)
         self.dlg.cb_ags.setCompleter(completer)
-        self.dlg.cb_ags.completer().setCompletionMode(QCompleter.CompletionMode.PopupCompletion)
-        self.dlg.cb_ags.completer().setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.dlg.cb_ags.completer().setCompletionMode(
+            QCompleter.CompletionMode.PopupCompletion
+        )
+        self.dlg.cb_ags.completer().setCaseSensitivity(
+            Qt.CaseSensitivity.CaseInsensitive
+        )
         self.dlg.cb_ags.currentTextChanged.connect(self.on_combo_box_changed)
 
         def saveTool(tool):
@@ -208,4 +212,7 @@ class XPlanUmringPlugin(object):
             self.settings.setValue("xplan-umring/kommune", self.kommune)
             self.settings.setValue("xplan-umring/ags", self.ags)
 
+            # Voreinstellungen der Algorithmen aktualisieren
+            self.provider.refreshAlgorithms()
+
             processing.execAlgorithmDialog("xplanumring:" + self.selectedTool)
@@ -0,0 +1,446 @@
+"""
+***************************************************************************
+XPlan-Umring - Batch-Umring
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import os
+
+from qgis.core import (
+    NULL,
+    QgsExpression,
+    QgsGeometry,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterExpression,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterVectorLayer,
+)
+
+from qgis.PyQt.QtCore import QDate, QDateTime
+
+from .xplan_umring_core import XPlanUmringError
+from .xplan_umring_geometry import (
+    OverlapIndex,
+    normalizeGeometry,
+    umringJobGeometry,
+    umringTransform,
+)
+from .xplan_umring_parallel import runJobs, writeArchiveJob
+from .xplan_umring_profiling import Profiler
+from .xplan_umring_settings import loadUmringSettings
+from .xplan_umring_templates import planNameWarnings
+from .xplan_umring_writer import archiveName
+
+# Plantyp: (Anzeigename, Schlüssel für buildPlan)
+PLAN_TYPE_OPTIONS = [
+    ("Bebauungsplan v5.4", "bp54"),
+    ("Bebauungsplan v6.0", "bp60"),
+    ("Flächennutzungsplan v6.0", "fp60"),
+    ("Landschaftsplan v6.0", "lp60"),
+]
+
+# (Parametername, Beschreibung, Schlüssel in attributes, Pflicht)
+ATTRIBUTE_PARAMETERS = [
+    ("Name", "Name", "name", True),
+    ("Nummer", "Nummer", "nummer", True),
+    ("Gemeindename", "Gemeindename", "gemeindename", True),
+    ("Ortsteilname", "Ortsteilname", "ortsteilname", False),
+    ("AGS", "AGS (8-stellig)", "ags", True),
+    ("Plangeber", "Plangeber (nur BP/LP)", "plangeber", False),
+    ("Beschreibung", "Beschreibung (nur FP)", "beschreibung", False),
+    ("Kommentar", "Kommentar (nur FP)", "kommentar", False),
+    ("Bundesland", "Bundesland (nur LP)", "bundesland", False),
+    (
+        "RechtlicheAussenwirkung",
+        "Rechtliche Außenwirkung (nur LP)",
+        "rechtliche_aussenwirkung",
+        False,
+    ),
+    ("Planart", "Planart", "planart", True),
+    ("Rechtsstand", "Rechtsstand", "rechtsstand", True),
+    ("DatumRechtsstand", "Datum Rechtsstand", "datum", False),
+    (
+        "Erstellungsmaßstab",
+        "Erstellungsmaßstab (nur v6.0)",
+        "erstellungsmassstab",
+        False,
+    ),
+    (
+        "DatumHerstellung",
+        "Datum technische Herstellung (nur v6.0)",
+        "herstellungsdatum",
+        False,
+    ),
+]
+
+# Attribute, von denen nur der Code vor der Klartextbezeichnung verwendet wird,
+# z.B. "1000 (BPlan)" -> "1000"
+CODE_ATTRIBUTES = ("planart", "rechtsstand", "bundesland")
+
+
+def expressionValueToString(value):
+    """
+    Ergebnis eines Ausdrucks als Zeichenkette für das XPlanGML.
+    """
+    if value is None or value == NULL:
+        return ""
+    if isinstance(value, QDateTime):
+        value = value.date()
+    if isinstance(value, QDate):
+        return value.toString("yyyy-MM-dd") if value.isValid() else ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+class XPlanUmringAlgorithmBatch(QgsProcessingAlgorithm):
+    def __init__(self, settings=None):
+        super().__init__()
+        self.settings = settings if settings is not None else loadUmringSettings()
+
+    def createInstance(self):
+        return XPlanUmringAlgorithmBatch(self.settings)
+
+    def name(self):
+        return "batchumring"
+
+    def displayName(self):
+        return "Batch-Umring"
+
+    def group(self):
+        return self.groupId()
+
+    def groupId(self):
+        return ""
+
+    def shortHelpString(self):
+        return (
+            "Je Feature eines Polygonlayers ein eigenes XPlan-Archiv erzeugen (Bebauungsplan v5.4/v6.0, Flächennutzungsplan v6.0 oder Landschaftsplan v6.0)."
+            + "\n\n"
+            + "Die Planattribute werden je Feature aus Feldern oder Ausdrücken gelesen. Bei Planart, Rechtsstand und Bundesland wird nur der Code verwendet, z.B. 1000 oder '1000 (BPlan)'. Datumsfelder werden als JJJJ-MM-TT geschrieben."
+            + "\n\n"
+            + "Ist ein Gruppierungsausdruck angegeben, werden alle Features mit gleichem Wert zu einem Plan zusammengefasst; die Attribute werden dann vom ersten Feature der Gruppe übernommen."
+            + "\n\n"
+            + "Die XPlan-Archive werden nach dem Plannamen benannt, bei gleichen Namen wird eine fortlaufende Nummer angehängt."
+            + "\n\n"
+            + "Bei mehr als einem Prozess werden die Archive parallel in eigenen Python-Prozessen geschrieben, die Geometrien werden weiterhin in QGIS gelesen. Das Ergebnis ist unabhängig von der Anzahl der Prozesse."
+            + "\n\n"
+            + "Für die Verwendung in der xPlanBox sind maximal 100 und nur folgende Zeichen für den Plannamen erlaubt: A-Z a-z 0-9 . () _ - ä ü ö Ä Ü Ö ß und Leerzeichen"
+            + "\n\n"
+            + "Optional kann ein Layer mit vorhandenen Geltungsbereichen (z.B. der XPlan-Index) angegeben werden. Überlappungen der neuen Umringe mit diesen Plänen werden dann mit Fläche als Warnung ausgegeben."
+            + "\n\n"
+            + "Autor: Kreis Viersen"
+            + "\n\n"
+            + "Kontakt: open@kreis-viersen.de"
+            + "\n\n"
+            + "GitHub: https://github.com/kreis-viersen/xplan-umring"
+        )
+
+    def shortDescription(self):
+        return "Je Feature eines Polygonlayers ein XPlan-Archiv erzeugen."
+
+    def initAlgorithm(self, config=None):
+        defaults = {
+            "Gemeindename": QgsExpression.quotedString(self.settings["kommune"]),
+            "AGS": QgsExpression.quotedString(self.settings["ags"]),
+            "Bundesland": "'1900'",
+            "RechtlicheAussenwirkung": "true",
+            "Planart": "'1000'",
+            "Rechtsstand": "'1000'",
+        }
+
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                "Umring",
+                "Vektorlayer mit Umringpolygonen [Pflicht]",
+                optional=False,
+                types=[QgsProcessing.SourceType.TypeVectorPolygon],
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "Plantyp",
+                "Plantyp [Pflicht]",
+                options=[plan_type[0] for plan_type in PLAN_TYPE_OPTIONS],
+                optional=False,
+                allowMultiple=False,
+                defaultValue=1,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExpression(
+                "Gruppierung",
+                "Gruppierung (Features mit gleichem Wert ergeben einen Plan)",
+                parentLayerParameterName="Umring",
+                optional=True,
+                defaultValue=None,
+            )
+        )
+        for parameter_name, description, key, required in ATTRIBUTE_PARAMETERS:
+            self.addParameter(
+                QgsProcessingParameterExpression(
+                    parameter_name,
+                    description + (" [Pflicht]" if required else ""),
+                    parentLayerParameterName="Umring",
+                    optional=not required,
+                    defaultValue=defaults.get(parameter_name),
+                )
+            )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "Koordinatenbezugssystem",
+                "Koordinatenbezugssystem (KBS) [Pflicht]",
+                options=[
+                    "EPSG:25831",
+                    "EPSG:25832",
+                    "EPSG:25833",
+                    "EPSG:5649",
+                    "EPSG:4647",
+                    "EPSG:5650",
+                    "EPSG:5651",
+                    "EPSG:5652",
+                    "EPSG:5653",
+                    "EPSG:31466",
+                    "EPSG:31467",
+                    "EPSG:31468",
+                    "EPSG:31469",
+                ],
+                optional=False,
+                allowMultiple=False,
+                usesStaticStrings=True,
+                defaultValue="EPSG:25832",
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                "Referenzplaene",
+                "Vorhandene Geltungsbereiche für Überlappungsprüfung (z.B. XPlan-Index)",
+                optional=True,
+                types=[QgsProcessing.SourceType.TypeVectorPolygon],
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                "Prozesse",
+                "Anzahl paralleler Prozesse zum Schreiben der Archive",
+                optional=False,
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=1,
+                maxValue=os.cpu_count() or 1,
+                defaultValue=1,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                name="outputZip",
+                description="Speicherpfad für erzeugte XPlan-Archive [Pflicht]",
+                behavior=QgsProcessingParameterFile.Behavior.Folder,
+                fileFilter="Alle Dateien (*.*)",
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        with Profiler(self.settings["profiling"], feedback) as profiler:
+            source = self.parameterAsSource(parameters, "Umring", context)
+            if source is None:
+                raise QgsProcessingException(
+                    self.invalidSourceError(parameters, "Umring")
+                )
+
+            plan_type = PLAN_TYPE_OPTIONS[
+                self.parameterAsEnum(parameters, "Plantyp", context)
+            ][1]
+            kbs = self.parameterAsString(parameters, "Koordinatenbezugssystem", context)
+            my_output_folder = self.parameterAsString(parameters, "outputZip", context)
+
+            # Ausdrücke, Kontext und Transformation einmalig für den ganzen Lauf
+            expression_context = self.createExpressionContext(
+                parameters, context, source
+            )
+
+            def prepareExpression(parameter_name):
+                text = self.parameterAsExpression(parameters, parameter_name, context)
+                if not text:
+                    return None
+                expression = QgsExpression(text)
+                if expression.hasParserError():
+                    raise QgsProcessingException(
+                        "Ungültiger Ausdruck für "
+                        + parameter_name
+                        + ": "
+                        + expression.parserErrorString()
+                    )
+                expression.prepare(expression_context)
+                return expression
+
+            expressions = {
+                key: prepareExpression(parameter_name)
+                for parameter_name, description, key, required in ATTRIBUTE_PARAMETERS
+            }
+            group_expression = prepareExpression("Gruppierung")
+
+            transform = umringTransform(source.sourceCrs(), kbs, context)
+
+            # Features einlesen und nach Plan gruppieren
+            groups = {}
+            total = 100.0 / source.featureCount() if source.featureCount() else 0
+            with profiler.stage("Features lesen und gruppieren") as stage:
+                for current, feature in enumerate(source.getFeatures()):
+                    if feedback.isCanceled():
+                        break
+                    feedback.setProgress(int(current * total / 2))
+
+                    geometry = feature.geometry()
+                    if geometry.isNull() or geometry.isEmpty():
+                        feedback.pushWarning(
+                            "Feature "
+                            + str(feature.id())
+                            + " ohne Geometrie übersprungen."
+                        )
+                        continue
+
+                    expression_context.setFeature(feature)
+                    if group_expression is not None:
+                        group_key = expressionValueToString(
+                            group_expression.evaluate(expression_context)
+                        )
+                    else:
+                        group_key = feature.id()
+
+                    if group_key not in groups:
+                        attributes = {}
+                        for key, expression in expressions.items():
+                            value = ""
+                            if expression is not None:
+                                value = expressionValueToString(
+                                    expression.evaluate(expression_context)
+                                )
+                                if expression.hasEvalError():
+                                    raise QgsProcessingException(
+                                        "Fehler beim Auswerten des Ausdrucks für "
+                                        + key
+                                        + ": "
+                                        + expression.evalErrorString()
+                                    )
+                            if key in CODE_ATTRIBUTES and value != "":
+                                value = value.split()[0]
+                            attributes[key] = value
+                        groups[group_key] = (attributes, [])
+                    groups[group_key][1].append(geometry)
+                stage.record(
+                    features=sum(len(group[1]) for group in groups.values()),
+                    plans=len(groups),
+                )
+
+            if not groups:
+                raise QgsProcessingException(
+                    "Der Eingabelayer enthält keine Umringgeometrie, bitte Eingabe überprüfen."
+                )
+
+            processes = self.parameterAsInt(parameters, "Prozesse", context)
+
+            # Vorhandene Geltungsbereiche einmalig für alle Pläne indizieren
+            overlap_index = None
+            reference = self.parameterAsSource(parameters, "Referenzplaene", context)
+            if reference is not None:
+                overlap_index = OverlapIndex(
+                    reference, kbs, context, feedback, profiler
+                )
+
+            def jobs():
+                # Geometrien werden im aufrufenden Thread aus QGIS gelesen,
+                # Serialisierung und Zip-Erstellung ggf. in den Worker-Prozessen
+                used_names = set()
+                for attributes, geometries in groups.values():
+                    if feedback.isCanceled():
+                        return
+
+                    name = attributes["name"]
+                    for message in planNameWarnings(name):
+                        feedback.pushWarning(name + ": " + message)
+
+                    geometry = normalizeGeometry(
+                        QgsGeometry.collectGeometry(geometries),
+                        kbs,
+                        transform,
+                        profiler,
+                    )
+                    if overlap_index is not None:
+                        overlap_index.report(geometry, feedback, name, profiler)
+                    bbox = geometry.boundingBox()
+                    attributes["kbs"] = kbs
+                    attributes["lower_corner"] = (
+                        str(bbox.xMinimum()) + " " + str(bbox.yMinimum())
+                    )
+                    attributes["upper_corner"] = (
+                        str(bbox.xMaximum()) + " " + str(bbox.yMaximum())
+                    )
+                    with profiler.stage("Geometrie aufbereiten"):
+                        polygons, gml = umringJobGeometry(geometry, kbs)
+
+                    # Gleiche Plannamen durchnummerieren statt Archive zu überschreiben
+                    zip_name = archiveName(name) or "xplan"
+                    unique_name = zip_name
+                    number = 1
+                    while unique_name.lower() in used_names:
+                        number += 1
+                        unique_name = zip_name + "_" + str(number)
+                    used_names.add(unique_name.lower())
+
+                    yield {
+                        "plan_type": plan_type,
+                        "attributes": attributes,
+                        "polygons": polygons,
+                        "gml": gml,
+                        "zip_path": os.path.join(
+                            my_output_folder, unique_name + ".zip"
+                        ),
+                    }
+
+            if processes > 1:
+                feedback.pushInfo(
+                    "XPlan-Archive werden mit "
+                    + str(processes)
+                    + " Prozessen erstellt."
+                )
+
+            zip_paths = []
+            try:
+                for result in runJobs(writeArchiveJob, jobs(), processes):
+                    zip_path = result.pop("zip_path")
+                    zip_paths.append(zip_path)
+                    if profiler.enabled:
+                        # Im Worker gemessen, daher ohne Speicherangabe
+                        profiler.add("XPlan-Archiv schreiben", result)
+                    feedback.setProgress(50 + int(len(zip_paths) * 50 / len(groups)))
+                    feedback.pushInfo("XPlan-Archiv wurde erstellt: " + zip_path)
+            except (OSError, RuntimeError, ValueError, XPlanUmringError) as e:
+                raise QgsProcessingException(
+                    "XPlan-Archiv konnte nicht erstellt werden: " + str(e)
+                )
+
+            profiler.finish(os.path.join(my_output_folder, "batch-umring"))
+
+            return {"XPlan-Archive wurden erstellt": zip_paths}
@@ -0,0 +1,569 @@
+"""
+***************************************************************************
+XPlan-Umring - Batch Clip Raster
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import csv
+import os
+import re
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCsException,
+    QgsExpression,
+    QgsFeatureRequest,
+    QgsGeometry,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterExpression,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterVectorLayer,
+    QgsRectangle,
+    QgsSpatialIndex,
+)
+
+from .xplan_umring_algorithm_batch import expressionValueToString
+from .xplan_umring_core import XPlanUmringError
+from .xplan_umring_geometry import linearizeMask, pixelTolerance
+from .xplan_umring_parallel import runJobs
+from .xplan_umring_profiling import Profiler
+from .xplan_umring_raster import (
+    BLOCK_SIZES,
+    MAX_WARP_MEMORY,
+    OUTPUT_PROFILES,
+    WARP_MEMORY_PER_THREAD,
+    clipRasterJob,
+    rasterFiles,
+    rasterGrid,
+)
+from .xplan_umring_settings import loadUmringSettings
+
+# Operationen: (Anzeigename, Schlüssel, Status im Bericht)
+OPERATIONS = [
+    ("Rasterplan auf Polygon zuschneiden", "clip", "Zugeschnitten"),
+    ("Polygon von Rasterplan abziehen", "difference", "Abgezogen"),
+]
+
+
+def keyCandidates(file_name):
+    """
+    Schlüssel, unter denen ein Umring zu einer Rasterdatei passt: der
+    Dateiname ohne Endung und alle Anfänge davon bis zu einem Trennzeichen
+    mit mindestens zwei Teilen (z.B. "bp_12" für "bp_12_blatt2.tif", nicht
+    aber "bp"), längster zuerst, jeweils in Kleinbuchstaben.
+    """
+    stem = os.path.splitext(file_name)[0].lower()
+    candidates = [stem]
+    separators = [
+        match.start()
+        for match in re.finditer(r"[\s_\-.]+", stem)
+        if 0 < match.start() and match.end() < len(stem)
+    ]
+    # Der erste Teil allein ist zu unspezifisch
+    for position in reversed(separators[1:]):
+        candidates.append(stem[:position])
+    return candidates
+
+
+class XPlanUmringAlgorithmBatchClipRaster(QgsProcessingAlgorithm):
+    def __init__(self, settings=None):
+        super().__init__()
+        self.settings = settings if settings is not None else loadUmringSettings()
+
+    def createInstance(self):
+        return XPlanUmringAlgorithmBatchClipRaster(self.settings)
+
+    def name(self):
+        return "batchclipraster"
+
+    def displayName(self):
+        return "Batch-Rasterpläne zuschneiden"
+
+    def group(self):
+        return self.groupId()
+
+    def groupId(self):
+        return ""
+
+    def shortHelpString(self):
+        return (
+            "Alle Rasterpläne eines Ordners in einem Lauf auf ihr Polygon zuschneiden bzw. das Polygon davon abziehen."
+            + "\n\n"
+            + "Eingabe ist ein Ordner mit Rasterplänen (*.tif, *.png, *.jpg, *.jp2) sowie ein Polygonlayer. Mit einem Schlüssel (Feld oder Ausdruck) wird jedem Rasterplan das Polygon mit gleichem Dateinamen (ohne Endung, Groß-/Kleinschreibung egal) zugeordnet; passt kein Schlüssel, wird der Anfang des Dateinamens bis zu einem Trennzeichen verglichen, mindestens aber die ersten zwei Teile (z.B. Schlüssel bp_12 für bp_12_blatt2.tif, nicht bp). Der verwendete Schlüssel wird im Protokoll und im Bericht ausgegeben. Features mit gleichem Schlüssel werden zusammengefasst. Ohne Schlüssel wird das Polygon mit der größten Überlagerung der Rasterausdehnung verwendet."
+            + "\n\n"
+            + "Die Rasterpläne werden in mehreren Prozessen (voreingestellt ein Prozess je Prozessorkern) bearbeitet und als GeoTIFF unter gleichem Namen in den Ausgabeordner geschrieben. Eine Übersicht über bearbeitete, übersprungene und fehlerhafte Rasterpläne mit Zuordnung und Laufzeit wird als raster-zuschnitt-bericht.csv im Ausgabeordner gespeichert."
+            + "\n\n"
+            + "Optional kann die Farbe auf Farbpalettenindex 0 als Leerwert gesetzt werden. Als Ausgabeprofil kann neben einfachem GeoTIFF ein gekacheltes GeoTIFF mit Predictor und internen Übersichten oder ein Cloud Optimized GeoTIFF (COG) gewählt werden."
+            + "\n\n"
+            + "Autor: Kreis Viersen"
+            + "\n\n"
+            + "Kontakt: open@kreis-viersen.de"
+            + "\n\n"
+            + "GitHub: https://github.com/kreis-viersen/xplan-umring"
+        )
+
+    def shortDescription(self):
+        return "Viele Rasterpläne auf ihr Polygon zuschneiden."
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                "Umring",
+                "Vektorlayer mit Polygonen [Pflicht]",
+                optional=False,
+                types=[QgsProcessing.SourceType.TypeVectorPolygon],
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExpression(
+                "Schluessel",
+                "Schlüssel (Feld oder Ausdruck, Vergleich mit dem Dateinamen)",
+                parentLayerParameterName="Umring",
+                optional=True,
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                "Eingabeordner",
+                "Ordner mit Rasterplänen [Pflicht]",
+                behavior=QgsProcessingParameterFile.Behavior.Folder,
+                optional=False,
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "Operation",
+                "Verarbeitung",
+                options=[operation[0] for operation in OPERATIONS],
+                optional=False,
+                allowMultiple=False,
+                defaultValue=0,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                "no_data",
+                "Farbpalettenindex 0 als Leerwert setzen",
+                optional=True,
+                defaultValue=False,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "ausgabeprofil",
+                "Ausgabeprofil",
+                options=[profile[0] for profile in OUTPUT_PROFILES],
+                optional=False,
+                allowMultiple=False,
+                defaultValue=0,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                "Prozesse",
+                "Anzahl paralleler Prozesse",
+                optional=False,
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=1,
+                maxValue=os.cpu_count() or 1,
+                defaultValue=os.cpu_count() or 1,
+            )
+        )
+        parameter = QgsProcessingParameterEnum(
+            "blockgroesse",
+            "Kachelgröße (Pixel)",
+            options=BLOCK_SIZES,
+            allowMultiple=False,
+            usesStaticStrings=True,
+            defaultValue="512",
+        )
+        parameter.setFlags(
+            parameter.flags() | QgsProcessingParameterDefinition.Flag.FlagAdvanced
+        )
+        self.addParameter(parameter)
+        self.addParameter(
+            QgsProcessingParameterFile(
+                name="Ausgabeordner",
+                description="Speicherpfad für zugeschnittene Rasterpläne [Pflicht]",
+                behavior=QgsProcessingParameterFile.Behavior.Folder,
+                fileFilter="Alle Dateien (*.*)",
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        with Profiler(self.settings["profiling"], feedback) as profiler:
+            source = self.parameterAsSource(parameters, "Umring", context)
+            if source is None:
+                raise QgsProcessingException(
+                    self.invalidSourceError(parameters, "Umring")
+                )
+
+            operation_index = self.parameterAsEnum(parameters, "Operation", context)
+            _, operation, done_status = OPERATIONS[operation_index]
+            no_data = (
+                0 if self.parameterAsBool(parameters, "no_data", context) else None
+            )
+            profile = OUTPUT_PROFILES[
+                self.parameterAsEnum(parameters, "ausgabeprofil", context)
+            ][1]
+            block_size = int(
+                self.parameterAsString(parameters, "blockgroesse", context)
+            )
+            processes = self.parameterAsInt(parameters, "Prozesse", context)
+            input_folder = self.parameterAsString(parameters, "Eingabeordner", context)
+            output_folder = self.parameterAsString(parameters, "Ausgabeordner", context)
+            if os.path.normcase(os.path.abspath(input_folder)) == os.path.normcase(
+                os.path.abspath(output_folder)
+            ):
+                raise QgsProcessingException(
+                    "Eingabe- und Ausgabeordner müssen verschieden sein."
+                )
+
+            input_files = rasterFiles(input_folder)
+            if not input_files:
+                raise QgsProcessingException(
+                    "Der Eingabeordner enthält keine Rasterpläne, bitte Eingabe überprüfen."
+                )
+
+            # Die Prozessorkerne auf die Prozesse aufteilen, jeder Rasterplan
+            # bekommt die übrigen Kerne als Threads (gdalwarp und Kompression)
+            threads = max(1, (os.cpu_count() or 1) // processes)
+            warp_memory = min(WARP_MEMORY_PER_THREAD * threads, MAX_WARP_MEMORY)
+            cache = max(2 * warp_memory, 256)
+
+            # Polygone einmalig einlesen: mit Schlüssel gruppiert, sonst je
+            # Feature in einem räumlichen Index
+            key_expression = self.parameterAsExpression(
+                parameters, "Schluessel", context
+            )
+            geometries = {}
+            index = None
+            with profiler.stage("Features lesen") as stage:
+                if key_expression:
+                    expression_context = self.createExpressionContext(
+                        parameters, context, source
+                    )
+                    expression = QgsExpression(key_expression)
+                    if expression.hasParserError():
+                        raise QgsProcessingException(
+                            "Ungültiger Ausdruck für Schluessel: "
+                            + expression.parserErrorString()
+                        )
+                    expression.prepare(expression_context)
+                    for feature in source.getFeatures():
+                        if feedback.isCanceled():
+                            break
+                        geometry = feature.geometry()
+                        if geometry.isNull() or geometry.isEmpty():
+                            continue
+                        expression_context.setFeature(feature)
+                        key = expressionValueToString(
+                            expression.evaluate(expression_context)
+                        ).lower()
+                        if key == "":
+                            feedback.pushWarning(
+                                "Feature "
+                                + str(feature.id())
+                                + " ohne Schlüssel übersprungen."
+                            )
+                            continue
+                        geometries.setdefault(key, []).append(geometry)
+                    stage.record(keys=len(geometries))
+                else:
+                    index = QgsSpatialIndex(
+                        source.getFeatures(QgsFeatureRequest().setNoAttributes()),
+                        feedback,
+                        QgsSpatialIndex.Flag.FlagStoreFeatureGeometries,
+                    )
+
+            if key_expression and not geometries:
+                raise QgsProcessingException(
+                    "Der Eingabelayer enthält kein Polygon mit Schlüssel, bitte Eingabe überprüfen."
+                )
+
+            transforms = {}
+
+            def transform(raster_crs):
+                # (Layer -> Raster, Raster -> Layer), None wenn gleiches KBS
+                key = raster_crs.toWkt()
+                if key not in transforms:
+                    if raster_crs == source.sourceCrs():
+                        transforms[key] = (None, None)
+                    else:
+                        transforms[key] = (
+                            QgsCoordinateTransform(
+                                source.sourceCrs(),
+                                raster_crs,
+                                context.transformContext(),
+                            ),
+                            QgsCoordinateTransform(
+                                raster_crs,
+                                source.sourceCrs(),
+                                context.transformContext(),
+                            ),
+                        )
+                return transforms[key]
+
+            used_keys = set()
+
+            def assignPolygon(input_file, raster_geometry):
+                # (Zuordnung, Geometrie im KBS des Layers) bzw. None
+                if index is None:
+                    for key in keyCandidates(os.path.basename(input_file)):
+                        if key in geometries:
+                            used_keys.add(key)
+                            return key, QgsGeometry.collectGeometry(geometries[key])
+                    return None
+
+                with profiler.stage("Polygon räumlich zuordnen") as stage:
+                    engine = QgsGeometry.createGeometryEngine(
+                        raster_geometry.constGet()
+                    )
+                    engine.prepareGeometry()
+                    best = None
+                    candidates = index.intersects(raster_geometry.boundingBox())
+                    for feature_id in candidates:
+                        candidate = index.geometry(feature_id)
+                        if not engine.intersects(candidate.constGet()):
+                            continue
+                        area = engine.intersection(candidate.constGet()).area()
+                        if best is None or area > best[0]:
+                            best = (area, feature_id, candidate)
+                    stage.record(candidates=len(candidates))
+                if best is None or best[0] <= 0:
+                    return None
+                return "Feature " + str(best[1]), best[2]
+
+            report = []
+            assignments = {}
+            seconds = {}
+
+            def skip(input_file, status, message):
+                report.append((input_file, status, message))
+                if status == "Fehler":
+                    feedback.reportError(os.path.basename(input_file) + ": " + message)
+
+            def jobs():
+                # Zuordnung und Maske je Rasterplan, der Zuschnitt läuft ggf. in den
+                # Workern
+                used_names = set()
+                for input_file in input_files:
+                    if feedback.isCanceled():
+                        return
+                    try:
+                        with profiler.stage("Raster lesen"):
+                            grid = rasterGrid(input_file)
+                    except XPlanUmringError as e:
+                        skip(input_file, "Fehler", str(e))
+                        continue
+                    raster_crs = QgsCoordinateReferenceSystem.fromWkt(grid["crs_wkt"])
+                    if not raster_crs.isValid():
+                        skip(input_file, "Fehler", "Rasterplan ohne gültiges KBS")
+                        continue
+                    raster_extent = QgsRectangle(*grid["extent"])
+                    raster_geometry = QgsGeometry.fromRect(raster_extent)
+                    to_raster, to_layer = transform(raster_crs)
+
+                    try:
+                        if to_layer is not None:
+                            layer_extent = to_layer.transformBoundingBox(raster_extent)
+                        else:
+                            layer_extent = raster_extent
+                        assignment = assignPolygon(
+                            input_file, QgsGeometry.fromRect(layer_extent)
+                        )
+                        if assignment is None:
+                            skip(input_file, "Übersprungen", "Kein passendes Polygon")
+                            continue
+                        assignments[input_file] = assignment[0]
+                        feedback.pushInfo(
+                            os.path.basename(input_file)
+                            + ": "
+                            + ("Schlüssel '" if index is None else "")
+                            + assignment[0]
+                            + ("'" if index is None else "")
+                        )
+
+                        # Maske im KBS des Rasters, Kurven mit höchstens einem
+                        # halben Pixel Abweichung linearisiert
+                        with profiler.stage("Maske aufbereiten"):
+                            mask = linearizeMask(
+                                assignment[1],
+                                pixelTolerance(
+                                    grid["pixel_size"],
+                                    raster_crs,
+                                    raster_extent,
+                                    source.sourceCrs(),
+                                    context,
+                                ),
+                            )
+                            if to_raster is not None:
+                                mask.transform(to_raster)
+                    except QgsCsException as e:
+                        skip(
+                            input_file,
+                            "Fehler",
+                            "Transformation fehlgeschlagen: " + str(e),
+                        )
+                        continue
+
+                    if not mask.intersects(raster_geometry):
+                        skip(
+                            input_file,
+                            "Übersprungen",
+                            "Polygon außerhalb des Rasterplans",
+                        )
+                        continue
+                    if operation == "difference" and mask.contains(raster_geometry):
+                        skip(
+                            input_file,
+                            "Übersprungen",
+                            "Polygon überdeckt den ganzen Rasterplan",
+                        )
+                        continue
+
+                    # Gleiche Dateinamen mit verschiedenen Endungen durchnummerieren
+                    base_name = os.path.splitext(os.path.basename(input_file))[0]
+                    unique_name = base_name
+                    number = 1
+                    while (unique_name + ".tif").lower() in used_names:
+                        number += 1
+                        unique_name = base_name + "_" + str(number)
+                    used_names.add((unique_name + ".tif").lower())
+
+                    yield {
+                        "operation": operation,
+                        "input_file": input_file,
+                        "output_file": os.path.join(
+                            output_folder, unique_name + ".tif"
+                        ),
+                        "mask_wkb": bytes(mask.asWkb()),
+                        "no_data": no_data,
+                        "profile": profile,
+                        "block_size": block_size,
+                        "threads": threads,
+                        "warp_memory": warp_memory,
+                        "cache": cache,
+                    }
+
+            feedback.pushInfo(
+                "Rasterpläne werden mit "
+                + str(processes)
+                + " Prozessen zu je "
+                + str(threads)
+                + " Threads bearbeitet."
+            )
+
+            report_path = os.path.join(output_folder, "raster-zuschnitt-bericht.csv")
+
+            def writeReport():
+                with open(
+                    report_path, "w", encoding="UTF-8", newline=""
+                ) as report_file:
+                    writer = csv.writer(report_file, delimiter=";")
+                    writer.writerow(
+                        ("Datei", "Status", "Meldung", "Zuordnung", "Sekunden")
+                    )
+                    for entry in report:
+                        writer.writerow(
+                            entry
+                            + (
+                                assignments.get(entry[0], ""),
+                                (
+                                    format(seconds[entry[0]], ".2f")
+                                    if entry[0] in seconds
+                                    else ""
+                                ),
+                            )
+                        )
+
+            output_files = []
+            try:
+                for result in runJobs(clipRasterJob, jobs(), processes):
+                    seconds[result["input_file"]] = result["seconds"]
+                    if result["error"] is not None:
+                        skip(result["input_file"], "Fehler", result["error"])
+                    else:
+                        output_files.append(result["output_file"])
+                        report.append(
+                            (result["input_file"], done_status, result["output_file"])
+                        )
+                        feedback.pushInfo(
+                            done_status
+                            + ": "
+                            + result["output_file"]
+                            + " ("
+                            + format(result["seconds"], ".1f")
+                            + " s)"
+                        )
+                    if profiler.enabled:
+                        profiler.add(
+                            "Rasterplan bearbeiten", {"seconds": result["seconds"]}
+                        )
+                    feedback.setProgress(int(len(report) * 100 / len(input_files)))
+            except (OSError, RuntimeError, ValueError) as e:
+                # Bericht für die bereits bearbeiteten Rasterpläne behalten,
+                # ohne den eigentlichen Fehler zu verdecken
+                try:
+                    writeReport()
+                    feedback.pushInfo("Bericht gespeichert: " + report_path)
+                except OSError:
+                    pass
+                raise QgsProcessingException(
+                    "Bearbeitung der Rasterpläne fehlgeschlagen: " + str(e)
+                )
+
+            counts = {
+                status: sum(1 for entry in report if entry[1] == status)
+                for status in (done_status, "Übersprungen", "Fehler")
+            }
+            feedback.pushInfo(
+                done_status
+                + ": "
+                + str(counts[done_status])
+                + ", übersprungen: "
+                + str(counts["Übersprungen"])
+                + ", fehlgeschlagen: "
+                + str(counts["Fehler"])
+                + ", Laufzeit gesamt: "
+                + format(sum(seconds.values()), ".1f")
+                + " s"
+            )
+            unused_keys = sorted(set(geometries) - used_keys)
+            if unused_keys:
+                feedback.pushWarning(
+                    "Polygone ohne passenden Rasterplan: " + ", ".join(unused_keys)
+                )
+
+            writeReport()
+
+            profiler.finish(os.path.join(output_folder, "batch-raster-zuschnitt"))
+
+            return {
+                "Erzeugte Rasterpläne": output_files,
+                "Bericht": report_path,
+            }
@@ -0,0 +1,487 @@
+"""
+***************************************************************************
+XPlan-Umring - Batch-Geometrie-Update
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import csv
+import os
+
+from qgis.core import (
+    QgsExpression,
+    QgsGeometry,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterExpression,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterMultipleLayers,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterVectorLayer,
+)
+
+from .xplan_umring_algorithm_batch import expressionValueToString
+from .xplan_umring_algorithm_replace_geometry import MODE_OPTIONS
+from .xplan_umring_core import (
+    XPlanUmringError,
+    inspectXPlanGmlProbe,
+    probeXPlanGml,
+)
+from .xplan_umring_geometry import (
+    normalizeGeometry,
+    umringJobGeometry,
+    umringTransform,
+)
+from .xplan_umring_parallel import replaceGeometryJob, runJobs
+from .xplan_umring_profiling import Profiler
+from .xplan_umring_settings import loadUmringSettings
+
+# Abgleich des Schlüssels: (Anzeigename, Schlüssel im Ergebnis von inspectXPlanGmlFile)
+KEY_OPTIONS = [
+    ("Nummer (xplan:nummer)", "nummer"),
+    ("Name (xplan:name)", "name"),
+]
+
+XPLAN_FILE_EXTENSIONS = (".gml", ".zip")
+
+
+def xplanFiles(folder, recursive=False):
+    """
+    XPlanGML-Dateien und XPlan-Archive eines Ordners (mit recursive auch aus
+    allen Unterordnern).
+    """
+    if recursive:
+        return sorted(
+            os.path.join(directory, file_name)
+            for directory, _, file_names in os.walk(folder)
+            for file_name in file_names
+            if file_name.lower().endswith(XPLAN_FILE_EXTENSIONS)
+        )
+    return sorted(
+        os.path.join(folder, file_name)
+        for file_name in os.listdir(folder)
+        if file_name.lower().endswith(XPLAN_FILE_EXTENSIONS)
+        and os.path.isfile(os.path.join(folder, file_name))
+    )
+
+
+class XPlanUmringAlgorithmBatchReplaceGeometry(QgsProcessingAlgorithm):
+    def __init__(self, settings=None):
+        super().__init__()
+        self.settings = settings if settings is not None else loadUmringSettings()
+
+    def createInstance(self):
+        return XPlanUmringAlgorithmBatchReplaceGeometry(self.settings)
+
+    def name(self):
+        return "batchreplacegeometry"
+
+    def displayName(self):
+        return "Batch-Geometrie-Update"
+
+    def group(self):
+        return self.groupId()
+
+    def groupId(self):
+        return ""
+
+    def shortHelpString(self):
+        return (
+            "Umringgeometrie (räumlichen Geltungsbereich) vieler XPlanGML bzw. XPlan-Archive in einem Lauf ersetzen (alle anderen Attribute bleiben erhalten)."
+            + "\n\n"
+            + "Eingabe ist ein Ordner und/oder eine Liste von XPlanGML (*.gml) bzw. XPlan-Archiven (*.zip) sowie ein Polygonlayer mit einem Schlüssel je Plan. Der Schlüssel wird mit der Nummer oder dem Namen des Plans (xplan:nummer bzw. xplan:name) verglichen; Features mit gleichem Schlüssel werden zu einem Umring zusammengefasst."
+            + "\n\n"
+            + "Die aktualisierten Dateien werden unter gleichem Namen in den Ausgabeordner geschrieben. Dateien ohne passendes Feature werden übersprungen. Eine Übersicht über aktualisierte, übersprungene und fehlerhafte Dateien (mit XPlanung-Version, Plankategorie, Anzahl Bereiche und KBS) wird als geometrie-update-bericht.csv im Ausgabeordner gespeichert."
+            + "\n\n"
+            + "Optional wird die Ausdehnung (boundedBy) aller übrigen Objekte neu berechnet (nicht im Modus Nur Geometrie austauschen)."
+            + "\n\n"
+            + "Es werden nur XPlan-GML mit maximal einem *_Bereich unterstützt."
+            + "\n\n"
+            + "Autor: Kreis Viersen"
+            + "\n\n"
+            + "Kontakt: open@kreis-viersen.de"
+            + "\n\n"
+            + "GitHub: https://github.com/kreis-viersen/xplan-umring"
+        )
+
+    def shortDescription(self):
+        return "Umringgeometrie vieler XPlanGML bzw. XPlan-Archive ersetzen."
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                "Umring",
+                "Vektorlayer mit Umringpolygonen [Pflicht]",
+                optional=False,
+                types=[QgsProcessing.SourceType.TypeVectorPolygon],
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExpression(
+                "Schluessel",
+                "Schlüssel (Feld oder Ausdruck) [Pflicht]",
+                parentLayerParameterName="Umring",
+                optional=False,
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "Abgleich",
+                "Schlüssel vergleichen mit",
+                options=[option[0] for option in KEY_OPTIONS],
+                optional=False,
+                allowMultiple=False,
+                defaultValue=0,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                "Eingabeordner",
+                "Ordner mit XPlanGML bzw. XPlan-Archiven",
+                behavior=QgsProcessingParameterFile.Behavior.Folder,
+                optional=True,
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                "Eingabedateien",
+                "Einzelne XPlanGML bzw. XPlan-Archive",
+                layerType=QgsProcessing.SourceType.TypeFile,
+                optional=True,
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "modus",
+                "Verarbeitung",
+                options=[mode[0] for mode in MODE_OPTIONS],
+                optional=False,
+                allowMultiple=False,
+                defaultValue=0,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                "Ausdehnung",
+                "Ausdehnung (boundedBy) aller Objekte neu berechnen",
+                optional=True,
+                defaultValue=False,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                "Prozesse",
+                "Anzahl paralleler Prozesse",
+                optional=False,
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=1,
+                maxValue=os.cpu_count() or 1,
+                defaultValue=1,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                name="Ausgabeordner",
+                description="Speicherpfad für aktualisierte Dateien [Pflicht]",
+                behavior=QgsProcessingParameterFile.Behavior.Folder,
+                fileFilter="Alle Dateien (*.*)",
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        with Profiler(self.settings["profiling"], feedback) as profiler:
+            source = self.parameterAsSource(parameters, "Umring", context)
+            if source is None:
+                raise QgsProcessingException(
+                    self.invalidSourceError(parameters, "Umring")
+                )
+
+            key_attribute = KEY_OPTIONS[
+                self.parameterAsEnum(parameters, "Abgleich", context)
+            ][1]
+            mode = MODE_OPTIONS[self.parameterAsEnum(parameters, "modus", context)][1]
+            update_envelopes = self.parameterAsBool(parameters, "Ausdehnung", context)
+            if update_envelopes and mode == "splice":
+                raise QgsProcessingException(
+                    "Beim Austausch nur der Geometrie kann die Ausdehnung (boundedBy) der übrigen Objekte nicht neu berechnet werden, bitte anderen Modus wählen."
+                )
+            processes = self.parameterAsInt(parameters, "Prozesse", context)
+            output_folder = self.parameterAsString(parameters, "Ausgabeordner", context)
+
+            input_files = []
+            input_folder = self.parameterAsString(parameters, "Eingabeordner", context)
+            if input_folder:
+                if os.path.normcase(os.path.abspath(input_folder)) == os.path.normcase(
+                    os.path.abspath(output_folder)
+                ):
+                    raise QgsProcessingException(
+                        "Eingabe- und Ausgabeordner müssen verschieden sein."
+                    )
+                input_files.extend(xplanFiles(input_folder))
+            for input_file in self.parameterAsFileList(
+                parameters, "Eingabedateien", context
+            ):
+                if input_file not in input_files:
+                    input_files.append(input_file)
+            if not input_files:
+                raise QgsProcessingException(
+                    "Keine XPlanGML bzw. XPlan-Archive angegeben, bitte Eingabe überprüfen."
+                )
+
+            # Umringe einmalig je Schlüssel einlesen
+            expression_context = self.createExpressionContext(
+                parameters, context, source
+            )
+            expression = QgsExpression(
+                self.parameterAsExpression(parameters, "Schluessel", context)
+            )
+            if expression.hasParserError():
+                raise QgsProcessingException(
+                    "Ungültiger Ausdruck für Schluessel: "
+                    + expression.parserErrorString()
+                )
+            expression.prepare(expression_context)
+
+            geometries = {}
+            with profiler.stage("Features lesen und gruppieren") as stage:
+                for feature in source.getFeatures():
+                    if feedback.isCanceled():
+                        break
+                    geometry = feature.geometry()
+                    if geometry.isNull() or geometry.isEmpty():
+                        continue
+                    expression_context.setFeature(feature)
+                    key = expressionValueToString(
+                        expression.evaluate(expression_context)
+                    )
+                    if key == "":
+                        feedback.pushWarning(
+                            "Feature "
+                            + str(feature.id())
+                            + " ohne Schlüssel übersprungen."
+                        )
+                        continue
+                    geometries.setdefault(key, []).append(geometry)
+                stage.record(keys=len(geometries))
+
+            if not geometries:
+                raise QgsProcessingException(
+                    "Der Eingabelayer enthält keine Umringgeometrie, bitte Eingabe überprüfen."
+                )
+
+            # Aufbereitete Umringe je Schlüssel und KBS, damit mehrere Pläne im
+            # gleichen KBS nur einmal transformiert werden
+            umrings = {}
+            transforms = {}
+
+            def umring(key, kbs):
+                if (key, kbs) not in umrings:
+                    if kbs not in transforms:
+                        transforms[kbs] = umringTransform(
+                            source.sourceCrs(), kbs, context
+                        )
+                    geometry = normalizeGeometry(
+                        QgsGeometry.collectGeometry(geometries[key]),
+                        kbs,
+                        transforms[kbs],
+                        profiler,
+                    )
+                    bbox = geometry.boundingBox()
+                    with profiler.stage("Geometrie aufbereiten"):
+                        polygons, gml = umringJobGeometry(geometry, kbs)
+                    umrings[(key, kbs)] = (
+                        polygons,
+                        gml,
+                        str(bbox.xMinimum()) + " " + str(bbox.yMinimum()),
+                        str(bbox.xMaximum()) + " " + str(bbox.yMaximum()),
+                    )
+                return umrings[(key, kbs)]
+
+            report = []
+            probes = {}
+            used_keys = set()
+
+            def jobs():
+                # XPlanGML werden hier nur bis zum Plan gelesen (KBS, Schlüssel
+                # und Übersicht für den Bericht), das eigentliche Update läuft
+                # ggf. in den Workern
+                used_names = set()
+                for input_file in input_files:
+                    if feedback.isCanceled():
+                        return
+                    try:
+                        with profiler.stage("XPlanGML prüfen"):
+                            probes[input_file] = probeXPlanGml(input_file)
+                        info = inspectXPlanGmlProbe(probes[input_file])
+                    except XPlanUmringError as e:
+                        report.append((input_file, "Fehler", str(e)))
+                        feedback.reportError(
+                            os.path.basename(input_file) + ": " + str(e)
+                        )
+                        continue
+
+                    key = info[key_attribute]
+                    if key not in geometries:
+                        report.append(
+                            (
+                                input_file,
+                                "Übersprungen",
+                                "Kein Umring mit Schlüssel '" + key + "'",
+                            )
+                        )
+                        continue
+                    used_keys.add(key)
+
+                    try:
+                        polygons, gml, lower_corner, upper_corner = umring(
+                            key, info["kbs"]
+                        )
+                    except QgsProcessingException as e:
+                        report.append((input_file, "Fehler", str(e)))
+                        feedback.reportError(
+                            os.path.basename(input_file) + ": " + str(e)
+                        )
+                        continue
+
+                    # Gleiche Dateinamen aus verschiedenen Ordnern durchnummerieren
+                    base_name, extension = os.path.splitext(
+                        os.path.basename(input_file)
+                    )
+                    unique_name = base_name
+                    number = 1
+                    while (unique_name + extension).lower() in used_names:
+                        number += 1
+                        unique_name = base_name + "_" + str(number)
+                    used_names.add((unique_name + extension).lower())
+                    output_file = os.path.join(output_folder, unique_name + extension)
+                    if os.path.exists(output_file) and os.path.samefile(
+                        output_file, input_file
+                    ):
+                        report.append(
+                            (
+                                input_file,
+                                "Fehler",
+                                "Ausgabe würde die Eingabe überschreiben",
+                            )
+                        )
+                        continue
+
+                    yield {
+                        "input_file": input_file,
+                        "output_file": output_file,
+                        "polygons": polygons,
+                        "gml": gml,
+                        "lower_corner": lower_corner,
+                        "upper_corner": upper_corner,
+                        "mode": mode,
+                        "update_envelopes": update_envelopes,
+                    }
+
+            if processes > 1:
+                feedback.pushInfo(
+                    "Geometrie-Update wird mit "
+                    + str(processes)
+                    + " Prozessen ausgeführt."
+                )
+
+            output_files = []
+            try:
+                for result in runJobs(replaceGeometryJob, jobs(), processes):
+                    if result["error"] is not None:
+                        report.append((result["input_file"], "Fehler", result["error"]))
+                        feedback.reportError(
+                            os.path.basename(result["input_file"])
+                            + ": "
+                            + result["error"]
+                        )
+                    else:
+                        output_files.append(result["output_file"])
+                        report.append(
+                            (
+                                result["input_file"],
+                                "Aktualisiert",
+                                result["output_file"],
+                            )
+                        )
+                        feedback.pushInfo("Aktualisiert: " + result["output_file"])
+                    if profiler.enabled:
+                        profiler.add("Geometrie-Update", {"seconds": result["seconds"]})
+                    feedback.setProgress(int(len(report) * 100 / len(input_files)))
+            except (OSError, RuntimeError, ValueError) as e:
+                raise QgsProcessingException(
+                    "Geometrie-Update fehlgeschlagen: " + str(e)
+                )
+
+            counts = {
+                status: sum(1 for entry in report if entry[1] == status)
+                for status in ("Aktualisiert", "Übersprungen", "Fehler")
+            }
+            feedback.pushInfo(
+                "Aktualisiert: "
+                + str(counts["Aktualisiert"])
+                + ", übersprungen: "
+                + str(counts["Übersprungen"])
+                + ", fehlgeschlagen: "
+                + str(counts["Fehler"])
+            )
+            unused_keys = sorted(set(geometries) - used_keys)
+            if unused_keys:
+                feedback.pushWarning(
+                    "Umringe ohne passende XPlanGML: " + ", ".join(unused_keys)
+                )
+
+            report_path = os.path.join(output_folder, "geometrie-update-bericht.csv")
+            with open(report_path, "w", encoding="UTF-8", newline="") as report_file:
+                writer = csv.writer(report_file, delimiter=";")
+                writer.writerow(
+                    (
+                        "Datei",
+                        "Status",
+                        "Meldung",
+                        "XPlanung-Version",
+                        "Plankategorie",
+                        "Anzahl Bereiche",
+                        "KBS",
+                    )
+                )
+                for entry in report:
+                    probe = probes.get(entry[0])
+                    if probe is None:
+                        writer.writerow(entry)
+                        continue
+                    writer.writerow(
+                        entry
+                        + (
+                            probe["xplan_version"],
+                            probe["plan_category"],
+                            probe["bereich_count"],
+                            probe["srs_name"] or "",
+                        )
+                    )
+
+            profiler.finish(os.path.join(output_folder, "batch-geometrie-update"))
+
+            return {
+                "Aktualisierte Dateien": output_files,
+                "Bericht": report_path,
+            }
@@ -18,23 +18,50 @@ XPlan-Umring - Clip Raster
 ***************************************************************************
 """
 
+import os
+import time
+
 import processing
 
 from qgis.core import (
     QgsProcessing,
     QgsProcessingAlgorithm,
+    QgsProcessingException,
     QgsProcessingFeedback,
     QgsProcessingMultiStepFeedback,
     QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterNumber,
     QgsProcessingParameterVectorLayer,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterRasterDestination,
+    QgsProcessingUtils,
+)
+
+from .xplan_umring_core import XPlanUmringError
+from .xplan_umring_geometry import maskTolerance, rasterMask
+from .xplan_umring_profiling import Profiler
+from .xplan_umring_raster import (
+    BLOCK_SIZES,
+    OUTPUT_PROFILES,
+    creationOptions,
+    rasterProperties,
+    warpArguments,
+    warpDefaults,
+    warpSummary,
+    writeOutputProfile,
 )
+from .xplan_umring_settings import loadUmringSettings
 
 
 class XPlanUmringAlgorithmClipRaster(QgsProcessingAlgorithm):
+    def __init__(self, settings=None):
+        super().__init__()
+        self.settings = settings if settings is not None else loadUmringSettings()
+
     def createInstance(self):
-        return XPlanUmringAlgorithmClipRaster()
+        return XPlanUmringAlgorithmClipRaster(self.settings)
 
     def flags(self):
         return super().flags() | QgsProcessingAlgorithm.Flag.FlagNoThreading
@@ -70,6 +97,10 @@ class XPlanUmringAlgorithmClipRaster(QgsProcessingAlgorithm):
             + "\n\n"
             + "Dazu den Speicherort und Name für den erzeugten Rasterplan festlegen."
             + "\n\n"
+            + "Als Ausgabeprofil kann neben einfachem GeoTIFF ein gekacheltes GeoTIFF mit Predictor und internen Übersichten oder ein Cloud Optimized GeoTIFF (COG) gewählt werden, die sich deutlich schneller anzeigen lassen. Die Kachelgröße kann unter Erweiterte Parameter angepasst werden."
+            + "\n\n"
+            + "GDAL arbeitet mit mehreren Threads. Anzahl der Threads, Warp-Speicher und GDAL-Cache sind nach der Anzahl der Prozessorkerne voreingestellt und können unter Erweiterte Parameter angepasst werden."
+            + "\n\n"
             + "Autor: Kreis Viersen"
             + "\n\n"
             + "Kontakt: open@kreis-viersen.de"
@@ -102,6 +133,52 @@ class XPlanUmringAlgorithmClipRaster(QgsProcessingAlgorithm):
                 defaultValue=False,
             )
         )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "ausgabeprofil",
+                "Ausgabeprofil",
+                options=[profile[0] for profile in OUTPUT_PROFILES],
+                optional=False,
+                allowMultiple=False,
+                defaultValue=0,
+            )
+        )
+        defaults = warpDefaults()
+        for parameter in (
+            QgsProcessingParameterEnum(
+                "blockgroesse",
+                "Kachelgröße (Pixel)",
+                options=BLOCK_SIZES,
+                allowMultiple=False,
+                usesStaticStrings=True,
+                defaultValue="512",
+            ),
+            QgsProcessingParameterNumber(
+                "threads",
+                "Anzahl Threads (GDAL)",
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=1,
+                defaultValue=defaults["threads"],
+            ),
+            QgsProcessingParameterNumber(
+                "warp_speicher",
+                "Warp-Speicher (MB)",
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=16,
+                defaultValue=defaults["warp_memory"],
+            ),
+            QgsProcessingParameterNumber(
+                "gdal_cachemax",
+                "GDAL-Cache (GDAL_CACHEMAX, MB)",
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=16,
+                defaultValue=defaults["cache"],
+            ),
+        ):
+            parameter.setFlags(
+                parameter.flags() | QgsProcessingParameterDefinition.Flag.FlagAdvanced
+            )
+            self.addParameter(parameter)
         self.addParameter(
             QgsProcessingParameterRasterDestination(
                 "ErzeugterRasterplan",
@@ -114,80 +191,142 @@ class XPlanUmringAlgorithmClipRaster(QgsProcessingAlgorithm):
     feedback = QgsProcessingFeedback()
 
     def processAlgorithm(self, parameters, context, feedback):
-        feedback = QgsProcessingMultiStepFeedback(2, feedback)
-        results = {}
-        outputs = {}
-
-        no_data = self.parameterAsBool(parameters, "no_data", context)
-
-        palett_index = None
-        if no_data:
-            palett_index = 0
-
-        # Zu erhaltende Felder
-        alg_params = {
-            "FIELDS": [""],
-            "INPUT": parameters["polygon_zum_zuschneiden_vektor"],
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["ZuErhaltendeFelder"] = processing.run(
-            "native:retainfields",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
+        with Profiler(self.settings["profiling"], feedback) as profiler:
+            feedback = QgsProcessingMultiStepFeedback(2, feedback)
+            results = {}
+            outputs = {}
 
-        feedback.setCurrentStep(1)
-        if feedback.isCanceled():
-            return {}
-
-        # Durch maximalen Abstand segmentieren
-        alg_params = {
-            "DISTANCE": 0.01,
-            "INPUT": outputs["ZuErhaltendeFelder"]["OUTPUT"],
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["DurchMaximalenAbstandSegmentieren"] = processing.run(
-            "native:segmentizebymaxdistance",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
+            no_data = self.parameterAsBool(parameters, "no_data", context)
+            threads = self.parameterAsInt(parameters, "threads", context)
+            warp_memory = self.parameterAsInt(parameters, "warp_speicher", context)
+            cache = self.parameterAsInt(parameters, "gdal_cachemax", context)
+            profile_name, profile = OUTPUT_PROFILES[
+                self.parameterAsEnum(parameters, "ausgabeprofil", context)
+            ]
+            block_size = int(
+                self.parameterAsString(parameters, "blockgroesse", context)
+            )
+            output = self.parameterAsOutputLayer(
+                parameters, "ErzeugterRasterplan", context
+            )
 
-        feedback.setCurrentStep(2)
-        if feedback.isCanceled():
-            return {}
-
-        # Raster auf Layermaske zuschneiden
-        alg_params = {
-            "ALPHA_BAND": False,
-            "CROP_TO_CUTLINE": True,
-            "DATA_TYPE": 0,  # Eingabelayerdatentyp verwenden
-            "EXTRA": "",
-            "INPUT": parameters["alter_plan_raster"],
-            "KEEP_RESOLUTION": False,
-            "MASK": outputs["DurchMaximalenAbstandSegmentieren"]["OUTPUT"],
-            "MULTITHREADING": False,
-            "NODATA": palett_index,
-            "OPTIONS": "COMPRESS=DEFLATE",
-            "SET_RESOLUTION": False,
-            "SOURCE_CRS": None,
-            "TARGET_CRS": None,
-            "TARGET_EXTENT": None,
-            "X_RESOLUTION": None,
-            "Y_RESOLUTION": None,
-            "OUTPUT": parameters["ErzeugterRasterplan"],
-        }
-        outputs["RasterAufLayermaskeZuschneiden"] = processing.run(
-            "gdal:cliprasterbymasklayer",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
-        results["ErzeugterRasterplan"] = outputs["RasterAufLayermaskeZuschneiden"][
-            "OUTPUT"
-        ]
-        return results
+            palett_index = None
+            if no_data:
+                palett_index = 0
+
+            # Maske: nur Kurven linearisieren, Abweichung höchstens ein halbes Pixel
+            raster_layer = self.parameterAsRasterLayer(
+                parameters, "alter_plan_raster", context
+            )
+            source = self.parameterAsSource(
+                parameters, "polygon_zum_zuschneiden_vektor", context
+            )
+            if source is None:
+                raise QgsProcessingException(
+                    self.invalidSourceError(
+                        parameters, "polygon_zum_zuschneiden_vektor"
+                    )
+                )
+            mask, vertices_before, vertices_after = rasterMask(
+                source,
+                maskTolerance(raster_layer, source.sourceCrs(), context),
+                feedback,
+                profiler,
+            )
+            if mask.featureCount() == 0:
+                raise QgsProcessingException(
+                    "Der Vektorlayer enthält kein Polygon, bitte Eingabe überprüfen."
+                )
+            feedback.pushInfo(
+                "Stützpunkte der Maske: "
+                + str(vertices_before)
+                + " vorher, "
+                + str(vertices_after)
+                + " nachher"
+            )
+
+            feedback.setCurrentStep(1)
+            if feedback.isCanceled():
+                return {}
+
+            # Gekachelt bzw. als COG nur für GeoTIFF, COG über ein gekacheltes
+            # Zwischenergebnis
+            properties = None
+            warp_output = output
+            if profile != "standard":
+                if os.path.splitext(output)[1].lower() not in (".tif", ".tiff"):
+                    raise QgsProcessingException(
+                        "Das Ausgabeprofil "
+                        + profile_name
+                        + " ist nur für GeoTIFF (*.tif) möglich."
+                    )
+                try:
+                    properties = rasterProperties(raster_layer.source())
+                except XPlanUmringError as e:
+                    raise QgsProcessingException(str(e))
+                if profile == "cog":
+                    warp_output = QgsProcessingUtils.generateTempFilename(
+                        "zuschnitt.tif"
+                    )
+
+            # Raster auf Layermaske zuschneiden
+            alg_params = {
+                "ALPHA_BAND": False,
+                "CROP_TO_CUTLINE": True,
+                "DATA_TYPE": 0,  # Eingabelayerdatentyp verwenden
+                "EXTRA": warpArguments(threads, warp_memory, cache),
+                "INPUT": parameters["alter_plan_raster"],
+                "KEEP_RESOLUTION": False,
+                "MASK": mask,
+                "MULTITHREADING": True,
+                "NODATA": palett_index,
+                "OPTIONS": creationOptions(
+                    threads,
+                    profile,
+                    block_size,
+                    None if properties is None else properties["predictor"],
+                ),
+                "SET_RESOLUTION": False,
+                "SOURCE_CRS": None,
+                "TARGET_CRS": None,
+                "TARGET_EXTENT": None,
+                "X_RESOLUTION": None,
+                "Y_RESOLUTION": None,
+                "OUTPUT": warp_output,
+            }
+            with profiler.stage("gdal:cliprasterbymasklayer") as stage:
+                start = time.perf_counter()
+                outputs["RasterAufLayermaskeZuschneiden"] = processing.run(
+                    "gdal:cliprasterbymasklayer",
+                    alg_params,
+                    context=context,
+                    feedback=feedback,
+                    is_child_algorithm=True,
+                )
+                stage.record(threads=threads)
+            feedback.pushInfo(
+                warpSummary(
+                    time.perf_counter() - start,
+                    threads,
+                    warp_memory,
+                    cache,
+                )
+            )
+
+            if profile != "standard":
+                with profiler.stage("Ausgabeprofil " + profile):
+                    try:
+                        writeOutputProfile(
+                            profile,
+                            warp_output,
+                            output,
+                            properties,
+                            threads,
+                            block_size,
+                        )
+                    except XPlanUmringError as e:
+                        raise QgsProcessingException(str(e))
+
+            results["ErzeugterRasterplan"] = output
+            profiler.finish(results["ErzeugterRasterplan"])
+            return results
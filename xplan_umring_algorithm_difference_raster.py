@@ -18,23 +18,43 @@ XPlan-Umring - Difference Raster
 ***************************************************************************
 """
 
-import processing
+import os
+import time
 
 from qgis.core import (
     QgsProcessing,
     QgsProcessingAlgorithm,
+    QgsProcessingException,
     QgsProcessingFeedback,
     QgsProcessingMultiStepFeedback,
     QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterNumber,
     QgsProcessingParameterVectorLayer,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterRasterDestination,
 )
 
+from .xplan_umring_core import XPlanUmringError
+from .xplan_umring_geometry import maskTolerance, rasterMaskWkb
+from .xplan_umring_profiling import Profiler
+from .xplan_umring_raster import (
+    BLOCK_SIZES,
+    OUTPUT_PROFILES,
+    subtractMask,
+    warpDefaults,
+)
+from .xplan_umring_settings import loadUmringSettings
+
 
 class XPlanUmringAlgorithmDifferenceRaster(QgsProcessingAlgorithm):
+    def __init__(self, settings=None):
+        super().__init__()
+        self.settings = settings if settings is not None else loadUmringSettings()
+
     def createInstance(self):
-        return XPlanUmringAlgorithmDifferenceRaster()
+        return XPlanUmringAlgorithmDifferenceRaster(self.settings)
 
     def flags(self):
         return super().flags() | QgsProcessingAlgorithm.Flag.FlagNoThreading
@@ -70,6 +90,12 @@ class XPlanUmringAlgorithmDifferenceRaster(QgsProcessingAlgorithm):
             + "\n\n"
             + "Dazu den Speicherort und Name für den erzeugten Rasterplan festlegen."
             + "\n\n"
+            + "Als Ausgabeprofil kann neben einfachem GeoTIFF ein gekacheltes GeoTIFF mit Predictor und internen Übersichten oder ein Cloud Optimized GeoTIFF (COG) gewählt werden, die sich deutlich schneller anzeigen lassen. Die Kachelgröße kann unter Erweiterte Parameter angepasst werden."
+            + "\n\n"
+            + "Das Polygon wird im Pixelraster des Rasterplans streifenweise in eine Maske im Speicher umgerechnet, die Pixel darin erhalten den Leerwert. Ausdehnung und Pixelraster des Rasterplans bleiben erhalten. Der Rasterplan wird als GeoTIFF (*.tif) gespeichert."
+            + "\n\n"
+            + "Die Kompression arbeitet mit mehreren Threads. Anzahl der Threads und GDAL-Cache sind nach der Anzahl der Prozessorkerne voreingestellt und können unter Erweiterte Parameter angepasst werden."
+            + "\n\n"
             + "Autor: Kreis Viersen"
             + "\n\n"
             + "Kontakt: open@kreis-viersen.de"
@@ -103,6 +129,45 @@ class XPlanUmringAlgorithmDifferenceRaster(QgsProcessingAlgorithm):
                 defaultValue=False,
             )
         )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "ausgabeprofil",
+                "Ausgabeprofil",
+                options=[profile[0] for profile in OUTPUT_PROFILES],
+                optional=False,
+                allowMultiple=False,
+                defaultValue=0,
+            )
+        )
+        defaults = warpDefaults()
+        for parameter in (
+            QgsProcessingParameterEnum(
+                "blockgroesse",
+                "Kachelgröße (Pixel)",
+                options=BLOCK_SIZES,
+                allowMultiple=False,
+                usesStaticStrings=True,
+                defaultValue="512",
+            ),
+            QgsProcessingParameterNumber(
+                "threads",
+                "Anzahl Threads (GDAL)",
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=1,
+                defaultValue=defaults["threads"],
+            ),
+            QgsProcessingParameterNumber(
+                "gdal_cachemax",
+                "GDAL-Cache (GDAL_CACHEMAX, MB)",
+                type=QgsProcessingParameterNumber.Type.Integer,
+                minValue=16,
+                defaultValue=defaults["cache"],
+            ),
+        ):
+            parameter.setFlags(
+                parameter.flags() | QgsProcessingParameterDefinition.Flag.FlagAdvanced
+            )
+            self.addParameter(parameter)
         self.addParameter(
             QgsProcessingParameterRasterDestination(
                 "ErzeugterRasterplan",
@@ -115,116 +180,100 @@ class XPlanUmringAlgorithmDifferenceRaster(QgsProcessingAlgorithm):
     feedback = QgsProcessingFeedback()
 
     def processAlgorithm(self, parameters, context, feedback):
-        feedback = QgsProcessingMultiStepFeedback(4, feedback)
-        results = {}
-        outputs = {}
-
-        no_data = self.parameterAsBool(parameters, "no_data", context)
-
-        palett_index = None
-        if no_data:
-            palett_index = 0
-
-        # Layer aus Ausdehnung erzeugen
-        alg_params = {
-            "INPUT": parameters["alter_plan_raster"],
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["LayerAusAusdehnungErzeugen"] = processing.run(
-            "native:extenttolayer",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
+        with Profiler(self.settings["profiling"], feedback) as profiler:
+            feedback = QgsProcessingMultiStepFeedback(2, feedback)
+            results = {}
 
-        feedback.setCurrentStep(1)
-        if feedback.isCanceled():
-            return {}
-        
-        # Zu erhaltende Felder
-        alg_params = {
-            "FIELDS": [""],
-            "INPUT": parameters["polygon_zum_abziehen"],
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["ZuErhaltendeFelder"] = processing.run(
-            "native:retainfields",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
+            no_data = self.parameterAsBool(parameters, "no_data", context)
+            threads = self.parameterAsInt(parameters, "threads", context)
+            cache = self.parameterAsInt(parameters, "gdal_cachemax", context)
+            profile = OUTPUT_PROFILES[
+                self.parameterAsEnum(parameters, "ausgabeprofil", context)
+            ][1]
+            block_size = int(
+                self.parameterAsString(parameters, "blockgroesse", context)
+            )
+            output = self.parameterAsOutputLayer(
+                parameters, "ErzeugterRasterplan", context
+            )
+            if os.path.splitext(output)[1].lower() not in (".tif", ".tiff"):
+                raise QgsProcessingException(
+                    "Der Rasterplan kann nur als GeoTIFF (*.tif) gespeichert werden."
+                )
 
-        feedback.setCurrentStep(2)
-        if feedback.isCanceled():
-            return {}
-
-        # Durch maximalen Abstand segmentieren
-        alg_params = {
-            "DISTANCE": 0.01,
-            "INPUT": outputs["ZuErhaltendeFelder"]["OUTPUT"],
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["DurchMaximalenAbstandSegmentieren"] = processing.run(
-            "native:segmentizebymaxdistance",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
+            palett_index = None
+            if no_data:
+                palett_index = 0
 
-        feedback.setCurrentStep(3)
-        if feedback.isCanceled():
-            return {}
-
-        # Differenz
-        alg_params = {
-            "GRID_SIZE": None,
-            "INPUT": outputs["LayerAusAusdehnungErzeugen"]["OUTPUT"],
-            "OVERLAY": outputs["DurchMaximalenAbstandSegmentieren"]["OUTPUT"],
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["Differenz"] = processing.run(
-            "native:difference",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
+            # Maske im KBS des Rasters: nur Kurven linearisieren, Abweichung
+            # höchstens ein halbes Pixel
+            raster_layer = self.parameterAsRasterLayer(
+                parameters, "alter_plan_raster", context
+            )
+            source = self.parameterAsSource(parameters, "polygon_zum_abziehen", context)
+            if source is None:
+                raise QgsProcessingException(
+                    self.invalidSourceError(parameters, "polygon_zum_abziehen")
+                )
+            mask_wkb, vertices_before, vertices_after = rasterMaskWkb(
+                source,
+                raster_layer.crs(),
+                maskTolerance(raster_layer, source.sourceCrs(), context),
+                context,
+                feedback,
+                profiler,
+            )
+            if mask_wkb is None:
+                raise QgsProcessingException(
+                    "Der Vektorlayer enthält kein Polygon, bitte Eingabe überprüfen."
+                )
+            feedback.pushInfo(
+                "Stützpunkte der Maske: "
+                + str(vertices_before)
+                + " vorher, "
+                + str(vertices_after)
+                + " nachher"
+            )
 
-        feedback.setCurrentStep(4)
-        if feedback.isCanceled():
-            return {}
-
-        # Raster auf Layermaske zuschneiden
-        alg_params = {
-            "ALPHA_BAND": False,
-            "CROP_TO_CUTLINE": True,
-            "DATA_TYPE": 0,  # Eingabelayerdatentyp verwenden
-            "EXTRA": "",
-            "INPUT": parameters["alter_plan_raster"],
-            "KEEP_RESOLUTION": False,
-            "MASK": outputs["Differenz"]["OUTPUT"],
-            "MULTITHREADING": False,
-            "NODATA": palett_index,
-            "OPTIONS": "COMPRESS=DEFLATE",
-            "SET_RESOLUTION": False,
-            "SOURCE_CRS": None,
-            "TARGET_CRS": None,
-            "TARGET_EXTENT": None,
-            "X_RESOLUTION": None,
-            "Y_RESOLUTION": None,
-            "OUTPUT": parameters["ErzeugterRasterplan"],
-        }
-        outputs["RasterAufLayermaskeZuschneiden"] = processing.run(
-            "gdal:cliprasterbymasklayer",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
-        results["ErzeugterRasterplan"] = outputs[
-            "RasterAufLayermaskeZuschneiden"
-        ]["OUTPUT"]
-        return results
+            feedback.setCurrentStep(1)
+            if feedback.isCanceled():
+                return {}
+
+            # Maske im Pixelraster des Rasters anwenden, ohne Vektordifferenz
+            # und ohne gdalwarp
+            def progress(fraction):
+                feedback.setProgress(fraction * 100)
+                return not feedback.isCanceled()
+
+            with profiler.stage("Maske anwenden") as stage:
+                start = time.perf_counter()
+                try:
+                    strips = subtractMask(
+                        raster_layer.source(),
+                        output,
+                        mask_wkb,
+                        no_data=palett_index,
+                        profile=profile,
+                        block_size=block_size,
+                        threads=threads,
+                        cache=cache,
+                        progress=progress,
+                    )
+                except XPlanUmringError as e:
+                    raise QgsProcessingException(str(e))
+                if strips is None:
+                    return {}
+                stage.record(strips=strips[0], masked_strips=strips[1])
+            feedback.pushInfo(
+                "Maske angewendet: "
+                + format(time.perf_counter() - start, ".1f")
+                + " s, "
+                + str(strips[1])
+                + " von "
+                + str(strips[0])
+                + " Streifen mit Maske"
+            )
+
+            results["ErzeugterRasterplan"] = output
+            profiler.finish(results["ErzeugterRasterplan"])
+            return results
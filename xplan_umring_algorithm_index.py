@@ -0,0 +1,188 @@
+"""
+***************************************************************************
+XPlan-Umring - XPlan-Index
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+from qgis.core import (
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterFileDestination,
+)
+
+from .xplan_umring_algorithm_batch_replace_geometry import xplanFiles
+from .xplan_umring_core import XPlanUmringError
+from .xplan_umring_index import INDEX_LAYER, updateIndex
+from .xplan_umring_profiling import Profiler
+from .xplan_umring_settings import loadUmringSettings
+
+
+class XPlanUmringAlgorithmIndex(QgsProcessingAlgorithm):
+    def __init__(self, settings=None):
+        super().__init__()
+        self.settings = settings if settings is not None else loadUmringSettings()
+
+    def createInstance(self):
+        return XPlanUmringAlgorithmIndex(self.settings)
+
+    def name(self):
+        return "xplanindex"
+
+    def displayName(self):
+        return "XPlan-Index"
+
+    def group(self):
+        return self.groupId()
+
+    def groupId(self):
+        return ""
+
+    def shortHelpString(self):
+        return (
+            "Räumlichen Index aller XPlanGML (*.gml) und XPlan-Archive (*.zip) eines Ordners inkl. Unterordnern als GeoPackage erstellen bzw. aktualisieren."
+            + "\n\n"
+            + "Je Plan werden Plankategorie, XPlanung-Version, Name, Nummer, Rechtsstand, Datumsangaben, AGS, Gemeindename, KBS und der räumliche Geltungsbereich (im KBS des Index) gespeichert. Der Index hat einen R-Baum und kann wie jeder andere Layer in QGIS abgefragt werden, z.B. welche Pläne ein Flurstück überdecken."
+            + "\n\n"
+            + "Beim erneuten Ausführen mit demselben GeoPackage werden nur neue und geänderte Dateien (Pfad, Größe, Änderungszeit) gelesen, Einträge nicht mehr vorhandener Dateien werden entfernt. Das KBS eines vorhandenen Index bleibt unverändert."
+            + "\n\n"
+            + "Dateien, die nicht gelesen werden können, werden ohne Geometrie mit der Fehlermeldung im Feld fehler eingetragen."
+            + "\n\n"
+            + "Autor: Kreis Viersen"
+            + "\n\n"
+            + "Kontakt: open@kreis-viersen.de"
+            + "\n\n"
+            + "GitHub: https://github.com/kreis-viersen/xplan-umring"
+        )
+
+    def shortDescription(self):
+        return "Räumlichen Index von XPlanGML bzw. XPlan-Archiven als GeoPackage erstellen."
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterFile(
+                "Eingabeordner",
+                "Ordner mit XPlanGML bzw. XPlan-Archiven (inkl. Unterordner) [Pflicht]",
+                behavior=QgsProcessingParameterFile.Behavior.Folder,
+                optional=False,
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "Koordinatenbezugssystem",
+                "Koordinatenbezugssystem (KBS) des Index",
+                options=[
+                    "EPSG:25831",
+                    "EPSG:25832",
+                    "EPSG:25833",
+                    "EPSG:5649",
+                    "EPSG:4647",
+                    "EPSG:5650",
+                    "EPSG:5651",
+                    "EPSG:5652",
+                    "EPSG:5653",
+                    "EPSG:31466",
+                    "EPSG:31467",
+                    "EPSG:31468",
+                    "EPSG:31469",
+                ],
+                optional=False,
+                allowMultiple=False,
+                usesStaticStrings=True,
+                defaultValue="EPSG:25832",
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                name="Index",
+                description="GeoPackage für den Index (vorhandener Index wird aktualisiert) [Pflicht]",
+                fileFilter="GeoPackage (*.gpkg *.GPKG)",
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        with Profiler(self.settings["profiling"], feedback) as profiler:
+            input_folder = self.parameterAsString(parameters, "Eingabeordner", context)
+            kbs = self.parameterAsString(parameters, "Koordinatenbezugssystem", context)
+            index_path = self.parameterAsFileOutput(parameters, "Index", context)
+
+            with profiler.stage("Dateien suchen") as stage:
+                input_files = xplanFiles(input_folder, recursive=True)
+                stage.record(files=len(input_files))
+            feedback.pushInfo(str(len(input_files)) + " Dateien gefunden.")
+
+            counts = {
+                status: 0
+                for status in (
+                    "Neu",
+                    "Aktualisiert",
+                    "Unverändert",
+                    "Entfernt",
+                    "Fehler",
+                )
+            }
+            try:
+                with profiler.stage("Index aktualisieren") as stage:
+                    results = updateIndex(index_path, input_files, kbs)
+                    try:
+                        for path, status, message in results:
+                            counts[status] += 1
+                            if status == "Fehler":
+                                feedback.pushWarning(path + ": " + message)
+                            elif status != "Unverändert":
+                                feedback.pushInfo(status + ": " + path)
+                            if input_files:
+                                feedback.setProgress(
+                                    min(
+                                        sum(counts.values()) * 100 / len(input_files),
+                                        100,
+                                    )
+                                )
+                            if feedback.isCanceled():
+                                break
+                    finally:
+                        results.close()
+                    stage.record(**{status.lower(): n for status, n in counts.items()})
+            except XPlanUmringError as e:
+                raise QgsProcessingException(str(e))
+
+            feedback.pushInfo(
+                "Neu: "
+                + str(counts["Neu"])
+                + ", aktualisiert: "
+                + str(counts["Aktualisiert"])
+                + ", unverändert: "
+                + str(counts["Unverändert"])
+                + ", entfernt: "
+                + str(counts["Entfernt"])
+                + ", fehlerhaft: "
+                + str(counts["Fehler"])
+            )
+
+            profiler.finish(index_path)
+
+            context.addLayerToLoadOnCompletion(
+                index_path + "|layername=" + INDEX_LAYER,
+                QgsProcessingContext.LayerDetails(
+                    "XPlan-Index", context.project(), "Index"
+                ),
+            )
+
+            return {"Index": index_path}
@@ -18,30 +18,73 @@ XPlan-Umring - Replace Geometry
 ***************************************************************************
 """
 
-import processing
-import uuid
-
-from lxml import etree
-
 from qgis.core import (
-    QgsFeatureRequest,
+    Qgis,
+    QgsCoordinateReferenceSystem,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
     QgsProcessing,
     QgsProcessingAlgorithm,
     QgsProcessingException,
     QgsProcessingFeedback,
-    QgsCoordinateReferenceSystem,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFeatureSink,
     QgsProcessingParameterFile,
     QgsProcessingParameterFileDestination,
     QgsProcessingParameterVectorLayer,
-    QgsProcessingUtils,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QMetaType, QVariant
+
+from .xplan_umring_core import (
+    XPlanUmringError,
+    inspectXPlanGmlFile,
+    readGeltungsbereich,
+    replaceGeometry,
+)
+from .xplan_umring_geometry import (
+    geometryFromGml,
+    normalizeUmring,
+    umringChanges,
+    umringJobGeometry,
 )
+from .xplan_umring_profiling import Profiler
+from .xplan_umring_settings import loadUmringSettings
 
-from qgis.PyQt.QtXml import QDomDocument
+MODE_OPTIONS = [
+    ("Gesamte XPlanGML einlesen", "tree"),
+    ("Streaming (für sehr große XPlanGML)", "stream"),
+    ("Nur Geometrie austauschen (Formatierung bleibt erhalten)", "splice"),
+]
+
+XPLAN_FILE_FILTER = "GML-Dateien (*.gml *.GML);;XPlan-Archive (*.zip *.ZIP)"
+
+
+def changeFields():
+    """
+    Felder des Layers mit den Änderungen des Geltungsbereichs.
+    """
+    # QgsField mit QMetaType erst ab QGIS 3.38 (und unter Qt6 nur so)
+    if Qgis.QGIS_VERSION_INT >= 33800:
+        string_type, double_type = QMetaType.Type.QString, QMetaType.Type.Double
+    else:
+        string_type, double_type = QVariant.String, QVariant.Double
+    fields = QgsFields()
+    fields.append(QgsField("aenderung", string_type))
+    fields.append(QgsField("flaeche", double_type))
+    return fields
 
 
 class XPlanUmringAlgorithmReplaceGeometry(QgsProcessingAlgorithm):
+    def __init__(self, settings=None):
+        super().__init__()
+        self.settings = settings if settings is not None else loadUmringSettings()
+
     def createInstance(self):
-        return XPlanUmringAlgorithmReplaceGeometry()
+        return XPlanUmringAlgorithmReplaceGeometry(self.settings)
 
     def flags(self):
         return super().flags() | QgsProcessingAlgorithm.Flag.FlagNoThreading
@@ -72,6 +115,16 @@ class XPlanUmringAlgorithmReplaceGeometry(QgsProcessingAlgorithm):
             + "\n\n"
             + "Es werden nur XPlan-GML mit maximal einem *_Bereich unterstützt."
             + "\n\n"
+            + "Für sehr große vollvektorielle Pläne den Modus Streaming wählen, die XPlanGML wird dann featureMember für featureMember verarbeitet und nicht vollständig in den Speicher geladen."
+            + "\n\n"
+            + "Im Modus Nur Geometrie austauschen werden nur Geltungsbereich und boundedBy ersetzt, der Rest der Datei wird Byte für Byte kopiert (am schnellsten, Formatierung bleibt erhalten)."
+            + "\n\n"
+            + "Optional kann die Ausdehnung (boundedBy) aller übrigen Objekte der XPlanGML aus deren Geometrien neu berechnet werden, z.B. wenn die Objekte selbst bearbeitet wurden. Nicht möglich im Modus Nur Geometrie austauschen."
+            + "\n\n"
+            + "Optional werden bisheriger und neuer Geltungsbereich verglichen: hinzugekommene und entfernte Fläche, Hausdorff-Distanz und Anzahl der Stützpunkte werden ausgegeben, die hinzugekommenen und entfernten Flächen (symmetrische Differenz) als Layer gespeichert."
+            + "\n\n"
+            + "Eingabe und Ausgabe können auch XPlan-Archive (.zip) sein. Die xplan.gml wird dann direkt aus dem Archiv gelesen bzw. in das Archiv geschrieben, alle weiteren Dateien des Archivs (Rasterpläne, PDF, ...) werden unverändert übernommen."
+            + "\n\n"
             + "Autor: Kreis Viersen"
             + "\n\n"
             + "Kontakt: open@kreis-viersen.de"
@@ -95,17 +148,44 @@ class XPlanUmringAlgorithmReplaceGeometry(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterFile(
                 "eingabeXplanGml",
-                "XPlanGML bei welcher die Umring-Geometrie(en) ersetzt werden sollen",
+                "XPlanGML bzw. XPlan-Archiv bei welcher die Umring-Geometrie(en) ersetzt werden sollen",
                 behavior=QgsProcessingParameterFile.Behavior.File,
-                fileFilter="GML-Dateien (*.gml *.GML)",
+                fileFilter=XPLAN_FILE_FILTER,
                 defaultValue=None,
             )
         )
         self.addParameter(
             QgsProcessingParameterFileDestination(
                 name="speicherpfad",
-                description="Speicherpfad für erzeugte XPlanGML",
-                fileFilter="GML-Dateien (*.gml *.GML)",
+                description="Speicherpfad für erzeugte XPlanGML bzw. XPlan-Archiv",
+                fileFilter=XPLAN_FILE_FILTER,
+                createByDefault=False,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                "modus",
+                "Verarbeitung",
+                options=[mode[0] for mode in MODE_OPTIONS],
+                optional=False,
+                allowMultiple=False,
+                defaultValue=0,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                "Ausdehnung",
+                "Ausdehnung (boundedBy) aller Objekte neu berechnen",
+                optional=True,
+                defaultValue=False,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                "Aenderungen",
+                "Änderungen gegenüber dem bisherigen Geltungsbereich",
+                type=QgsProcessing.SourceType.TypeVectorPolygon,
+                optional=True,
                 createByDefault=False,
             )
         )
@@ -115,318 +195,118 @@ class XPlanUmringAlgorithmReplaceGeometry(QgsProcessingAlgorithm):
     def processAlgorithm(self, parameters, context, feedback):
         input_file = self.parameterAsString(parameters, "eingabeXplanGml", context)
         output_file = self.parameterAsString(parameters, "speicherpfad", context)
+        mode = MODE_OPTIONS[self.parameterAsEnum(parameters, "modus", context)][1]
+        update_envelopes = self.parameterAsBool(parameters, "Ausdehnung", context)
 
-        try:
-            tree = etree.parse(input_file)
-        except:
-            raise QgsProcessingException(
-                'Datei: "'
-                + input_file
-                + '" konnte nicht gelesen werden, bitte Datei überprüfen.'
+        with Profiler(self.settings["profiling"], feedback) as profiler:
+            try:
+                with profiler.stage("XPlanGML prüfen"):
+                    info = inspectXPlanGmlFile(input_file, feedback.pushInfo)
+            except XPlanUmringError as e:
+                raise QgsProcessingException(str(e))
+
+            kbs = info["kbs"]
+            umring = self.parameterAsSource(parameters, "Umring", context)
+            geometry = normalizeUmring(umring, kbs, context, feedback, profiler)
+            if geometry is None:
+                return {}
+
+            bbox = geometry.boundingBox()
+            lower_corner = str(bbox.xMinimum()) + " " + str(bbox.yMinimum())
+            upper_corner = str(bbox.xMaximum()) + " " + str(bbox.yMaximum())
+
+            sink, changes_id = self.parameterAsSink(
+                parameters,
+                "Aenderungen",
+                context,
+                changeFields(),
+                QgsWkbTypes.Type.MultiPolygon,
+                QgsCoordinateReferenceSystem(kbs),
             )
+            if sink is not None:
+                self.reportChanges(input_file, geometry, sink, feedback, profiler)
 
-        gml_root = tree.getroot()
+            with profiler.stage("Geometrie aufbereiten"):
+                polygons, gml = umringJobGeometry(geometry, kbs)
 
-        try:
-            xplan_ns_uri = gml_root.nsmap["xplan"]
-        except:
             try:
-                xplan_ns_uri = gml_root.nsmap[None]
-            except:
-                raise QgsProcessingException(
-                    'Datei: "'
-                    + input_file
-                    + '": XPlanung-Namespace konnte nicht gefunden werden, bitte Datei überprüfen.'
+                replaceGeometry(
+                    input_file,
+                    output_file,
+                    polygons,
+                    gml=gml,
+                    profiler=profiler,
+                    mode=mode,
+                    lower_corner=lower_corner,
+                    upper_corner=upper_corner,
+                    update_envelopes=update_envelopes,
                 )
+            except XPlanUmringError as e:
+                raise QgsProcessingException(str(e))
 
-        xplan_version = xplan_ns_uri.split("http://www.xplanung.de/xplangml/")[
-            1
-        ].replace("/", ".")
-        feedback.pushInfo("XPlanung Version: " + xplan_version)
-
-        plan_category = None
-        plan_category_short = None
-        plan_element = None
-        bereich_element = None
-        raeumlicherGeltungsbereich_element = None
-        kbs = None
-
-        plan_element_found = False
-        for elem in ("BP_Plan", "FP_Plan", "LP_Plan", "RP_Plan", "SO_Plan"):
-            try:
-                plan_element = next(gml_root.iter("{" + xplan_ns_uri + "}" + elem))
-                if plan_element.tag:
-                    plan_category = elem
-                    plan_category_short = plan_category.split("_")[0]
-                    feedback.pushInfo("Plankategorie: " + plan_category)
-                    plan_element_found = True
-                    break
-            except StopIteration:
-                continue
+            profiler.finish(output_file)
 
-        if not plan_element_found:
-            raise QgsProcessingException(
-                "Kein *_Plan gefunden, dies wird nicht unterstützt!"
-            )
+            results = {"XPlanGML mit neuem Geltungsbereich wurde erstellt": output_file}
+            if sink is not None:
+                results["Aenderungen"] = changes_id
+            return results
 
-        bereich_count = 0
+    def reportChanges(self, input_file, geometry, sink, feedback, profiler):
+        """
+        Bisherigen Geltungsbereich der Eingabe mit geometry vergleichen, das
+        Ergebnis ausgeben und die geänderten Flächen in sink schreiben.
+        """
         try:
-            for bereich_element in gml_root.iter(
-                "{" + xplan_ns_uri + "}" + plan_category_short + "_Bereich"
-            ):
-                bereich_count += 1
-        except:
-            raise QgsProcessingException(
-                "Fehler beim ermitteln der Anzahl von "
-                + plan_category_short
-                + "_Bereich"
-            )
+            with profiler.stage("Bisherigen Geltungsbereich lesen") as stage:
+                old_element = readGeltungsbereich(input_file)
+                if old_element is None:
+                    raise XPlanUmringError(
+                        "Bisheriger Geltungsbereich konnte nicht gelesen werden."
+                    )
+                old_geometry = geometryFromGml(old_element)
+                stage.record(vertices=old_geometry.constGet().nCoordinates())
+        except XPlanUmringError as e:
+            raise QgsProcessingException(str(e))
+
+        changes = umringChanges(old_geometry, geometry, profiler)
 
         feedback.pushInfo(
-            "Anzahl " + plan_category_short + "_Bereich: " + str(bereich_count)
+            "Fläche bisher: "
+            + format(changes["old_area"], ".2f")
+            + " m², neu: "
+            + format(changes["new_area"], ".2f")
+            + " m²"
         )
-        if bereich_count > 1:
-            raise QgsProcessingException(
-                "Mehr als 1 Bereich gefunden, dies wird nicht unterstützt!"
-            )
-
-        try:
-            raeumlicherGeltungsbereich_element = next(
-                plan_element.iter("{" + xplan_ns_uri + "}raeumlicherGeltungsbereich")
-            )
-            if len(raeumlicherGeltungsbereich_element.text) > 0:
-                pass
-        except:
-            raise QgsProcessingException(
-                elem
-                + " hat keinen räumlichen Geltungsbereich, dies wird nicht unterstützt!"
-            )
-
-        try:
-            first_element = next(
-                raeumlicherGeltungsbereich_element.iter(
-                    "{http://www.opengis.net/gml/3.2}*"
-                )
-            )
-            kbs = first_element.attrib["srsName"]
-            feedback.pushInfo("KBS der Eingabe-XPlanGML: " + kbs)
-        except:
-            raise QgsProcessingException(
-                "Der räumliche Geltungsbereich von "
-                + plan_category
-                + "hat kein srsName-Attribut, dies wird nicht unterstützt!"
-            )
-
-        outputs = {}
-
-        # Zu erhaltende Felder
-        alg_params = {
-            "FIELDS": [""],
-            "INPUT": parameters["Umring"],
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["ZuErhaltendeFelder"] = processing.run(
-            "native:retainfields",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
-
-        # Mehr- zu einteilig
-        alg_params = {
-            "INPUT": outputs["ZuErhaltendeFelder"]["OUTPUT"],
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["GeometrienSammeln"] = processing.run(
-            "native:collect",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
-
-        # Layer reprojizieren in KBS der Eingabe XPlan-GML
-        alg_params = {
-            "INPUT": outputs["GeometrienSammeln"]["OUTPUT"],
-            "OPERATION": "",
-            "TARGET_CRS": QgsCoordinateReferenceSystem(kbs),
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["LayerReprojizierenInKbs"] = processing.run(
-            "native:reprojectlayer",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
-
-        # Geometrie nach Ausdruck force_polygon_ccw
-        alg_params = {
-            "EXPRESSION": "force_polygon_ccw( $geometry)",
-            "INPUT": outputs["LayerReprojizierenInKbs"]["OUTPUT"],
-            "OUTPUT_GEOMETRY": 0,  # Polygon
-            "WITH_M": False,
-            "WITH_Z": False,
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["GeometrieNachAusdruck"] = processing.run(
-            "native:geometrybyexpression",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
-
-        # Doppelte Stützpunkte entfernen
-        alg_params = {
-            "INPUT": outputs["GeometrieNachAusdruck"]["OUTPUT"],
-            "TOLERANCE": 1e-06,
-            "USE_Z_VALUE": False,
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["DoppelteSttzpunkteEntfernen"] = processing.run(
-            "native:removeduplicatevertices",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
-
-        # Z/M-Werte fallenlassen
-        alg_params = {
-            "INPUT": outputs["DoppelteSttzpunkteEntfernen"]["OUTPUT"],
-            "DROP_M_VALUES": True,
-            "DROP_Z_VALUES": True,
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        outputs["ZmwerteFallenlassen"] = processing.run(
-            "native:dropmzvalues",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )
-
-        vlayer = QgsProcessingUtils.mapLayerFromString(
-            outputs["ZmwerteFallenlassen"]["OUTPUT"], context
+        feedback.pushInfo(
+            "Hinzugekommene Fläche: "
+            + format(changes["added_area"], ".2f")
+            + " m², entfernte Fläche: "
+            + format(changes["removed_area"], ".2f")
+            + " m²"
         )
-
-        request = QgsFeatureRequest()
-        request.setLimit(1)
-        for feature in vlayer.getFeatures(request):
-            doc = QDomDocument()
-            gml_geometry = feature.geometry().constGet().asGml3(doc, 6)
-            doc.appendChild(gml_geometry)
-            gml_geometry_string = (
-                doc.toString(2)
-                .replace("<", "<gml:")
-                .replace("<gml:/", "</gml:")
-                .replace('xmlns="gml"', 'xmlns:gml="http://www.opengis.net/gml/3.2"')
-            )
-
-            bbox = feature.geometry().boundingBox()
-            lower_corner = str(bbox.xMinimum()) + " " + str(bbox.yMinimum())
-            upper_corner = str(bbox.xMaximum()) + " " + str(bbox.yMaximum())
-
-        def updateBoundedBy():
-            for envelope_element in boundedby_element.iter(
-                "{http://www.opengis.net/gml/3.2}Envelope"
-            ):
-                envelope_element.attrib["srsName"] = kbs
-            for lowerCorner_element in boundedby_element.iter(
-                "{http://www.opengis.net/gml/3.2}lowerCorner"
-            ):
-                lowerCorner_element.text = lower_corner
-
-            for upperCorner_element in boundedby_element.iter(
-                "{http://www.opengis.net/gml/3.2}upperCorner"
-            ):
-                upperCorner_element.text = upper_corner
-
-        try:
-            for boundedby_element in gml_root.iterchildren(
-                "{http://www.opengis.net/gml/3.2}boundedBy"
-            ):
-                updateBoundedBy()
-        except:
-            raise QgsProcessingException("Fehler beim Update des boundedBy-Elements!")
-
-        try:
-            for boundedby_element in plan_element.iterchildren(
-                "{http://www.opengis.net/gml/3.2}boundedBy"
-            ):
-                updateBoundedBy()
-        except:
-            raise QgsProcessingException(
-                "Fehler beim Update des boundedBy-Elements von " + plan_category + " !"
-            )
-
-        new_geltungsbereich_element = etree.Element(
-            "{" + xplan_ns_uri + "}raeumlicherGeltungsbereich"
+        feedback.pushInfo(
+            "Hausdorff-Distanz: " + format(changes["hausdorff"], ".3f") + " m"
         )
-
-        new_geltungsbereich_element.append(etree.fromstring(gml_geometry_string))
-
-        for MultiSurface_element in new_geltungsbereich_element.iter(
-            "{http://www.opengis.net/gml/3.2}MultiSurface"
-        ):
-            MultiSurface_element.attrib["{http://www.opengis.net/gml/3.2}id"] = (
-                "ID_" + str(uuid.uuid4())
-            )
-            MultiSurface_element.attrib["srsName"] = kbs
-
-        for polygon_element in new_geltungsbereich_element.iter(
-            "{http://www.opengis.net/gml/3.2}Polygon"
-        ):
-            polygon_element.attrib["{http://www.opengis.net/gml/3.2}id"] = "ID_" + str(
-                uuid.uuid4()
-            )
-            polygon_element.attrib["srsName"] = kbs
-
-        for linestring_element in new_geltungsbereich_element.iter(
-            "{http://www.opengis.net/gml/3.2}LineString"
-        ):
-            linestring_element.attrib["{http://www.opengis.net/gml/3.2}id"] = (
-                "ID_" + str(uuid.uuid4())
-            )
-            linestring_element.attrib["srsName"] = kbs
-
-        for curve_element in new_geltungsbereich_element.iter(
-            "{http://www.opengis.net/gml/3.2}Curve"
-        ):
-            curve_element.attrib["{http://www.opengis.net/gml/3.2}id"] = "ID_" + str(
-                uuid.uuid4()
-            )
-            curve_element.attrib["srsName"] = kbs
-
-        raeumlicherGeltungsbereich_element.getparent().replace(
-            raeumlicherGeltungsbereich_element, new_geltungsbereich_element
+        feedback.pushInfo(
+            "Stützpunkte bisher: "
+            + str(changes["old_vertices"])
+            + ", neu: "
+            + str(changes["new_vertices"])
+            + " ("
+            + format(changes["new_vertices"] - changes["old_vertices"], "+d")
+            + ")"
         )
 
-        try:
-            geltungsbereich_element_bereich = next(
-                bereich_element.iter("{" + xplan_ns_uri + "}geltungsbereich")
-            )
-            geltungsbereich_element_bereich.getparent().remove(
-                geltungsbereich_element_bereich
-            )
-        except:
-            pass
-        try:
-            boundedby_element_bereich = next(
-                bereich_element.iterchildren(
-                    "{http://www.opengis.net/gml/3.2}boundedBy"
-                )
+        for change, key in (("hinzugefügt", "added"), ("entfernt", "removed")):
+            changed_geometry = changes[key]
+            if changed_geometry.isEmpty():
+                continue
+            # Randfälle der Verschneidung liefern GeometryCollections
+            changed_geometry.convertGeometryCollectionToSubclass(
+                QgsWkbTypes.GeometryType.PolygonGeometry
             )
-            boundedby_element_bereich.getparent().remove(boundedby_element_bereich)
-        except:
-            pass
-
-        etree.indent(gml_root, space="\t", level=0)
-
-        etree.ElementTree(gml_root).write(
-            output_file, encoding="UTF-8", xml_declaration=True
-        )
-
-        return {"XPlanGML mit neuem Geltungsbereich wurde erstellt": output_file}
+            changed_geometry.convertToMultiType()
+            feature = QgsFeature(sink.fields())
+            feature.setGeometry(changed_geometry)
+            feature.setAttributes([change, changes[key + "_area"]])
+            sink.addFeature(feature, QgsFeatureSink.Flag.FastInsert)
@@ -0,0 +1,1875 @@
+"""
+***************************************************************************
+XPlan-Umring - Core
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Erzeugung und Geometrie-Update von XPlanGML ohne QGIS.
+
+Die Umringgeometrie wird als polygons (Liste von Polygonen, je Polygon eine
+Liste flacher Ringkoordinaten x0 y0 x1 y1 ..., erster Ring = Außenring), als
+2D-(Multi-)Polygon-WKB oder als fertiges GML (lxml-Element oder Bytes, z.B.
+für Kurvengeometrien) übergeben. Sie muss bereits im Ziel-KBS vorliegen.
+"""
+
+import contextlib
+import io
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+from .xplan_umring_gml import (
+    GML_NS,
+    coordinateBounds,
+    gmlTag,
+    multiSurfaceElement,
+    polygonsFromWkb,
+    writeMultiSurface,
+)
+from .xplan_umring_profiling import NO_PROFILER
+from .xplan_umring_templates import buildPlan
+from .xplan_umring_writer import (
+    archiveName,
+    elementWriter,
+    writeXPlanArchive,
+    writeXPlanGml,
+)
+
+PLAN_CATEGORIES = ("BP_Plan", "FP_Plan", "LP_Plan", "RP_Plan", "SO_Plan")
+
+# Datumsangaben der Pläne für readPlanSummary(), vgl. DATUM_ELEMENTS in
+# xplan_umring_templates (nicht jede Plankategorie hat jedes Datum)
+PLAN_DATE_FIELDS = (
+    "aufstellungsbeschlussDatum",
+    "aenderungenBisDatum",
+    "entwurfsbeschlussDatum",
+    "satzungsbeschlussDatum",
+    "inkrafttretensDatum",
+    "inkrafttretenDatum",
+    "wirksamkeitsDatum",
+    "untergangsDatum",
+    "technHerstellDatum",
+)
+
+# Geometrie-Update: ganze Datei als Baum ("tree"), in einem Durchlauf je
+# featureMember ("stream") oder nur die geänderten Byte-Bereiche ("splice")
+REPLACE_MODES = ("tree", "stream", "splice")
+
+# Parser-Optionen für alle eingelesenen XPlanGML: sehr lange Textknoten
+# (posList) zulassen, keine Entities auflösen und nichts nachladen
+XPLAN_PARSER_OPTIONS = {
+    "huge_tree": True,
+    "resolve_entities": False,
+    "no_network": True,
+    "load_dtd": False,
+}
+
+_parsers = threading.local()
+
+_XMLNS_DECLARATION = re.compile(rb' xmlns(?::([^=\s]+))?="([^"]*)"')
+_XMLNS_DECLARATIONS = re.compile(rb'<[^\s/>]+(?: xmlns(?::[^=\s]+)?="[^"]*")*')
+
+
+class XPlanUmringError(Exception):
+    """
+    Fehler bei der Verarbeitung einer XPlanGML; die Meldung ist für die
+    Anzeige im Processing-Protokoll gedacht.
+    """
+
+
+def _polygons(polygons=None, wkb=None):
+    if polygons is None and wkb is not None:
+        try:
+            return polygonsFromWkb(wkb)
+        except ValueError as e:
+            raise XPlanUmringError(str(e))
+    return polygons
+
+
+def xplanParser(remove_blank_text=True):
+    """
+    XMLParser mit XPLAN_PARSER_OPTIONS für etree.parse() bzw.
+    etree.fromstring().
+
+    Der Parser wird je Thread einmal erzeugt und für alle weiteren Dateien
+    (z.B. in einem Batch-Lauf) wiederverwendet. Mit remove_blank_text wird
+    Leerraum zwischen Elementen verworfen, das spart Speicher, wenn die
+    Ausgabe ohnehin neu eingerückt wird.
+    """
+    parser = getattr(_parsers, str(remove_blank_text), None)
+    if parser is None:
+        parser = etree.XMLParser(
+            remove_blank_text=remove_blank_text, **XPLAN_PARSER_OPTIONS
+        )
+        setattr(_parsers, str(remove_blank_text), parser)
+    return parser
+
+
+def iterparseXPlanGml(source, remove_blank_text=False):
+    """
+    etree.iterparse() mit XPLAN_PARSER_OPTIONS ("start"- und "end"-Ereignisse).
+    """
+    return etree.iterparse(
+        source,
+        events=("start", "end"),
+        remove_blank_text=remove_blank_text,
+        **XPLAN_PARSER_OPTIONS,
+    )
+
+
+def _gmlElement(gml):
+    if isinstance(gml, (bytes, str)):
+        return etree.fromstring(gml, xplanParser())
+    return gml
+
+
+def envelopeCorners(polygons):
+    """
+    lowerCorner und upperCorner der Ringkoordinaten als Zeichenketten.
+    """
+    xs = []
+    ys = []
+    for rings in polygons:
+        exterior = rings[0]
+        xs.append(min(exterior[0::2]))
+        xs.append(max(exterior[0::2]))
+        ys.append(min(exterior[1::2]))
+        ys.append(max(exterior[1::2]))
+
+    lower_corner = str(float(min(xs))) + " " + str(float(min(ys)))
+    upper_corner = str(float(max(xs))) + " " + str(float(max(ys)))
+    return lower_corner, upper_corner
+
+
+def geometryWriter(kbs, polygons=None, wkb=None, gml=None):
+    """
+    Schreibfunktion für writeXPlanGml()/writeXPlanArchive(), welche die
+    Umringgeometrie direkt in den Ausgabestrom schreibt.
+    """
+    polygons = _polygons(polygons, wkb)
+    if polygons is not None:
+        return lambda xf, level: writeMultiSurface(xf, polygons, kbs, level)
+    if gml is None:
+        raise XPlanUmringError("Keine Umringgeometrie übergeben.")
+    return elementWriter(_gmlElement(gml))
+
+
+def _corners(polygons, lower_corner=None, upper_corner=None):
+    if lower_corner is not None and upper_corner is not None:
+        return lower_corner, upper_corner
+    if polygons is None:
+        raise XPlanUmringError(
+            "Für GML-Geometrien müssen lower_corner und upper_corner angegeben werden."
+        )
+    return envelopeCorners(polygons)
+
+
+def archivePath(output_folder, name):
+    """
+    Pfad des XPlan-Archivs für einen Plannamen.
+    """
+    return os.path.join(output_folder, archiveName(name) + ".zip")
+
+
+def _planWithEnvelope(plan_type, attributes, polygons):
+    attributes = dict(attributes)
+    if not attributes.get("lower_corner") or not attributes.get("upper_corner"):
+        attributes["lower_corner"], attributes["upper_corner"] = _corners(polygons)
+    try:
+        return buildPlan(plan_type, attributes)
+    except KeyError:
+        raise XPlanUmringError("Unbekannter Plantyp: " + str(plan_type))
+
+
+def createXPlanArchive(
+    plan_type,
+    attributes,
+    target,
+    polygons=None,
+    wkb=None,
+    gml=None,
+    profiler=NO_PROFILER,
+):
+    """
+    XPlan-Archiv (Zip mit xplan.gml) für einen Plan schreiben.
+
+    plan_type ist "bp54", "bp60", "fp60" oder "lp60", attributes die
+    Planattribute wie bei buildPlan() (mindestens "name" und "kbs").
+    target ist ein Dateipfad oder ein beschreibbares Dateiobjekt (z.B.
+    io.BytesIO, um das Archiv im Speicher zu erhalten).
+    """
+    with profiler.stage("Plan befüllen"):
+        polygons = _polygons(polygons, wkb)
+        root, raeumlicherGeltungsbereich_element = _planWithEnvelope(
+            plan_type, attributes, polygons
+        )
+    with profiler.stage("XPlan-Archiv schreiben") as stage:
+        gml_size = writeXPlanArchive(
+            target,
+            root,
+            raeumlicherGeltungsbereich_element,
+            geometryWriter(attributes["kbs"], polygons, gml=gml),
+        )
+        stage.record(gml_bytes=gml_size)
+        if isinstance(target, (str, os.PathLike)):
+            stage.record(bytes_written=os.path.getsize(target))
+    return target
+
+
+def createXPlanGml(
+    plan_type,
+    attributes,
+    target,
+    polygons=None,
+    wkb=None,
+    gml=None,
+    profiler=NO_PROFILER,
+):
+    """
+    Wie createXPlanArchive(), schreibt aber nur die XPlanGML ohne Zip.
+    """
+    with profiler.stage("Plan befüllen"):
+        polygons = _polygons(polygons, wkb)
+        root, raeumlicherGeltungsbereich_element = _planWithEnvelope(
+            plan_type, attributes, polygons
+        )
+    with profiler.stage("XPlanGML schreiben") as stage:
+        writeXPlanGml(
+            target,
+            root,
+            raeumlicherGeltungsbereich_element,
+            geometryWriter(attributes["kbs"], polygons, gml=gml),
+        )
+        if isinstance(target, (str, os.PathLike)):
+            stage.record(bytes_written=os.path.getsize(target))
+    return target
+
+
+def _noLog(message):
+    pass
+
+
+def _xplanNamespace(nsmap, log):
+    xplan_ns_uri = nsmap.get("xplan", nsmap.get(None))
+    if xplan_ns_uri is None or "http://www.xplanung.de/xplangml/" not in xplan_ns_uri:
+        raise XPlanUmringError(
+            "XPlanung-Namespace konnte nicht gefunden werden, bitte Datei überprüfen."
+        )
+
+    xplan_version = xplan_ns_uri.split("http://www.xplanung.de/xplangml/")[1].replace(
+        "/", "."
+    )
+    log("XPlanung Version: " + xplan_version)
+    return xplan_ns_uri, xplan_version
+
+
+def _geltungsbereichInfo(plan_element, plan_category, xplan_ns_uri, log):
+    raeumlicherGeltungsbereich_element = next(
+        plan_element.iter("{" + xplan_ns_uri + "}raeumlicherGeltungsbereich"), None
+    )
+    if raeumlicherGeltungsbereich_element is None:
+        raise XPlanUmringError(
+            plan_category
+            + " hat keinen räumlichen Geltungsbereich, dies wird nicht unterstützt!"
+        )
+
+    first_element = next(
+        raeumlicherGeltungsbereich_element.iter("{" + GML_NS + "}*"), None
+    )
+    if first_element is None or "srsName" not in first_element.attrib:
+        raise XPlanUmringError(
+            "Der räumliche Geltungsbereich von "
+            + plan_category
+            + " hat kein srsName-Attribut, dies wird nicht unterstützt!"
+        )
+    kbs = first_element.attrib["srsName"]
+    log("KBS der Eingabe-XPlanGML: " + kbs)
+    return raeumlicherGeltungsbereich_element, kbs
+
+
+def _planText(plan_element, xplan_ns_uri, name):
+    element = plan_element.find("{" + xplan_ns_uri + "}" + name)
+    if element is None or element.text is None:
+        return ""
+    return element.text.strip()
+
+
+def inspectXPlanGml(gml_root, log=None):
+    """
+    Plan, Bereich, räumlichen Geltungsbereich und KBS einer XPlanGML
+    ermitteln, die nur einen *_Bereich haben darf.
+
+    log(message) wird für Informationen wie Version und Plankategorie
+    aufgerufen. Rückgabe ist ein dict mit den gefundenen Elementen.
+    """
+    if log is None:
+        log = _noLog
+
+    xplan_ns_uri, xplan_version = _xplanNamespace(gml_root.nsmap, log)
+
+    # Pläne und Bereiche aller Plankategorien in einem Durchlauf sammeln
+    plan_tags = {"{" + xplan_ns_uri + "}" + elem: elem for elem in PLAN_CATEGORIES}
+    bereich_tags = {
+        "{" + xplan_ns_uri + "}" + elem.split("_")[0] + "_Bereich": elem
+        for elem in PLAN_CATEGORIES
+    }
+    plans = {}
+    bereiche = {}
+    for element in gml_root.iter(*plan_tags, *bereich_tags):
+        if element.tag in plan_tags:
+            plans.setdefault(plan_tags[element.tag], element)
+        else:
+            bereiche.setdefault(bereich_tags[element.tag], []).append(element)
+
+    plan_category = next((elem for elem in PLAN_CATEGORIES if elem in plans), None)
+    if plan_category is None:
+        raise XPlanUmringError("Kein *_Plan gefunden, dies wird nicht unterstützt!")
+    plan_element = plans[plan_category]
+    log("Plankategorie: " + plan_category)
+
+    plan_category_short = plan_category.split("_")[0]
+    bereich_elements = bereiche.get(plan_category, [])
+    log("Anzahl " + plan_category_short + "_Bereich: " + str(len(bereich_elements)))
+    if len(bereich_elements) > 1:
+        raise XPlanUmringError(
+            "Mehr als 1 Bereich gefunden, dies wird nicht unterstützt!"
+        )
+
+    raeumlicherGeltungsbereich_element, kbs = _geltungsbereichInfo(
+        plan_element, plan_category, xplan_ns_uri, log
+    )
+
+    return {
+        "xplan_ns": xplan_ns_uri,
+        "xplan_version": xplan_version,
+        "plan_category": plan_category,
+        "plan_element": plan_element,
+        "bereich_element": bereich_elements[0] if bereich_elements else None,
+        "raeumlicherGeltungsbereich_element": raeumlicherGeltungsbereich_element,
+        "kbs": kbs,
+        "name": _planText(plan_element, xplan_ns_uri, "name"),
+        "nummer": _planText(plan_element, xplan_ns_uri, "nummer"),
+    }
+
+
+def _updateBoundedBy(boundedby_element, kbs, lower_corner, upper_corner):
+    for envelope_element in boundedby_element.iter(gmlTag("Envelope")):
+        envelope_element.attrib["srsName"] = kbs
+    for lowerCorner_element in boundedby_element.iter(gmlTag("lowerCorner")):
+        lowerCorner_element.text = lower_corner
+    for upperCorner_element in boundedby_element.iter(gmlTag("upperCorner")):
+        upperCorner_element.text = upper_corner
+
+
+def _geometryElement(kbs, polygons=None, gml=None):
+    if polygons is not None:
+        return multiSurfaceElement(polygons, kbs)
+    if gml is not None:
+        return _gmlElement(gml)
+    raise XPlanUmringError("Keine Umringgeometrie übergeben.")
+
+
+def _geltungsbereichElement(xplan_ns, kbs, polygons=None, gml=None):
+    geltungsbereich_element = etree.Element(
+        "{" + xplan_ns + "}raeumlicherGeltungsbereich"
+    )
+    geltungsbereich_element.append(_geometryElement(kbs, polygons, gml))
+    return geltungsbereich_element
+
+
+def _replaceIndented(old_element, new_element):
+    """
+    old_element durch new_element ersetzen und new_element so einrücken wie
+    die Umgebung von old_element (Einrückung je Ebene aus dem Leerraum davor).
+    """
+    previous = old_element.getprevious()
+    if previous is not None:
+        whitespace = previous.tail
+    else:
+        whitespace = old_element.getparent().text
+    level = sum(1 for _ in old_element.iterancestors())
+
+    new_element.tail = old_element.tail
+    old_element.getparent().replace(old_element, new_element)
+    etree.indent(new_element, space=_indentUnit(whitespace, level), level=level)
+
+
+def _indentUnit(whitespace, level):
+    # Einrückung je Ebene aus dem Leerraum vor einem Element der Ebene level
+    indentation = (whitespace or "").rpartition("\n")[2]
+    if level and indentation and not indentation.strip():
+        return indentation[: max(len(indentation) // level, 1)]
+    return "\t"
+
+
+def _insertIndented(parent, index, new_element):
+    # Wie _replaceIndented(), aber new_element an Position index einfügen
+    if index > 0:
+        whitespace = parent[index - 1].tail
+    else:
+        whitespace = parent.text
+    level = sum(1 for _ in parent.iterancestors()) + 1
+
+    new_element.tail = whitespace
+    parent.insert(index, new_element)
+    etree.indent(new_element, space=_indentUnit(whitespace, level), level=level)
+
+
+def _updatePlan(plan_element, geltungsbereich_element, kbs, corners, xplan_ns):
+    for boundedby_element in plan_element.iterchildren(gmlTag("boundedBy")):
+        _updateBoundedBy(boundedby_element, kbs, *corners)
+
+    raeumlicherGeltungsbereich_element = next(
+        plan_element.iter("{" + xplan_ns + "}raeumlicherGeltungsbereich")
+    )
+    _replaceIndented(raeumlicherGeltungsbereich_element, geltungsbereich_element)
+
+
+def _updateBereich(bereich_element, xplan_ns):
+    geltungsbereich_element_bereich = next(
+        bereich_element.iter("{" + xplan_ns + "}geltungsbereich"), None
+    )
+    if geltungsbereich_element_bereich is not None:
+        geltungsbereich_element_bereich.getparent().remove(
+            geltungsbereich_element_bereich
+        )
+    boundedby_element_bereich = next(
+        bereich_element.iterchildren(gmlTag("boundedBy")), None
+    )
+    if boundedby_element_bereich is not None:
+        bereich_element.remove(boundedby_element_bereich)
+
+
+# GML-Eigenschaften, die in einem Objekt vor gml:boundedBy stehen
+_FEATURE_PROPERTIES_BEFORE_BOUNDEDBY = {
+    gmlTag(name)
+    for name in ("description", "descriptionReference", "identifier", "name")
+}
+
+
+def _featureBounds(feature):
+    # Ausdehnung aller Geometrien eines Objekts (ohne dessen boundedBy) und
+    # srsName der ersten Geometrie
+    texts = {}
+    srs_name = None
+    for child in feature.iterchildren(etree.Element):
+        if child.tag == gmlTag("boundedBy"):
+            continue
+        for element in child.iter(gmlTag("posList"), gmlTag("pos")):
+            dimension = None
+            ancestor = element
+            while ancestor is not None:
+                if dimension is None:
+                    dimension = ancestor.get("srsDimension")
+                if srs_name is None:
+                    srs_name = ancestor.get("srsName")
+                if ancestor is child or (dimension and srs_name):
+                    break
+                ancestor = ancestor.getparent()
+            texts.setdefault(int(dimension or 2), []).append(element.text or "")
+
+    bounds = None
+    for dimension, dimension_texts in texts.items():
+        try:
+            extent = coordinateBounds(dimension_texts, dimension)
+        except ValueError:
+            raise XPlanUmringError(
+                "Ungültige Koordinaten in "
+                + etree.QName(feature).localname
+                + " "
+                + str(feature.get(gmlTag("id"), ""))
+            )
+        if extent is None:
+            continue
+        if bounds is None:
+            bounds = extent
+        else:
+            bounds = (
+                min(bounds[0], extent[0]),
+                min(bounds[1], extent[1]),
+                max(bounds[2], extent[2]),
+                max(bounds[3], extent[3]),
+            )
+    return bounds, srs_name
+
+
+def updateFeatureBoundedBy(feature, kbs):
+    """
+    boundedBy eines Objekts (z.B. BP_BaugebietsTeilFlaeche) aus den
+    Koordinaten seiner Geometrien (gml:posList, gml:pos) neu berechnen; bei
+    einem Objekt ohne Geometrie wird boundedBy entfernt.
+
+    Rückgabe ist True, wenn eine Ausdehnung geschrieben wurde.
+    """
+    boundedby_element = next(feature.iterchildren(gmlTag("boundedBy")), None)
+    bounds, srs_name = _featureBounds(feature)
+    if bounds is None:
+        if boundedby_element is not None:
+            feature.remove(boundedby_element)
+        return False
+
+    if boundedby_element is None:
+        boundedby_element = etree.Element(gmlTag("boundedBy"))
+        envelope_element = etree.SubElement(boundedby_element, gmlTag("Envelope"))
+        etree.SubElement(envelope_element, gmlTag("lowerCorner"))
+        etree.SubElement(envelope_element, gmlTag("upperCorner"))
+        index = 0
+        while (
+            index < len(feature)
+            and feature[index].tag in _FEATURE_PROPERTIES_BEFORE_BOUNDEDBY
+        ):
+            index += 1
+        _insertIndented(feature, index, boundedby_element)
+
+    for envelope_element in boundedby_element.iter(gmlTag("Envelope")):
+        envelope_element.attrib.pop("srsDimension", None)
+    _updateBoundedBy(
+        boundedby_element,
+        srs_name or kbs,
+        str(float(bounds[0])) + " " + str(float(bounds[1])),
+        str(float(bounds[2])) + " " + str(float(bounds[3])),
+    )
+    return True
+
+
+def replaceGeltungsbereich(
+    gml_root,
+    info,
+    polygons=None,
+    wkb=None,
+    gml=None,
+    lower_corner=None,
+    upper_corner=None,
+    update_envelopes=False,
+):
+    """
+    Räumlichen Geltungsbereich im Baum ersetzen und boundedBy von
+    XPlanAuszug und Plan anpassen; geltungsbereich und boundedBy des
+    Bereichs werden entfernt. info stammt von inspectXPlanGml().
+
+    Mit update_envelopes wird boundedBy aller weiteren Objekte mit
+    updateFeatureBoundedBy() neu berechnet. Rückgabe ist gml_root.
+    """
+    kbs = info["kbs"]
+    polygons = _polygons(polygons, wkb)
+    corners = _corners(polygons, lower_corner, upper_corner)
+    geltungsbereich_element = _geltungsbereichElement(
+        info["xplan_ns"], kbs, polygons, gml
+    )
+
+    for boundedby_element in gml_root.iterchildren(gmlTag("boundedBy")):
+        _updateBoundedBy(boundedby_element, kbs, *corners)
+
+    _updatePlan(
+        info["plan_element"], geltungsbereich_element, kbs, corners, info["xplan_ns"]
+    )
+    info["raeumlicherGeltungsbereich_element"] = geltungsbereich_element
+
+    if info["bereich_element"] is not None:
+        _updateBereich(info["bereich_element"], info["xplan_ns"])
+
+    if update_envelopes:
+        for member in gml_root.iterchildren(etree.Element):
+            if member.tag == gmlTag("boundedBy"):
+                continue
+            for feature in member.iterchildren(etree.Element):
+                if feature is not info["plan_element"]:
+                    updateFeatureBoundedBy(feature, kbs)
+
+    return gml_root
+
+
+@contextlib.contextmanager
+def _openFile(file, mode):
+    # Pfad öffnen (und wieder schließen) oder Dateiobjekt durchreichen
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, mode) as opened_file:
+            yield opened_file
+    else:
+        yield file
+
+
+def _readError(input_file, error=None):
+    # Dateiobjekte (z.B. aus einem Zip) über ihren Namen melden, bei
+    # XML-Fehlern mit Zeile und Spalte
+    location = ""
+    if isinstance(error, etree.XMLSyntaxError) and error.position[0]:
+        location = (
+            " (Zeile "
+            + str(error.position[0])
+            + ", Spalte "
+            + str(error.position[1])
+            + ": "
+            + re.sub(r", line \d+, column \d+$", "", str(error.msg))
+            + ")"
+        )
+    return XPlanUmringError(
+        'Datei: "'
+        + str(getattr(input_file, "name", input_file))
+        + '" konnte nicht gelesen werden'
+        + location
+        + ", bitte Datei überprüfen."
+    )
+
+
+class _OutputError(OSError):
+    """
+    Fehler beim Schreiben der Ausgabe (im Unterschied zu Lesefehlern der
+    Eingabe), wird von replaceGeometry() mit dem Pfad der Ausgabe gemeldet.
+    """
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+class _Output:
+    # Dateiobjekt der Ausgabe, Schreibfehler werden zu _OutputError
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        try:
+            return self.file.write(data)
+        except OSError as e:
+            raise _OutputError(e)
+
+
+@contextlib.contextmanager
+def _openOutput(output_file):
+    # Wie _openFile(output_file, "wb"), aber mit _Output
+    if not isinstance(output_file, (str, os.PathLike)):
+        yield _Output(output_file)
+        return
+    try:
+        file = open(output_file, "wb")
+    except OSError as e:
+        raise _OutputError(e)
+    with file:
+        yield _Output(file)
+        try:
+            file.flush()
+        except OSError as e:
+            raise _OutputError(e)
+
+
+def _writeError(output_file, error=None):
+    # Fehler beim Schreiben, gemeldet mit dem Pfad der Ausgabe
+    if isinstance(error, _OutputError):
+        error = error.error
+    reason = ""
+    if error is not None:
+        reason = " (" + str(getattr(error, "strerror", None) or error) + ")"
+    return XPlanUmringError(
+        'Datei: "'
+        + str(getattr(output_file, "name", output_file))
+        + '" konnte nicht geschrieben werden'
+        + reason
+        + ", bitte Speicherpfad überprüfen."
+    )
+
+
+def _removeQuietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def _replacingFile(output_file):
+    """
+    Temporäre Datei im Ordner von output_file, die output_file erst nach
+    erfolgreichem Schreiben ersetzt (os.replace()). Ein- und Ausgabe dürfen
+    so dieselbe Datei sein, und eine vorhandene Datei bleibt bei einem
+    Fehler unverändert; gelöscht wird nur die temporäre Datei.
+    """
+    directory, name = os.path.split(os.path.abspath(output_file))
+    base_name, extension = os.path.splitext(name)
+    while True:
+        temporary = os.path.join(
+            directory, "." + base_name + "-" + os.urandom(4).hex() + extension
+        )
+        try:
+            os.close(os.open(temporary, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+            break
+        except FileExistsError:
+            continue
+        except OSError as e:
+            raise _writeError(output_file, e)
+
+    try:
+        yield temporary
+    except BaseException:
+        _removeQuietly(temporary)
+        raise
+    try:
+        os.replace(temporary, output_file)
+    except OSError as e:
+        _removeQuietly(temporary)
+        raise _writeError(output_file, e)
+
+
+def probeXPlanGml(input_file, log=None):
+    """
+    XPlanGML bzw. XPlan-Archiv schnell untersuchen, ohne die Datei ganz zu
+    lesen: iterparse läuft nur bis zum Ende des *_Plan.
+
+    Rückgabe ist ein dict mit "xplan_ns", "xplan_version", "plan_category",
+    "bereich_count" (Anzahl der xplan:bereich-Verweise des Plans),
+    "geltungsbereich" (True, wenn der Plan einen räumlichen Geltungsbereich
+    hat), "srs_name" (srsName des ersten GML-Elements im räumlichen
+    Geltungsbereich, sonst None), "name" und "nummer".
+    """
+    return _probePlan(input_file, log)[0]
+
+
+def _probePlan(input_file, log=None):
+    # probeXPlanGml() und das vollständig gelesene *_Plan-Element
+    if log is None:
+        log = _noLog
+
+    try:
+        with openXPlanGml(input_file) as source:
+            context = iterparseXPlanGml(source, remove_blank_text=True)
+            event, root = next(context)
+            xplan_ns_uri, xplan_version = _xplanNamespace(root.nsmap, log)
+            plan_tags = {
+                "{" + xplan_ns_uri + "}" + elem: elem for elem in PLAN_CATEGORIES
+            }
+            bereich_tag = "{" + xplan_ns_uri + "}bereich"
+            geltungsbereich_tag = "{" + xplan_ns_uri + "}raeumlicherGeltungsbereich"
+
+            plan_element = None
+            for event, element in context:
+                if plan_element is None:
+                    if event == "start" and element.tag in plan_tags:
+                        plan_element = element
+                        probe = {
+                            "xplan_ns": xplan_ns_uri,
+                            "xplan_version": xplan_version,
+                            "plan_category": plan_tags[element.tag],
+                            "bereich_count": 0,
+                            "geltungsbereich": False,
+                            "srs_name": None,
+                        }
+                        log("Plankategorie: " + probe["plan_category"])
+                        srs_pending = False
+                    elif event == "end" and element.getparent() is root:
+                        element.clear()
+                        while element.getprevious() is not None:
+                            del root[0]
+                    continue
+
+                if event == "end":
+                    if element is plan_element:
+                        break
+                    if element.tag == geltungsbereich_tag:
+                        srs_pending = False
+                    continue
+                if element.tag == bereich_tag and element.getparent() is plan_element:
+                    probe["bereich_count"] += 1
+                elif element.tag == geltungsbereich_tag:
+                    srs_pending = not probe["geltungsbereich"]
+                    probe["geltungsbereich"] = True
+                elif srs_pending and element.tag.startswith("{" + GML_NS + "}"):
+                    # Wie inspectXPlanGml(): erstes GML-Element im Geltungsbereich
+                    srs_pending = False
+                    probe["srs_name"] = element.get("srsName")
+            else:
+                raise XPlanUmringError(
+                    "Kein *_Plan gefunden, dies wird nicht unterstützt!"
+                )
+    except (OSError, StopIteration, etree.XMLSyntaxError) as e:
+        raise _readError(input_file, e)
+
+    probe["name"] = _planText(plan_element, xplan_ns_uri, "name")
+    probe["nummer"] = _planText(plan_element, xplan_ns_uri, "nummer")
+    log(
+        "Anzahl "
+        + probe["plan_category"].split("_")[0]
+        + "_Bereich: "
+        + str(probe["bereich_count"])
+    )
+    return probe, plan_element
+
+
+def _geltungsbereichGeometry(plan_element, xplan_ns_uri):
+    return next(
+        plan_element.iterfind(
+            "xplan:raeumlicherGeltungsbereich/*", {"xplan": xplan_ns_uri}
+        ),
+        None,
+    )
+
+
+def readGeltungsbereich(input_file, log=None):
+    """
+    Geometrie des räumlichen Geltungsbereichs (lxml-Element, z.B.
+    gml:MultiSurface) einer XPlanGML bzw. eines XPlan-Archivs, wie
+    probeXPlanGml() nur bis zum Ende des *_Plan gelesen; None, wenn der Plan
+    keinen räumlichen Geltungsbereich hat.
+    """
+    probe, plan_element = _probePlan(input_file, log)
+    return _geltungsbereichGeometry(plan_element, probe["xplan_ns"])
+
+
+def readPlanSummary(input_file, log=None):
+    """
+    Übersicht eines Plans für einen Index, wie probeXPlanGml() nur bis zum
+    Ende des *_Plan gelesen.
+
+    Rückgabe ist das dict von probeXPlanGml() mit zusätzlich "rechtsstand"
+    (Code), "ags" und "gemeindename" (mehrere Gemeinden durch Komma
+    getrennt), "dates" (dict mit den Einträgen von PLAN_DATE_FIELDS, "" wenn
+    nicht angegeben) und "geltungsbereich_gml" (GML-Bytes der Geometrie des
+    räumlichen Geltungsbereichs, sonst None).
+    """
+    probe, plan_element = _probePlan(input_file, log)
+    xplan_ns_uri = probe["xplan_ns"]
+
+    def texts(path):
+        values = []
+        for element in plan_element.iterfind(path, {"xplan": xplan_ns_uri}):
+            if element.text and element.text.strip() not in values:
+                values.append(element.text.strip())
+        return ", ".join(values)
+
+    geometry_element = _geltungsbereichGeometry(plan_element, xplan_ns_uri)
+    probe.update(
+        {
+            "rechtsstand": _planText(plan_element, xplan_ns_uri, "rechtsstand"),
+            "ags": texts("xplan:gemeinde/xplan:XP_Gemeinde/xplan:ags"),
+            "gemeindename": texts(
+                "xplan:gemeinde/xplan:XP_Gemeinde/xplan:gemeindeName"
+            ),
+            "dates": {
+                name: _planText(plan_element, xplan_ns_uri, name)
+                for name in PLAN_DATE_FIELDS
+            },
+            "geltungsbereich_gml": (
+                None
+                if geometry_element is None
+                else etree.tostring(geometry_element, encoding="UTF-8")
+            ),
+        }
+    )
+    return probe
+
+
+def inspectXPlanGmlProbe(probe, log=None):
+    """
+    Ergebnis von probeXPlanGml() wie inspectXPlanGml() prüfen: höchstens
+    ein Bereich, räumlicher Geltungsbereich mit srsName.
+
+    Rückgabe ist ein dict wie bei inspectXPlanGml(), die Element-Einträge
+    sind None.
+    """
+    if log is None:
+        log = _noLog
+
+    plan_category = probe["plan_category"]
+    if probe["bereich_count"] > 1:
+        raise XPlanUmringError(
+            "Mehr als 1 Bereich gefunden, dies wird nicht unterstützt!"
+        )
+    if not probe["geltungsbereich"]:
+        raise XPlanUmringError(
+            plan_category
+            + " hat keinen räumlichen Geltungsbereich, dies wird nicht unterstützt!"
+        )
+    if probe["srs_name"] is None:
+        raise XPlanUmringError(
+            "Der räumliche Geltungsbereich von "
+            + plan_category
+            + " hat kein srsName-Attribut, dies wird nicht unterstützt!"
+        )
+    log("KBS der Eingabe-XPlanGML: " + probe["srs_name"])
+
+    return {
+        "xplan_ns": probe["xplan_ns"],
+        "xplan_version": probe["xplan_version"],
+        "plan_category": plan_category,
+        "plan_element": None,
+        "bereich_element": None,
+        "raeumlicherGeltungsbereich_element": None,
+        "kbs": probe["srs_name"],
+        "name": probe["name"],
+        "nummer": probe["nummer"],
+    }
+
+
+def inspectXPlanGmlFile(input_file, log=None):
+    """
+    Wie inspectXPlanGml(), liest die Datei (XPlanGML oder XPlan-Archiv) aber
+    mit probeXPlanGml() nur bis zum Plan-Objekt, so dass auch sehr große
+    Dateien schnell geprüft sind.
+
+    Die Element-Einträge des Ergebnisses sind None. Die Anzahl der Bereiche
+    wird aus den Verweisen des Plans ermittelt; streamReplaceGeltungsbereich()
+    zählt die Bereich-Objekte beim Schreiben noch einmal.
+    """
+    return inspectXPlanGmlProbe(probeXPlanGml(input_file, log), log)
+
+
+class _MemberWriter:
+    """
+    Kinder des Wurzelelements einzeln serialisieren.
+
+    lxml schreibt bei einem Teilbaum alle Namespace-Deklarationen der
+    Vorfahren erneut an das Element; die des Wurzelelements werden hier
+    wieder entfernt, da sie im Ausgabestrom bereits deklariert sind.
+    """
+
+    def __init__(self, root):
+        self.declarations = {
+            (
+                prefix.encode("UTF-8") if prefix is not None else None,
+                escape(uri, {'"': "&quot;"}).encode("UTF-8"),
+            )
+            for prefix, uri in root.nsmap.items()
+        }
+        # Tag mit Deklarationen -> Tag ohne die des Wurzelelements; lxml
+        # schreibt für gleiche Tags immer dieselbe Folge
+        self.heads = {}
+
+    def _keep(self, match):
+        if (match.group(1), match.group(2)) in self.declarations:
+            return b""
+        return match.group(0)
+
+    def serialize(self, node):
+        data = etree.tostring(node, encoding="UTF-8")
+        if not isinstance(node.tag, str):
+            # Kommentar oder Verarbeitungsanweisung
+            return data
+        head = self.heads.get(node.tag)
+        if head is None or not data.startswith(head[0]):
+            declared = _XMLNS_DECLARATIONS.match(data).group(0)
+            head = (declared, _XMLNS_DECLARATION.sub(self._keep, declared))
+            self.heads[node.tag] = head
+        return head[1] + data[len(head[0]) :]
+
+
+def _rootTags(root):
+    # Start- und End-Tag des Wurzelelements mit Attributen und Namespaces
+    data = etree.tostring(
+        etree.Element(root.tag, root.attrib, nsmap=root.nsmap), encoding="UTF-8"
+    )
+    name = re.match(rb"<([^\s/>]+)", data).group(1)
+    return data[:-2] + b">", b"</" + name + b">"
+
+
+def streamXPlanGml(input_file, output_file, update):
+    """
+    XPlanGML in einem Durchlauf lesen und schreiben.
+
+    Jedes Kind des Wurzelelements (gml:featureMember, gml:boundedBy, ...)
+    wird vollständig geparst, an update(element) übergeben, geschrieben und
+    wieder verworfen; es liegen also höchstens zwei featureMember im
+    Speicher. Nicht veränderte Elemente werden ohne neue Einrückung
+    übernommen. Rückgabe ist die Anzahl der Kinder des Wurzelelements.
+    """
+    with _openFile(input_file, "rb") as source, _openOutput(output_file) as output:
+        # Leerraum bleibt erhalten, unveränderte Elemente werden 1:1 kopiert
+        context = iterparseXPlanGml(source)
+        event, root = next(context)
+        writer = _MemberWriter(root)
+        start_tag, end_tag = _rootTags(root)
+
+        output.write(b"<?xml version='1.0' encoding='UTF-8'?>\n")
+        output.write(start_tag)
+
+        members = 0
+        text_written = False
+        for event, element in context:
+            if element.getparent() is not root:
+                continue
+            if event == "end":
+                update(element)
+                members += 1
+                continue
+            # Erst beim nächsten Kind ist der Leerraum (tail) des vorherigen
+            # vollständig gelesen, daher wird verzögert geschrieben
+            if not text_written:
+                text_written = True
+                output.write(escape(root.text or "").encode("UTF-8"))
+            while root[0] is not element:
+                output.write(writer.serialize(root[0]))
+                del root[0]
+
+        if not text_written:
+            output.write(escape(root.text or "").encode("UTF-8"))
+        for node in root:
+            output.write(writer.serialize(node))
+        output.write(end_tag)
+
+    return members
+
+
+def streamReplaceGeltungsbereich(
+    input_file,
+    output_file,
+    info,
+    polygons=None,
+    wkb=None,
+    gml=None,
+    lower_corner=None,
+    upper_corner=None,
+    profiler=NO_PROFILER,
+    update_envelopes=False,
+):
+    """
+    Wie replaceGeltungsbereich(), aber von Datei zu Datei mit
+    streamXPlanGml() für XPlanGML, die zu groß für einen Baum im Speicher
+    sind. info stammt von inspectXPlanGmlFile() oder inspectXPlanGml().
+
+    Mit update_envelopes wird boundedBy aller weiteren Objekte im selben
+    Durchlauf neu berechnet, siehe updateFeatureBoundedBy().
+
+    output_file darf nicht input_file sein und bleibt bei einem Fehler
+    unvollständig zurück; replaceGeometry() schreibt daher über eine
+    temporäre Datei, siehe _replacingFile().
+    """
+    xplan_ns = info["xplan_ns"]
+    kbs = info["kbs"]
+    polygons = _polygons(polygons, wkb)
+    corners = _corners(polygons, lower_corner, upper_corner)
+    geltungsbereich_element = _geltungsbereichElement(xplan_ns, kbs, polygons, gml)
+
+    plan_tag = "{" + xplan_ns + "}" + info["plan_category"]
+    bereich_tag = (
+        "{" + xplan_ns + "}" + info["plan_category"].split("_")[0] + "_Bereich"
+    )
+    counts = {"plan": 0, "bereich": 0, "envelopes": 0}
+
+    def update(element):
+        if element.tag == gmlTag("boundedBy"):
+            _updateBoundedBy(element, kbs, *corners)
+            return
+        for feature in element.iterchildren(etree.Element):
+            if feature.tag == plan_tag and counts["plan"] == 0:
+                counts["plan"] += 1
+                _updatePlan(feature, geltungsbereich_element, kbs, corners, xplan_ns)
+                continue
+            if feature.tag == bereich_tag:
+                counts["bereich"] += 1
+                if counts["bereich"] > 1:
+                    raise XPlanUmringError(
+                        "Mehr als 1 Bereich gefunden, dies wird nicht unterstützt!"
+                    )
+                _updateBereich(feature, xplan_ns)
+            if update_envelopes and updateFeatureBoundedBy(feature, kbs):
+                counts["envelopes"] += 1
+
+    try:
+        with profiler.stage("XPlanGML streamen") as stage:
+            members = streamXPlanGml(input_file, output_file, update)
+            stage.record(feature_members=members)
+            if update_envelopes:
+                stage.record(envelopes=counts["envelopes"])
+            if isinstance(input_file, (str, os.PathLike)):
+                stage.record(bytes_read=os.path.getsize(input_file))
+            if isinstance(output_file, (str, os.PathLike)):
+                stage.record(bytes_written=os.path.getsize(output_file))
+        if counts["plan"] == 0:
+            raise XPlanUmringError(
+                info["plan_category"]
+                + " wurde nicht als featureMember gefunden, dies wird nicht unterstützt!"
+            )
+    except (OSError, StopIteration, etree.XMLSyntaxError, XPlanUmringError) as e:
+        if isinstance(e, (XPlanUmringError, _OutputError)):
+            raise
+        raise _readError(input_file, e)
+
+    return output_file
+
+
+@contextlib.contextmanager
+def _mapFile(source, chunk_size=1048576):
+    """
+    Datei per mmap einblenden. Dateiobjekte ohne fileno() (z.B. Einträge
+    eines XPlan-Archivs) werden dazu stückweise in eine temporäre Datei
+    entpackt, damit auch sehr große XPlanGML nicht ganz in den Speicher
+    gelesen werden.
+    """
+    try:
+        fileno = source.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        with tempfile.TemporaryFile() as temporary_file:
+            shutil.copyfileobj(source, temporary_file, chunk_size)
+            temporary_file.flush()
+            with mmap.mmap(temporary_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+        return
+    with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as data:
+        yield data
+
+
+_WHITESPACE = b" \t\r\n"
+
+
+def _whitespaceBefore(data, position, limit=0):
+    # Beginn des Leerraums unmittelbar vor position
+    while position > limit and data[position - 1] in _WHITESPACE:
+        position -= 1
+    return position
+
+
+def _whitespaceAfter(data, position, limit):
+    # Ende des Leerraums ab position
+    while position < limit and data[position] in _WHITESPACE:
+        position += 1
+    return position
+
+
+def _findStartTag(data, name, start=0, end=None):
+    """
+    (Beginn, Ende) des nächsten Start-Tags name (Bytes, mit Präfix) in
+    data[start:end] oder None.
+    """
+    tag = b"<" + name
+    while True:
+        position = data.find(tag, start) if end is None else data.find(tag, start, end)
+        if position < 0:
+            return None
+        after = data[position + len(tag) : position + len(tag) + 1]
+        if after and after in b" \t\r\n/>":
+            return position, data.find(b">", position) + 1
+        start = position + 1
+
+
+def _elementRange(data, name, start_tag):
+    """
+    (Beginn, Ende des Start-Tags, Beginn des End-Tags, Ende) eines Elements.
+    """
+    start, tag_end = start_tag
+    if data[tag_end - 2 : tag_end] == b"/>":
+        return start, tag_end, tag_end, tag_end
+    end_tag = b"</" + name + b">"
+    end = data.find(end_tag, tag_end)
+    if end < 0:
+        raise XPlanUmringError(
+            "Ende von "
+            + name.decode("UTF-8")
+            + " nicht gefunden, bitte Datei überprüfen."
+        )
+    return start, tag_end, end, end + len(end_tag)
+
+
+def _firstChild(data, name, parent_tag_end, end=None):
+    """
+    Element name als erstes Kind direkt nach dem Start-Tag des Elternelements
+    (wie gml:boundedBy bei Features) oder None.
+    """
+    position = _whitespaceAfter(data, parent_tag_end, len(data) if end is None else end)
+    start_tag = _findStartTag(data, name, position, position + len(name) + 2)
+    if start_tag is None or start_tag[0] != position:
+        return None
+    return _elementRange(data, name, start_tag)
+
+
+def _qualifiedTag(prefix, name):
+    return (prefix + ":" + name if prefix else name).encode("UTF-8")
+
+
+def _prefixFor(nsmap, uri):
+    for prefix, value in nsmap.items():
+        if value == uri:
+            return prefix
+    raise XPlanUmringError(
+        "Namespace "
+        + uri
+        + " ist nicht am Wurzelelement deklariert, bitte einen anderen Modus wählen."
+    )
+
+
+def _rootStartTag(data):
+    """
+    (Beginn, Ende) des Start-Tags des Wurzelelements, XML-Deklaration,
+    Kommentare und DOCTYPE davor werden übersprungen.
+    """
+    position = 0
+    while True:
+        position = data.find(b"<", position)
+        if position < 0:
+            raise XPlanUmringError("Kein Wurzelelement gefunden.")
+        if data[position : position + 4] == b"<!--":
+            position = data.find(b"-->", position) + 3
+        elif data[position + 1 : position + 2] in (b"?", b"!"):
+            position = data.find(b">", position) + 1
+        else:
+            return position, data.find(b">", position) + 1
+
+
+def _spliceBoundedBy(data, gml_prefix, kbs, lower_corner, upper_corner):
+    """
+    srsName und Ecken eines gml:boundedBy (Bytes) ersetzen, der übrige Text
+    bleibt unverändert.
+    """
+    envelope = re.escape(_qualifiedTag(gml_prefix, "Envelope"))
+    srs_name = re.compile(
+        rb"(<" + envelope + rb"\b[^>]*?\ssrsName=)(\"[^\"]*\"|'[^']*')"
+    )
+    if srs_name.search(data):
+        data = srs_name.sub(
+            lambda m: m.group(1) + b'"' + kbs.encode("UTF-8") + b'"', data, count=1
+        )
+    else:
+        data = re.sub(
+            rb"(<" + envelope + rb")(?=[\s/>])",
+            lambda m: m.group(1) + b' srsName="' + kbs.encode("UTF-8") + b'"',
+            data,
+            count=1,
+        )
+    for name, corner in (("lowerCorner", lower_corner), ("upperCorner", upper_corner)):
+        tag = re.escape(_qualifiedTag(gml_prefix, name))
+        data = re.sub(
+            rb"(<" + tag + rb"\b[^>]*>)[^<]*(</" + tag + rb">)",
+            lambda m: m.group(1) + corner.encode("UTF-8") + m.group(2),
+            data,
+        )
+    return data
+
+
+def _scanXPlanGml(data, info):
+    """
+    Byte-Bereiche für das Geometrie-Update suchen: gml:boundedBy von
+    XPlanAuszug, Plan und Bereich, raeumlicherGeltungsbereich des Plans und
+    geltungsbereich des Bereichs.
+
+    Nur die Start-Tags von Plan und Bereich werden in der ganzen Datei
+    gesucht (bytes.find), alle anderen Elemente liegen unmittelbar dahinter.
+    """
+    root_start, root_end = _rootStartTag(data)
+    root_tag = bytes(data[root_start:root_end])
+    if root_tag.endswith(b"/>"):
+        raise XPlanUmringError("Kein *_Plan gefunden, dies wird nicht unterstützt!")
+    root_name = re.match(rb"<([^\s/>]+)", root_tag).group(1)
+    try:
+        root = etree.fromstring(root_tag + b"</" + root_name + b">", xplanParser())
+    except etree.XMLSyntaxError:
+        raise XPlanUmringError("Wurzelelement konnte nicht gelesen werden.")
+
+    gml_prefix = _prefixFor(root.nsmap, GML_NS)
+    xplan_prefix = _prefixFor(root.nsmap, info["xplan_ns"])
+    boundedby_tag = _qualifiedTag(gml_prefix, "boundedBy")
+    plan_tag = _qualifiedTag(xplan_prefix, info["plan_category"])
+    bereich_tag = _qualifiedTag(
+        xplan_prefix, info["plan_category"].split("_")[0] + "_Bereich"
+    )
+
+    ranges = {"root": root, "gml_prefix": gml_prefix}
+    ranges["root_boundedBy"] = _firstChild(data, boundedby_tag, root_end)
+
+    plan_start_tag = _findStartTag(data, plan_tag, root_end)
+    if plan_start_tag is None:
+        raise XPlanUmringError(
+            info["plan_category"] + " nicht gefunden, dies wird nicht unterstützt!"
+        )
+    plan = _elementRange(data, plan_tag, plan_start_tag)
+    ranges["plan_boundedBy"] = _firstChild(data, boundedby_tag, plan[1], plan[2])
+
+    geltungsbereich_tag = _qualifiedTag(xplan_prefix, "raeumlicherGeltungsbereich")
+    geltungsbereich_start_tag = _findStartTag(
+        data, geltungsbereich_tag, plan[1], plan[2]
+    )
+    if geltungsbereich_start_tag is None:
+        raise XPlanUmringError(
+            info["plan_category"]
+            + " hat keinen räumlichen Geltungsbereich, dies wird nicht unterstützt!"
+        )
+    ranges["raeumlicherGeltungsbereich"] = _elementRange(
+        data, geltungsbereich_tag, geltungsbereich_start_tag
+    )
+
+    ranges["bereich_boundedBy"] = None
+    ranges["bereich_geltungsbereich"] = None
+    bereich_start_tag = _findStartTag(data, bereich_tag, root_end)
+    if bereich_start_tag is not None:
+        bereich = _elementRange(data, bereich_tag, bereich_start_tag)
+        if _findStartTag(data, bereich_tag, bereich[3]) is not None:
+            raise XPlanUmringError(
+                "Mehr als 1 Bereich gefunden, dies wird nicht unterstützt!"
+            )
+        ranges["bereich_boundedBy"] = _firstChild(
+            data, boundedby_tag, bereich[1], bereich[2]
+        )
+        bereich_geltungsbereich_tag = _qualifiedTag(xplan_prefix, "geltungsbereich")
+        bereich_geltungsbereich_start_tag = _findStartTag(
+            data, bereich_geltungsbereich_tag, bereich[1], bereich[2]
+        )
+        if bereich_geltungsbereich_start_tag is not None:
+            ranges["bereich_geltungsbereich"] = _elementRange(
+                data, bereich_geltungsbereich_tag, bereich_geltungsbereich_start_tag
+            )
+
+    return ranges
+
+
+def _spliceGeometry(data, element_range, geometry_element, root):
+    """
+    Inhalt von raeumlicherGeltungsbereich durch die Geometrie ersetzen; Start-
+    und End-Tag sowie der Leerraum davor und dahinter bleiben erhalten.
+    """
+    start, tag_end, end_tag_start, end = element_range
+    content_start = _whitespaceAfter(data, tag_end, end_tag_start)
+    content_end = _whitespaceBefore(data, end_tag_start, content_start)
+    leading = bytes(data[tag_end:content_start])
+
+    if b"\n" in leading:
+        indentation = leading.rpartition(b"\n")[2].decode("UTF-8")
+        line_start = _whitespaceBefore(data, start)
+        outer = bytes(data[line_start:start]).rpartition(b"\n")[2].decode("UTF-8")
+        space = "\t"
+        if indentation.startswith(outer) and len(indentation) > len(outer):
+            space = indentation[len(outer) :]
+        etree.indent(geometry_element, space=space)
+    else:
+        indentation = ""
+
+    geometry = _MemberWriter(root).serialize(geometry_element)
+    if indentation:
+        newline = b"\r\n" if b"\r\n" in leading else b"\n"
+        geometry = geometry.replace(b"\n", newline + indentation.encode("UTF-8"))
+    return bytes(data[start:content_start]) + geometry + bytes(data[content_end:end])
+
+
+def spliceReplaceGeltungsbereich(
+    input_file,
+    output_file,
+    info,
+    polygons=None,
+    wkb=None,
+    gml=None,
+    lower_corner=None,
+    upper_corner=None,
+    profiler=NO_PROFILER,
+):
+    """
+    Wie streamReplaceGeltungsbereich(), aber ohne die XPlanGML zu parsen:
+    Die Eingabe wird per mmap eingeblendet, die wenigen zu ändernden
+    Byte-Bereiche (siehe _scanXPlanGml()) werden gesucht und die Ausgabe aus
+    unveränderten Abschnitten und den neuen Fragmenten zusammengesetzt.
+
+    Die Formatierung der Eingabe bleibt Byte für Byte erhalten, die Kosten
+    entsprechen etwa denen einer Dateikopie. Voraussetzung ist eine
+    ASCII-kompatible Kodierung (z.B. UTF-8) und dass gml- und xplan-
+    Namespace am Wurzelelement deklariert sind. info stammt von
+    inspectXPlanGmlFile() oder inspectXPlanGml().
+
+    Wie bei streamReplaceGeltungsbereich() darf output_file nicht
+    input_file sein, siehe replaceGeometry().
+    """
+    kbs = info["kbs"]
+    polygons = _polygons(polygons, wkb)
+    lower_corner, upper_corner = _corners(polygons, lower_corner, upper_corner)
+    geometry_element = _geometryElement(kbs, polygons, gml)
+
+    try:
+        with _openFile(input_file, "rb") as source, _mapFile(source) as data:
+            if data[:2] in (b"\xff\xfe", b"\xfe\xff") or data[1:2] == b"\x00":
+                raise XPlanUmringError(
+                    "Nur Geometrie austauschen unterstützt nur UTF-8-kodierte XPlanGML, bitte einen anderen Modus wählen."
+                )
+
+            with profiler.stage("XPlanGML durchsuchen") as stage:
+                ranges = _scanXPlanGml(data, info)
+                stage.record(bytes_read=len(data))
+
+            edits = []
+            for key in ("root_boundedBy", "plan_boundedBy"):
+                if ranges[key] is not None:
+                    start, end = ranges[key][0], ranges[key][3]
+                    edits.append(
+                        (
+                            start,
+                            end,
+                            _spliceBoundedBy(
+                                bytes(data[start:end]),
+                                ranges["gml_prefix"],
+                                kbs,
+                                lower_corner,
+                                upper_corner,
+                            ),
+                        )
+                    )
+            edits.append(
+                (
+                    ranges["raeumlicherGeltungsbereich"][0],
+                    ranges["raeumlicherGeltungsbereich"][3],
+                    _spliceGeometry(
+                        data,
+                        ranges["raeumlicherGeltungsbereich"],
+                        geometry_element,
+                        ranges["root"],
+                    ),
+                )
+            )
+            for key in ("bereich_boundedBy", "bereich_geltungsbereich"):
+                if ranges[key] is not None:
+                    # Element mit dem Leerraum davor entfernen
+                    edits.append(
+                        (_whitespaceBefore(data, ranges[key][0]), ranges[key][3], b"")
+                    )
+            edits.sort()
+
+            with profiler.stage("XPlanGML zusammensetzen") as stage:
+                with _openOutput(output_file) as output, memoryview(data) as view:
+                    copied = 0
+                    position = 0
+                    for start, end, fragment in edits:
+                        # Ausschnitte freigeben, auch wenn write() fehlschlägt,
+                        # sonst lässt sich die Eingabe nicht mehr schließen
+                        with view[position:start] as part:
+                            output.write(part)
+                        output.write(fragment)
+                        copied += start - position
+                        position = end
+                    with view[position:] as part:
+                        output.write(part)
+                    copied += len(view) - position
+                stage.record(
+                    bytes_copied=copied,
+                    bytes_written=copied + sum(len(edit[2]) for edit in edits),
+                )
+    except (OSError, ValueError, XPlanUmringError) as e:
+        if isinstance(e, (XPlanUmringError, _OutputError)):
+            raise
+        raise _readError(input_file)
+
+    return output_file
+
+
+def readXPlanGml(input_file, profiler=NO_PROFILER):
+    """
+    XPlanGML-Datei mit xplanParser() parsen.
+
+    Leerraum zwischen Elementen wird dabei verworfen, writeXPlanGmlTree()
+    rückt die Ausgabe neu ein.
+    """
+    try:
+        with profiler.stage("XPlanGML lesen") as stage:
+            tree = etree.parse(input_file, xplanParser())
+            if isinstance(input_file, (str, os.PathLike)):
+                stage.record(bytes_read=os.path.getsize(input_file))
+        return tree
+    except (OSError, etree.XMLSyntaxError) as e:
+        raise _readError(input_file, e)
+
+
+def writeXPlanGmlTree(gml_root, output_file, profiler=NO_PROFILER):
+    """
+    Geänderten XPlanGML-Baum eingerückt schreiben.
+    """
+    with profiler.stage("etree.indent"):
+        etree.indent(gml_root, space="\t", level=0)
+    with profiler.stage("XPlanGML schreiben") as stage:
+        try:
+            etree.ElementTree(gml_root).write(
+                output_file, encoding="UTF-8", xml_declaration=True
+            )
+        except (OSError, etree.SerialisationError) as e:
+            raise _OutputError(e)
+        if isinstance(output_file, (str, os.PathLike)):
+            stage.record(bytes_written=os.path.getsize(output_file))
+    return output_file
+
+
+def isXPlanArchive(input_file):
+    """
+    True, wenn input_file der Pfad eines XPlan-Archivs (.zip) ist.
+    """
+    return isinstance(input_file, (str, os.PathLike)) and os.fspath(
+        input_file
+    ).lower().endswith(".zip")
+
+
+def _archiveMember(archive, input_zip):
+    try:
+        return archive.getinfo("xplan.gml")
+    except KeyError:
+        raise XPlanUmringError(
+            'XPlan-Archiv "' + str(input_zip) + '" enthält keine xplan.gml.'
+        )
+
+
+@contextlib.contextmanager
+def openXPlanGml(input_file):
+    """
+    XPlanGML zum Lesen öffnen; bei einem XPlan-Archiv wird die enthaltene
+    xplan.gml geöffnet, ohne sie zu entpacken.
+    """
+    if not isXPlanArchive(input_file):
+        with _openFile(input_file, "rb") as source:
+            yield source
+        return
+
+    try:
+        archive = zipfile.ZipFile(input_file)
+    except (OSError, zipfile.BadZipFile):
+        raise _readError(input_file)
+    with archive, archive.open(_archiveMember(archive, input_file)) as source:
+        yield source
+
+
+def _replaceGeometry(
+    openInput,
+    output_file,
+    polygons,
+    gml,
+    lower_corner,
+    upper_corner,
+    log,
+    profiler,
+    mode,
+    update_envelopes=False,
+):
+    # openInput() liefert je Durchlauf einen Kontextmanager mit Pfad oder
+    # Dateiobjekt der Eingabe
+    if mode not in REPLACE_MODES:
+        raise XPlanUmringError("Unbekannter Modus: " + str(mode))
+    if mode == "splice" and update_envelopes:
+        raise XPlanUmringError(
+            "Beim Austausch nur der Geometrie kann die Ausdehnung (boundedBy) der "
+            "übrigen Objekte nicht neu berechnet werden, bitte anderen Modus wählen."
+        )
+    if mode == "tree":
+        with openInput() as input_file:
+            gml_root = readXPlanGml(input_file, profiler).getroot()
+        info = inspectXPlanGml(gml_root, log)
+        with profiler.stage("Geltungsbereich ersetzen"):
+            replaceGeltungsbereich(
+                gml_root,
+                info,
+                polygons,
+                None,
+                gml,
+                lower_corner,
+                upper_corner,
+                update_envelopes,
+            )
+        return writeXPlanGmlTree(gml_root, output_file, profiler)
+
+    with openInput() as input_file:
+        info = inspectXPlanGmlFile(input_file, log)
+    with openInput() as input_file:
+        if mode == "stream":
+            return streamReplaceGeltungsbereich(
+                input_file,
+                output_file,
+                info,
+                polygons,
+                None,
+                gml,
+                lower_corner,
+                upper_corner,
+                profiler,
+                update_envelopes,
+            )
+        return spliceReplaceGeltungsbereich(
+            input_file,
+            output_file,
+            info,
+            polygons,
+            None,
+            gml,
+            lower_corner,
+            upper_corner,
+            profiler,
+        )
+
+
+def _stripZip64Extra(extra):
+    # Zip64-Feld (0x0001) entfernen, ZipInfo.FileHeader() schreibt es neu
+    fields = []
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, size = struct.unpack_from("<HH", extra, position)
+        if field_id != 0x0001:
+            fields.append(extra[position : position + 4 + size])
+        position += 4 + size
+    return b"".join(fields)
+
+
+# Interna von zipfile.ZipFile, die _copyRawMember() verwendet
+_RAW_COPY_ATTRIBUTES = (
+    "_didModify",
+    "_writecheck",
+    "filelist",
+    "fp",
+    "NameToInfo",
+    "start_dir",
+)
+
+
+def _copyMember(archive, item, output_archive, chunk_size=1048576):
+    # Über die öffentliche Schnittstelle: entpacken und neu packen
+    target = zipfile.ZipInfo(item.filename, item.date_time)
+    for attribute in (
+        "compress_type",
+        "comment",
+        "create_system",
+        "external_attr",
+    ):
+        setattr(target, attribute, getattr(item, attribute))
+    with archive.open(item) as source, output_archive.open(
+        target, "w", force_zip64=item.file_size > zipfile.ZIP64_LIMIT
+    ) as destination:
+        shutil.copyfileobj(source, destination, chunk_size)
+
+
+def _copyRawMember(archive, item, output_archive, chunk_size=1048576):
+    """
+    Eintrag item aus archive als komprimierte Rohdaten nach output_archive
+    kopieren, ohne ihn zu entpacken und neu zu packen.
+
+    zipfile bietet dafür keine öffentliche Schnittstelle; lokaler Kopf und
+    Daten werden daher so geschrieben wie in ZipFile.writestr(). Fehlen die
+    dafür nötigen Interna (andere Python-Version) oder schlägt die Rohkopie
+    fehl, bevor Daten geschrieben wurden, wird der Eintrag mit _copyMember()
+    über die öffentliche Schnittstelle kopiert.
+    """
+    if not hasattr(archive, "fp") or not all(
+        hasattr(output_archive, attribute) for attribute in _RAW_COPY_ATTRIBUTES
+    ):
+        _copyMember(archive, item, output_archive, chunk_size)
+        return
+
+    try:
+        archive.fp.seek(item.header_offset)
+        header = archive.fp.read(zipfile.sizeFileHeader)
+        if (
+            len(header) != zipfile.sizeFileHeader
+            or header[:4] != zipfile.stringFileHeader
+        ):
+            raise zipfile.BadZipFile("Ungültiger Dateikopf: " + item.filename)
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        archive.fp.seek(
+            item.header_offset + zipfile.sizeFileHeader + name_length + extra_length
+        )
+
+        target = zipfile.ZipInfo(item.filename, item.date_time)
+        for attribute in (
+            "compress_type",
+            "comment",
+            "create_system",
+            "create_version",
+            "extract_version",
+            "internal_attr",
+            "external_attr",
+            "CRC",
+            "compress_size",
+            "file_size",
+        ):
+            setattr(target, attribute, getattr(item, attribute))
+        # Größen und CRC stehen im lokalen Kopf, ein Datendeskriptor entfällt
+        target.flag_bits = item.flag_bits & ~0x08
+        target.extra = _stripZip64Extra(item.extra)
+        zip64 = (
+            target.file_size > zipfile.ZIP64_LIMIT
+            or target.compress_size > zipfile.ZIP64_LIMIT
+        )
+        output_archive._writecheck(target)
+        file_header = target.FileHeader(zip64)
+    except (AttributeError, TypeError, ValueError, struct.error, zipfile.BadZipFile):
+        _copyMember(archive, item, output_archive, chunk_size)
+        return
+
+    output_archive._didModify = True
+    target.header_offset = output_archive.fp.tell()
+    output_archive.fp.write(file_header)
+    remaining = item.compress_size
+    while remaining > 0:
+        chunk = archive.fp.read(min(remaining, chunk_size))
+        if not chunk:
+            raise zipfile.BadZipFile("Unerwartetes Dateiende: " + item.filename)
+        output_archive.fp.write(chunk)
+        remaining -= len(chunk)
+    output_archive.filelist.append(target)
+    output_archive.NameToInfo[target.filename] = target
+    output_archive.start_dir = output_archive.fp.tell()
+
+
+def replaceGeometryArchive(
+    input_file,
+    output_zip,
+    polygons=None,
+    wkb=None,
+    gml=None,
+    log=None,
+    profiler=NO_PROFILER,
+    mode="tree",
+    lower_corner=None,
+    upper_corner=None,
+    update_envelopes=False,
+):
+    """
+    Geometrie-Update mit einem XPlan-Archiv als Ausgabe.
+
+    input_file ist ein XPlan-Archiv oder eine XPlanGML. Die xplan.gml wird
+    gelesen und direkt in das neue Archiv geschrieben, weitere Dateien eines
+    Eingabe-Archivs (Rasterpläne, PDF, ...) werden unverändert als
+    komprimierte Rohdaten übernommen.
+
+    output_zip darf nicht input_file sein und bleibt bei einem Fehler
+    unvollständig zurück; replaceGeometry() schreibt daher über eine
+    temporäre Datei, siehe _replacingFile().
+    """
+    polygons = _polygons(polygons, wkb)
+
+    def writeXPlanGmlMember(output_archive, openInput, member=None):
+        target = zipfile.ZipInfo("xplan.gml", time.localtime()[:6])
+        large = False
+        if member is not None:
+            target.compress_type = member.compress_type
+            large = member.file_size > zipfile.ZIP64_LIMIT // 2
+        elif isinstance(input_file, (str, os.PathLike)):
+            large = os.path.getsize(input_file) > zipfile.ZIP64_LIMIT // 2
+        with output_archive.open(target, "w", force_zip64=large) as output:
+            _replaceGeometry(
+                openInput,
+                output,
+                polygons,
+                gml,
+                lower_corner,
+                upper_corner,
+                log,
+                profiler,
+                mode,
+                update_envelopes,
+            )
+
+    try:
+        try:
+            output_archive = zipfile.ZipFile(output_zip, "w")
+        except OSError as e:
+            raise _OutputError(e)
+        with output_archive:
+            if not isXPlanArchive(input_file):
+                writeXPlanGmlMember(
+                    output_archive, lambda: contextlib.nullcontext(input_file)
+                )
+            else:
+                with zipfile.ZipFile(input_file) as archive:
+                    member = _archiveMember(archive, input_file)
+                    with profiler.stage("Anlagen kopieren") as stage:
+                        copied = 0
+                        for item in archive.infolist():
+                            if item.filename != member.filename:
+                                _copyRawMember(archive, item, output_archive)
+                                copied += item.compress_size
+                        stage.record(bytes_copied=copied)
+                    writeXPlanGmlMember(
+                        output_archive, lambda: archive.open(member), member
+                    )
+    except (OSError, zipfile.BadZipFile, XPlanUmringError) as e:
+        if isinstance(e, (XPlanUmringError, _OutputError)):
+            raise
+        raise _readError(input_file)
+    return output_zip
+
+
+def _inputOpener(input_file):
+    # Kontextmanager je Durchlauf für _replaceGeometry()
+    if isXPlanArchive(input_file):
+        return lambda: openXPlanGml(input_file)
+    return lambda: contextlib.nullcontext(input_file)
+
+
+def replaceGeometry(
+    input_file,
+    output_file,
+    polygons=None,
+    wkb=None,
+    gml=None,
+    log=None,
+    profiler=NO_PROFILER,
+    mode="tree",
+    lower_corner=None,
+    upper_corner=None,
+    update_envelopes=False,
+):
+    """
+    Umringgeometrie einer XPlanGML-Datei ersetzen (alle anderen Attribute
+    bleiben erhalten). Die Geometrie muss im KBS der Datei vorliegen, siehe
+    inspectXPlanGml()["kbs"].
+
+    mode ist "tree" (ganze Datei einlesen, Ausgabe neu eingerückt), "stream"
+    (streamReplaceGeltungsbereich(), für sehr große Dateien) oder "splice"
+    (spliceReplaceGeltungsbereich(), Formatierung bleibt erhalten). Mit
+    update_envelopes (nicht bei "splice") wird boundedBy aller Objekte aus
+    ihren Koordinaten neu berechnet.
+
+    Ein- und Ausgabe können XPlanGML oder XPlan-Archive (.zip) sein; bei
+    einem Archiv als Ausgabe siehe replaceGeometryArchive(), aus einem
+    Archiv als Eingabe wird nur die xplan.gml gelesen.
+
+    Die Ausgabe wird über eine temporäre Datei geschrieben (siehe
+    _replacingFile()), Ein- und Ausgabe dürfen also dieselbe Datei sein.
+    """
+
+    def write(output):
+        try:
+            writeTo(output)
+        except _OutputError as e:
+            # Mit dem Pfad der Ausgabe melden, nicht dem der temporären Datei
+            raise _writeError(output_file, e)
+
+    def writeTo(output):
+        if isXPlanArchive(output_file):
+            replaceGeometryArchive(
+                input_file,
+                output,
+                polygons,
+                wkb,
+                gml,
+                log,
+                profiler,
+                mode,
+                lower_corner,
+                upper_corner,
+                update_envelopes,
+            )
+            return
+        _replaceGeometry(
+            _inputOpener(input_file),
+            output,
+            _polygons(polygons, wkb),
+            gml,
+            lower_corner,
+            upper_corner,
+            log,
+            profiler,
+            mode,
+            update_envelopes,
+        )
+
+    if not isinstance(output_file, (str, os.PathLike)):
+        write(output_file)
+        return output_file
+    with _replacingFile(output_file) as temporary:
+        write(temporary)
+    return output_file
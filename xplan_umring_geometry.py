@@ -0,0 +1,500 @@
+"""
+***************************************************************************
+XPlan-Umring - Geometry
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+from lxml import etree
+
+from qgis.core import (
+    QgsAbstractGeometry,
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCsException,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsFields,
+    QgsGeometry,
+    QgsMemoryProviderUtils,
+    QgsPoint,
+    QgsProcessingException,
+    QgsSpatialIndex,
+    QgsWkbTypes,
+)
+
+from qgis.PyQt.QtXml import QDomDocument
+
+from .xplan_umring_gml import (
+    GML_ID,
+    gmlTag,
+    multiSurfaceElement,
+    newGmlId,
+    polygonsFromWkb,
+    verticesNotIn,
+    wkbFromGml,
+)
+from .xplan_umring_profiling import NO_PROFILER
+
+
+def umringTransform(source_crs, kbs, context):
+    """
+    Transformation vom Quell-KBS in das ausgewählte KBS, None wenn gleich.
+    """
+    target_crs = QgsCoordinateReferenceSystem(kbs)
+    if source_crs == target_crs:
+        return None
+    return QgsCoordinateTransform(source_crs, target_crs, context.transformContext())
+
+
+def normalizeGeometry(geometry, kbs, transform=None, profiler=NO_PROFILER):
+    """
+    Eine (bereits zusammengefasste) Umringgeometrie reprojizieren und
+    bereinigen.
+    """
+    # Reprojizieren in ausgewähltes KBS
+    if transform is not None:
+        with profiler.stage("Reprojektion"):
+            try:
+                geometry.transform(transform)
+            except QgsCsException:
+                raise QgsProcessingException(
+                    "Umringgeometrie konnte nicht nach "
+                    + kbs
+                    + " transformiert werden."
+                )
+
+    # force_polygon_ccw
+    with profiler.stage("force_polygon_ccw"):
+        geometry = geometry.forcePolygonCounterClockwise()
+
+    # Doppelte Stützpunkte entfernen
+    with profiler.stage("Doppelte Stützpunkte entfernen") as stage:
+        vertices = geometry.constGet().nCoordinates() if profiler.enabled else 0
+        geometry.removeDuplicateNodes(1e-06, False)
+        if profiler.enabled:
+            stage.record(
+                vertices=geometry.constGet().nCoordinates(),
+                removed_vertices=vertices - geometry.constGet().nCoordinates(),
+            )
+
+    # Z/M-Werte fallenlassen
+    with profiler.stage("Z/M-Werte entfernen"):
+        geometry.get().dropZValue()
+        geometry.get().dropMValue()
+
+    return geometry
+
+
+def normalizeUmring(source, kbs, context, feedback=None, profiler=NO_PROFILER):
+    """
+    Umringpolygon(e) einer Feature-Quelle in einem Durchlauf normalisieren.
+
+    Entspricht der bisherigen Kette native:collect, native:reprojectlayer,
+    force_polygon_ccw, native:removeduplicatevertices und native:dropmzvalues,
+    arbeitet aber direkt auf QgsGeometry ohne temporäre Layer. Bei Abbruch
+    über feedback wird None zurückgegeben, damit kein unvollständiger Umring
+    weiterverarbeitet wird.
+    """
+    # Mehr- zu einteilig
+    geometries = []
+    with profiler.stage("Umring lesen") as stage:
+        for feature in source.getFeatures():
+            if feedback is not None and feedback.isCanceled():
+                return None
+            geometry = feature.geometry()
+            if geometry.isNull() or geometry.isEmpty():
+                continue
+            geometries.append(geometry)
+        stage.record(features=len(geometries))
+
+    if not geometries:
+        raise QgsProcessingException(
+            "Der Eingabelayer enthält keine Umringgeometrie, bitte Eingabe überprüfen."
+        )
+
+    with profiler.stage("Mehr- zu einteilig"):
+        geometry = QgsGeometry.collectGeometry(geometries)
+
+    return normalizeGeometry(
+        geometry,
+        kbs,
+        umringTransform(source.sourceCrs(), kbs, context),
+        profiler,
+    )
+
+
+def umringPolygons(geometry):
+    """
+    Polygone der Umringgeometrie als Listen von Ringkoordinaten (über WKB).
+
+    Gibt None zurück, wenn die Geometrie Kurven enthält.
+    """
+    if QgsWkbTypes.isCurvedType(geometry.wkbType()):
+        return None
+
+    return polygonsFromWkb(geometry.asWkb())
+
+
+def umringToGml(geometry, kbs):
+    """
+    Umringgeometrie als lxml-Element (gml:MultiSurface) mit gml:id und srsName.
+    """
+    polygons = umringPolygons(geometry)
+    if polygons is not None:
+        return multiSurfaceElement(polygons, kbs)
+
+    # Kurvengeometrien weiterhin über asGml3 schreiben
+    doc = QDomDocument()
+    gml_geometry = geometry.constGet().asGml3(doc, 6)
+    doc.appendChild(gml_geometry)
+    gml_geometry_string = (
+        doc.toString(2)
+        .replace("<", "<gml:")
+        .replace("<gml:/", "</gml:")
+        .replace('xmlns="gml"', 'xmlns:gml="http://www.opengis.net/gml/3.2"')
+    )
+    gml_element = etree.fromstring(gml_geometry_string)
+
+    for tag in ("MultiSurface", "Polygon", "LineString", "Curve"):
+        for element in gml_element.iter(gmlTag(tag)):
+            element.attrib[GML_ID] = newGmlId()
+            element.attrib["srsName"] = kbs
+
+    return gml_element
+
+
+def umringJobGeometry(geometry, kbs):
+    """
+    Umringgeometrie für xplan_umring_core (picklebar, auch für Worker-
+    Prozesse): (polygons, None) bzw. bei Kurvengeometrien (None, GML-Bytes).
+    """
+    polygons = umringPolygons(geometry)
+    if polygons is not None:
+        return polygons, None
+    return None, etree.tostring(umringToGml(geometry, kbs))
+
+
+def pixelTolerance(pixel_size, raster_crs, raster_extent, mask_crs, context):
+    """
+    Zulässige Abweichung beim Linearisieren einer Rastermaske: ein halbes
+    Pixel (pixel_size in Einheiten von raster_crs), umgerechnet in Einheiten
+    von mask_crs.
+    """
+    tolerance = pixel_size / 2
+    if raster_crs == mask_crs:
+        return tolerance
+
+    # Maßstab über die Ausdehnung des Rasters in beiden KBS
+    try:
+        mask_extent = QgsCoordinateTransform(
+            raster_crs, mask_crs, context.transformContext()
+        ).transformBoundingBox(raster_extent)
+    except QgsCsException:
+        return tolerance
+    if raster_extent.width() <= 0 or mask_extent.width() <= 0:
+        return tolerance
+    return tolerance * mask_extent.width() / raster_extent.width()
+
+
+def maskTolerance(raster_layer, mask_crs, context):
+    """
+    pixelTolerance() für raster_layer.
+    """
+    return pixelTolerance(
+        min(raster_layer.rasterUnitsPerPixelX(), raster_layer.rasterUnitsPerPixelY()),
+        raster_layer.crs(),
+        raster_layer.extent(),
+        mask_crs,
+        context,
+    )
+
+
+def linearizeMask(geometry, tolerance):
+    """
+    Polygon(e) als lineares Multipolygon für eine Rastermaske: nur echte
+    Kurven (z.B. Kreisbögen) werden linearisiert, mit höchstens tolerance
+    Abweichung; gerade Kanten bleiben unverändert.
+    """
+    if QgsWkbTypes.isCurvedType(geometry.wkbType()):
+        geometry = QgsGeometry(
+            geometry.constGet().segmentize(
+                tolerance,
+                QgsAbstractGeometry.SegmentationToleranceType.MaximumDifference,
+            )
+        )
+    else:
+        geometry = QgsGeometry(geometry)
+    geometry.convertToMultiType()
+    return geometry
+
+
+def rasterMask(source, tolerance, feedback=None, profiler=NO_PROFILER):
+    """
+    Polygone einer Feature-Quelle als Maske für gdalwarp: memory-Layer ohne
+    Attribute im KBS der Quelle.
+
+    Die Geometrien werden mit linearizeMask() und tolerance (siehe
+    maskTolerance()) linearisiert, so dass die Maske so wenige Stützpunkte
+    wie möglich hat. Die Umprojektion in das KBS des Rasters übernimmt
+    gdalwarp.
+
+    Rückgabe ist (layer, Stützpunkte vorher, Stützpunkte nachher).
+    """
+    features = []
+    vertices_before = 0
+    vertices_after = 0
+    with profiler.stage("Maske linearisieren") as stage:
+        request = QgsFeatureRequest().setNoAttributes()
+        for source_feature in source.getFeatures(request):
+            if feedback is not None and feedback.isCanceled():
+                break
+            geometry = source_feature.geometry()
+            if geometry.isNull() or geometry.isEmpty():
+                continue
+            vertices_before += geometry.constGet().nCoordinates()
+            geometry = linearizeMask(geometry, tolerance)
+            vertices_after += geometry.constGet().nCoordinates()
+            feature = QgsFeature()
+            feature.setGeometry(geometry)
+            features.append(feature)
+        stage.record(vertices_before=vertices_before, vertices_after=vertices_after)
+
+    layer = QgsMemoryProviderUtils.createMemoryLayer(
+        "maske",
+        QgsFields(),
+        QgsWkbTypes.Type.MultiPolygon,
+        source.sourceCrs(),
+    )
+    layer.dataProvider().addFeatures(features)
+    return layer, vertices_before, vertices_after
+
+
+def rasterMaskWkb(
+    source, raster_crs, tolerance, context, feedback=None, profiler=NO_PROFILER
+):
+    """
+    Polygone einer Feature-Quelle als eine Maske im KBS des Rasters
+    (Multipolygon als WKB), z.B. zum Rasterisieren mit subtractMask().
+
+    Linearisiert wird wie bei rasterMask() mit tolerance im KBS der Quelle,
+    danach in raster_crs transformiert.
+
+    Rückgabe ist (WKB bzw. None ohne Polygon, Stützpunkte vorher,
+    Stützpunkte nachher).
+    """
+    layer, vertices_before, vertices_after = rasterMask(
+        source, tolerance, feedback, profiler
+    )
+    geometries = [feature.geometry() for feature in layer.getFeatures()]
+    if not geometries:
+        return None, vertices_before, vertices_after
+
+    with profiler.stage("Maske transformieren"):
+        geometry = QgsGeometry.collectGeometry(geometries)
+        if source.sourceCrs() != raster_crs:
+            try:
+                geometry.transform(
+                    QgsCoordinateTransform(
+                        source.sourceCrs(), raster_crs, context.transformContext()
+                    )
+                )
+            except QgsCsException as e:
+                raise QgsProcessingException(
+                    "Transformation der Maske fehlgeschlagen: " + str(e)
+                )
+    return bytes(geometry.asWkb()), vertices_before, vertices_after
+
+
+def geometryFromGml(element):
+    """
+    QgsGeometry aus einer GML-Flächengeometrie (lxml-Element, z.B. von
+    readGeltungsbereich()) ohne Umweg über GDAL/OGR, siehe wkbFromGml().
+    """
+    try:
+        wkb = wkbFromGml(element)
+    except ValueError as e:
+        raise QgsProcessingException(
+            "Geometrie konnte nicht gelesen werden: " + str(e) + "."
+        )
+    geometry = QgsGeometry()
+    geometry.fromWkb(wkb)
+    return geometry
+
+
+def _linearPolygons(geometry):
+    # Kurven linearisieren, Ringkoordinaten über WKB
+    if QgsWkbTypes.isCurvedType(geometry.wkbType()):
+        geometry = QgsGeometry(geometry.constGet().segmentize())
+    return geometry, polygonsFromWkb(geometry.asWkb())
+
+
+def _directedHausdorff(vertices, geometry):
+    # Größter Abstand der Stützpunkte vertices zum Rand von geometry
+    if not vertices:
+        return 0.0
+    boundary = geometry.constGet().boundary()
+    engine = QgsGeometry.createGeometryEngine(boundary)
+    engine.prepareGeometry()
+    return max(engine.distance(QgsPoint(x, y)) for x, y in vertices)
+
+
+def umringChanges(old_geometry, new_geometry, profiler=NO_PROFILER):
+    """
+    Bisherigen und neuen Umring (im selben KBS) vergleichen.
+
+    Rückgabe ist ein dict mit "added" und "removed" (hinzugekommene bzw.
+    entfernte Flächen als QgsGeometry, zusammen die symmetrische Differenz),
+    deren Flächen "added_area" und "removed_area", "old_area", "new_area",
+    "old_vertices", "new_vertices" und "hausdorff".
+
+    "hausdorff" entspricht QgsGeometry.hausdorffDistance() (diskret, über
+    die Stützpunkte der linearisierten Umringe). Berechnet wird sie nur für
+    Stützpunkte, die nicht in beiden Umringen vorkommen, jeweils gegen den
+    vorbereiteten (prepared) Rand des anderen Umrings, und bleibt so auch
+    bei sehr vielen Stützpunkten schnell.
+    """
+    with profiler.stage("Flächenänderung berechnen"):
+        added = new_geometry.difference(old_geometry)
+        removed = old_geometry.difference(new_geometry)
+        for geometry in (added, removed):
+            if geometry.isNull():
+                raise QgsProcessingException(
+                    "Änderungen des Geltungsbereichs konnten nicht berechnet werden: "
+                    + geometry.lastError()
+                )
+
+    with profiler.stage("Hausdorff-Distanz berechnen") as stage:
+        old_linear, old_polygons = _linearPolygons(old_geometry)
+        new_linear, new_polygons = _linearPolygons(new_geometry)
+        old_changed = verticesNotIn(old_polygons, new_polygons)
+        new_changed = verticesNotIn(new_polygons, old_polygons)
+        hausdorff = max(
+            _directedHausdorff(old_changed, new_linear),
+            _directedHausdorff(new_changed, old_linear),
+        )
+        stage.record(changed_vertices=len(old_changed) + len(new_changed))
+
+    return {
+        "added": added,
+        "removed": removed,
+        "added_area": added.area(),
+        "removed_area": removed.area(),
+        "old_area": old_geometry.area(),
+        "new_area": new_geometry.area(),
+        "old_vertices": old_geometry.constGet().nCoordinates(),
+        "new_vertices": new_geometry.constGet().nCoordinates(),
+        "hausdorff": hausdorff,
+    }
+
+
+# Kleinere Überlappungen (m²) sind Rundungsartefakte gemeinsamer Grenzen
+MIN_OVERLAP_AREA = 0.01
+
+
+class OverlapIndex:
+    """
+    Vorhandene Geltungsbereiche (z.B. Layer des XPlan-Index) für die Prüfung
+    neuer Umringe auf Überlappung.
+
+    Die Referenzgeometrien werden einmalig im KBS der Umringe in einen
+    QgsSpatialIndex geladen, mit extent (im KBS der Umringe, z.B. für einen
+    einzelnen Plan) nur die Features, die der Provider über seinen eigenen
+    räumlichen Index (z.B. R-Baum im GeoPackage) dafür liefert. Je Umring
+    werden nur die Kandidaten aus dem Index mit der vorbereiteten (prepared)
+    GEOS-Geometrie des Umrings geprüft, die Überlappungsfläche wird nur für
+    tatsächliche Treffer berechnet.
+    """
+
+    def __init__(
+        self, source, kbs, context, feedback=None, profiler=NO_PROFILER, extent=None
+    ):
+        self.source = source
+        request = QgsFeatureRequest().setNoAttributes()
+        if umringTransform(source.sourceCrs(), kbs, context) is not None:
+            request.setDestinationCrs(
+                QgsCoordinateReferenceSystem(kbs), context.transformContext()
+            )
+        if extent is not None:
+            request.setFilterRect(extent)
+        with profiler.stage("Referenzgeometrien indizieren"):
+            self.index = QgsSpatialIndex(
+                source.getFeatures(request),
+                feedback,
+                QgsSpatialIndex.Flag.FlagStoreFeatureGeometries,
+            )
+
+    def overlaps(self, geometry, profiler=NO_PROFILER):
+        """
+        Überlappungen von geometry (im KBS des Index) als Liste von
+        (Beschriftung, Fläche in m²), größte Fläche zuerst.
+        """
+        with profiler.stage("Überlappung prüfen") as stage:
+            candidates = self.index.intersects(geometry.boundingBox())
+            hits = {}
+            if candidates:
+                engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+                engine.prepareGeometry()
+                for feature_id in candidates:
+                    candidate = self.index.geometry(feature_id).constGet()
+                    if not engine.intersects(candidate) or engine.touches(candidate):
+                        continue
+                    area = engine.intersection(candidate).area()
+                    if area >= MIN_OVERLAP_AREA:
+                        hits[feature_id] = area
+            stage.record(candidates=len(candidates), overlaps=len(hits))
+
+        if not hits:
+            return []
+        labels = self._labels(hits)
+        return sorted(
+            ((labels[feature_id], area) for feature_id, area in hits.items()),
+            key=lambda overlap: -overlap[1],
+        )
+
+    def _labels(self, feature_ids):
+        # Beschriftung aus name/nummer (z.B. XPlan-Index), sonst Feature-ID
+        names = self.source.fields().names()
+        request = QgsFeatureRequest().setFilterFids(list(feature_ids))
+        request.setFlags(QgsFeatureRequest.Flag.NoGeometry)
+        labels = {}
+        for feature in self.source.getFeatures(request):
+            parts = [
+                str(feature[field])
+                for field in ("name", "nummer")
+                if field in names and feature[field]
+            ]
+            labels[feature.id()] = " / ".join(parts) or "Feature " + str(feature.id())
+        for feature_id in feature_ids:
+            labels.setdefault(feature_id, "Feature " + str(feature_id))
+        return labels
+
+    def report(self, geometry, feedback, plan_name="", profiler=NO_PROFILER):
+        """
+        Überlappungen von geometry als Warnungen ausgeben und zurückgeben.
+        """
+        overlaps = self.overlaps(geometry, profiler)
+        prefix = plan_name + ": " if plan_name else ""
+        for label, area in overlaps:
+            feedback.pushWarning(
+                prefix
+                + "Überlappung mit vorhandenem Plan "
+                + label
+                + " ("
+                + format(area, ".2f")
+                + " m²)"
+            )
+        return overlaps
@@ -0,0 +1,440 @@
+"""
+***************************************************************************
+XPlan-Umring - GML
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import struct
+import uuid
+
+from lxml import etree
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+GML_NS = "http://www.opengis.net/gml/3.2"
+
+GML_ID = "{" + GML_NS + "}id"
+
+
+def gmlTag(name):
+    return "{" + GML_NS + "}" + name
+
+
+def newGmlId():
+    return "ID_" + str(uuid.uuid4())
+
+
+def formatCoordinate(value, precision=6):
+    """
+    Koordinate wie qgsDoubleToString() formatieren (feste Nachkommastellen,
+    abschließende Nullen entfernt, kein "-0").
+    """
+    text = "%.*f" % (precision, value)
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    if text == "-0":
+        text = "0"
+    return text
+
+
+def posListText(coordinates, precision=6):
+    """
+    Text für gml:posList aus einer flachen Koordinatenfolge x0 y0 x1 y1 ...
+
+    Größere Ringe werden mit NumPy formatiert, sonst (oder ohne NumPy)
+    Koordinate für Koordinate. Beide Wege liefern identischen Text.
+    """
+    if np is not None and len(coordinates) >= 64:
+        text = _posListTextNumpy(coordinates, precision)
+        if text is not None:
+            return text
+    return " ".join(formatCoordinate(value, precision) for value in coordinates)
+
+
+def _posListTextNumpy(coordinates, precision):
+    values = np.asarray(coordinates, dtype=np.float64).ravel()
+    count = values.size
+    if not np.isfinite(values).all():
+        return None
+
+    scaled = np.abs(values) * 10.0**precision
+    if scaled.max() >= 2.0**52:
+        return None
+
+    # Auf ganzzahlige Einheiten der letzten Nachkommastelle runden; Werte,
+    # die zu nah an x.5 liegen, wie "%.*f" über die Zeichenkette runden
+    units = np.rint(scaled)
+    unsure = np.abs(scaled - np.floor(scaled) - 0.5) < np.spacing(scaled) * 4
+    for index in np.flatnonzero(unsure):
+        units[index] = float(
+            ("%.*f" % (precision, abs(values[index]))).replace(".", "")
+        )
+    units = units.astype(np.int64)
+    integer = units // 10**precision
+    fraction = units - integer * 10**precision
+
+    integer_width = len(str(int(integer.max())))
+    integer_length = np.ones(count, dtype=np.int64)
+    for exponent in range(1, integer_width):
+        integer_length += integer >= 10**exponent
+    fraction_length = np.full(count, precision, dtype=np.int64)
+    for exponent in range(1, precision + 1):
+        fraction_length -= fraction % 10**exponent == 0
+
+    # Eine Zeile je Koordinate: Vorzeichen, Ziffern, Punkt, Ziffern, Leerzeichen
+    width = integer_width + precision + 3
+    chars = np.empty((count, width), dtype=np.uint8)
+    chars[:, 0] = ord("-")
+    remainder = integer
+    for column in range(integer_width, 0, -1):
+        quotient = remainder // 10
+        chars[:, column] = remainder - quotient * 10 + ord("0")
+        remainder = quotient
+    chars[:, integer_width + 1] = ord(".")
+    remainder = fraction
+    for column in range(integer_width + precision + 1, integer_width + 1, -1):
+        quotient = remainder // 10
+        chars[:, column] = remainder - quotient * 10 + ord("0")
+        remainder = quotient
+    chars[:, -1] = ord(" ")
+
+    columns = np.arange(width)
+    keep = columns >= (integer_width + 1 - integer_length)[:, None]
+    keep &= columns <= (integer_width + 1 + fraction_length)[:, None]
+    keep[:, integer_width + 1] = fraction_length > 0
+    keep[:, 0] = np.signbit(values) & (units != 0)
+    keep[:, -1] = True
+    keep[-1, -1] = False
+
+    return chars[keep].tobytes().decode("ascii")
+
+
+def _readCoordinates(wkb, byte_order, offset, count):
+    if np is not None:
+        return np.frombuffer(wkb, dtype=byte_order + "f8", count=count, offset=offset)
+    return struct.unpack_from(byte_order + str(count) + "d", wkb, offset)
+
+
+def _readPolygon(wkb, offset):
+    byte_order = "<" if wkb[offset] == 1 else ">"
+    geometry_type, ring_count = struct.unpack_from(byte_order + "II", wkb, offset + 1)
+    if geometry_type != 3:
+        raise ValueError("Nicht unterstützter WKB-Geometrietyp: " + str(geometry_type))
+    offset += 9
+
+    rings = []
+    for _ in range(ring_count):
+        (point_count,) = struct.unpack_from(byte_order + "I", wkb, offset)
+        offset += 4
+        rings.append(_readCoordinates(wkb, byte_order, offset, 2 * point_count))
+        offset += 16 * point_count
+    return rings, offset
+
+
+def polygonsFromWkb(wkb):
+    """
+    Ringkoordinaten eines 2D-(Multi-)Polygons aus WKB lesen.
+
+    Rückgabe wie von multiSurfaceElement() erwartet: Liste von Polygonen,
+    je Polygon eine Liste flacher Koordinatenfolgen (NumPy-Arrays, falls
+    verfügbar).
+    """
+    wkb = bytes(wkb)
+    byte_order = "<" if wkb[0] == 1 else ">"
+    (geometry_type,) = struct.unpack_from(byte_order + "I", wkb, 1)
+
+    if geometry_type == 3:
+        return [_readPolygon(wkb, 0)[0]]
+
+    if geometry_type != 6:
+        raise ValueError("Nicht unterstützter WKB-Geometrietyp: " + str(geometry_type))
+
+    (polygon_count,) = struct.unpack_from(byte_order + "I", wkb, 5)
+    offset = 9
+    polygons = []
+    for _ in range(polygon_count):
+        rings, offset = _readPolygon(wkb, offset)
+        polygons.append(rings)
+    return polygons
+
+
+def coordinateBounds(texts, dimension=2):
+    """
+    (xmin, ymin, xmax, ymax) der Koordinaten aus Texten von gml:posList bzw.
+    gml:pos mit gleicher Dimension, None ohne Koordinaten.
+
+    Die Texte werden als Ganzes geparst (mit NumPy ohne Python-Schleife je
+    Koordinate). Bei ungültigen Zahlen wird ValueError ausgelöst.
+    """
+    values = " ".join(texts).split()
+    count = len(values) // dimension
+    if count == 0:
+        return None
+
+    if np is not None:
+        points = np.array(values[: count * dimension], dtype=np.float64).reshape(
+            count, dimension
+        )
+        lower = points[:, :2].min(axis=0)
+        upper = points[:, :2].max(axis=0)
+        return float(lower[0]), float(lower[1]), float(upper[0]), float(upper[1])
+
+    xs = [float(value) for value in values[0 : count * dimension : dimension]]
+    ys = [float(value) for value in values[1 : count * dimension : dimension]]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+# Elemente eines gml:Ring, die von wkbFromGml() gelesen werden
+_RING_TAGS = {
+    gmlTag(name)
+    for name in (
+        "curveMember",
+        "Curve",
+        "CompositeCurve",
+        "segments",
+        "LineString",
+        "LineStringSegment",
+        "Arc",
+        "ArcString",
+        "posList",
+        "pos",
+    )
+}
+
+
+def _coordinateWkb(element, geometry):
+    # Anzahl Punkte und 2D-Koordinaten (WKB, little endian) der gml:posList
+    # bzw. gml:pos eines Elements; srsDimension wie in _featureBounds()
+    coordinates = list(element.iterchildren(gmlTag("posList"), gmlTag("pos")))
+    dimension = None
+    ancestor = coordinates[0] if coordinates else element
+    while dimension is None and ancestor is not None:
+        dimension = ancestor.get("srsDimension")
+        ancestor = None if ancestor is geometry else ancestor.getparent()
+    dimension = int(dimension or 2)
+
+    error = ValueError("Ungültige Koordinaten in gml:" + etree.QName(element).localname)
+    values = " ".join(child.text or "" for child in coordinates).split()
+    count = len(values) // dimension
+    if count < 2 or count * dimension != len(values):
+        raise error
+
+    try:
+        if np is not None:
+            points = np.array(values, dtype=np.float64).reshape(count, dimension)
+            return count, np.ascontiguousarray(points[:, :2], dtype="<f8").tobytes()
+        values = [float(value) for value in values]
+    except ValueError:
+        raise error
+    points = [
+        value
+        for start in range(0, len(values), dimension)
+        for value in values[start : start + 2]
+    ]
+    return count, struct.pack("<" + str(2 * count) + "d", *points)
+
+
+def _curveWkb(wkb_type, element, geometry):
+    count, coordinates = _coordinateWkb(element, geometry)
+    return struct.pack("<BII", 1, wkb_type, count) + coordinates
+
+
+def _ringWkb(ring, geometry):
+    # Ring eines CurvePolygons: LineString bzw. CompoundCurve aus
+    # LineString und CircularString
+    if ring.tag == gmlTag("LinearRing"):
+        return _curveWkb(2, ring, geometry)
+    if ring.tag != gmlTag("Ring"):
+        raise ValueError("Nicht unterstützter Ring: gml:" + etree.QName(ring).localname)
+
+    for element in ring.iterdescendants(etree.Element):
+        if element.tag not in _RING_TAGS:
+            raise ValueError(
+                "Nicht unterstützte Geometrie: " + etree.QName(element).localname
+            )
+    parts = [
+        _curveWkb(
+            8 if element.tag in (gmlTag("Arc"), gmlTag("ArcString")) else 2,
+            element,
+            geometry,
+        )
+        for element in ring.iter(
+            gmlTag("LineString"),
+            gmlTag("LineStringSegment"),
+            gmlTag("Arc"),
+            gmlTag("ArcString"),
+        )
+    ]
+    return struct.pack("<BII", 1, 9, len(parts)) + b"".join(parts)
+
+
+def _polygonWkb(polygon):
+    # (Polygon bzw. CurvePolygon als WKB, True bei Kreisbögen)
+    rings = [
+        ring
+        for boundary in polygon.iterchildren(gmlTag("exterior"), gmlTag("interior"))
+        for ring in boundary.iterchildren(etree.Element)
+    ]
+    if not rings:
+        raise ValueError("Polygon ohne Außenring")
+
+    if all(ring.tag == gmlTag("LinearRing") for ring in rings):
+        parts = []
+        for ring in rings:
+            count, coordinates = _coordinateWkb(ring, polygon)
+            parts.append(struct.pack("<I", count) + coordinates)
+        return struct.pack("<BII", 1, 3, len(rings)) + b"".join(parts), False
+
+    parts = [_ringWkb(ring, polygon) for ring in rings]
+    return struct.pack("<BII", 1, 10, len(rings)) + b"".join(parts), True
+
+
+def wkbFromGml(element):
+    """
+    GML-Flächengeometrie (lxml-Element mit gml:Polygon bzw. gml:PolygonPatch,
+    z.B. gml:MultiSurface des räumlichen Geltungsbereichs) als 2D-WKB, ohne
+    GDAL/OGR.
+
+    Ergebnis ist ein MultiPolygon bzw., wenn ein Ring Kreisbögen (gml:Arc,
+    gml:ArcString) enthält, eine MultiSurface aus (Curve-)Polygonen.
+    Z-Werte werden verworfen. Bei ungültigen oder nicht unterstützten
+    Geometrien wird ValueError ausgelöst.
+    """
+    polygons = [
+        _polygonWkb(polygon)
+        for polygon in element.iter(gmlTag("Polygon"), gmlTag("PolygonPatch"))
+    ]
+    if not polygons:
+        raise ValueError(
+            "Keine Fläche in gml:" + etree.QName(element).localname + " gefunden"
+        )
+
+    curved = any(polygon[1] for polygon in polygons)
+    return struct.pack("<BII", 1, 12 if curved else 6, len(polygons)) + b"".join(
+        polygon[0] for polygon in polygons
+    )
+
+
+def _vertexSet(polygons):
+    rings = [ring for rings in polygons for ring in rings]
+    if np is None:
+        return {
+            (ring[index], ring[index + 1])
+            for ring in rings
+            for index in range(0, len(ring) - 1, 2)
+        }
+    if not rings:
+        return np.empty(0, dtype=np.complex128)
+    coordinates = np.concatenate([np.asarray(ring, dtype=np.float64) for ring in rings])
+    return np.unique(coordinates[0::2] + 1j * coordinates[1::2])
+
+
+def verticesNotIn(polygons, other_polygons):
+    """
+    Stützpunkte (x, y) von polygons, die nicht auch Stützpunkte von
+    other_polygons sind, ohne Duplikate (beide wie von polygonsFromWkb()).
+    """
+    vertices = _vertexSet(polygons)
+    if np is None:
+        return sorted(vertices - _vertexSet(other_polygons))
+    vertices = vertices[~np.isin(vertices, _vertexSet(other_polygons))]
+    return list(zip(vertices.real.tolist(), vertices.imag.tolist()))
+
+
+def multiSurfaceElement(polygons, kbs, precision=6):
+    """
+    gml:MultiSurface direkt als lxml-Element erzeugen.
+
+    polygons ist eine Liste von Polygonen, jedes Polygon eine Liste von Ringen
+    (erster Ring = Außenring), jeder Ring eine flache Koordinatenfolge.
+    gml:id und srsName werden beim Aufbau gesetzt.
+    """
+    multi_surface = etree.Element(
+        gmlTag("MultiSurface"),
+        {GML_ID: newGmlId(), "srsName": kbs},
+        nsmap={"gml": GML_NS},
+    )
+
+    for rings in polygons:
+        surface_member = etree.SubElement(multi_surface, gmlTag("surfaceMember"))
+        polygon = etree.SubElement(
+            surface_member,
+            gmlTag("Polygon"),
+            {GML_ID: newGmlId(), "srsName": kbs},
+        )
+        for index, coordinates in enumerate(rings):
+            boundary = etree.SubElement(
+                polygon, gmlTag("exterior" if index == 0 else "interior")
+            )
+            linear_ring = etree.SubElement(boundary, gmlTag("LinearRing"))
+            pos_list = etree.SubElement(
+                linear_ring, gmlTag("posList"), {"srsDimension": "2"}
+            )
+            pos_list.text = posListText(coordinates, precision)
+
+    return multi_surface
+
+
+def writeMultiSurface(xf, polygons, kbs, level=0, precision=6, chunk_size=65536):
+    """
+    gml:MultiSurface inkrementell in ein etree.xmlfile schreiben.
+
+    Erzeugt dieselbe Struktur und Einrückung wie multiSurfaceElement() mit
+    anschließendem etree.indent() unterhalb eines Elements der Tiefe level;
+    der posList-Text wird abschnittsweise geschrieben, so dass nie der Text
+    eines ganzen Rings im Speicher liegt.
+    """
+
+    def newline(depth):
+        xf.write("\n" + "\t" * depth)
+
+    def writePosList(coordinates):
+        with xf.element(gmlTag("posList"), {"srsDimension": "2"}):
+            for start in range(0, len(coordinates), chunk_size):
+                if start > 0:
+                    xf.write(" ")
+                xf.write(
+                    posListText(coordinates[start : start + chunk_size], precision)
+                )
+
+    newline(level + 1)
+    with xf.element(gmlTag("MultiSurface"), {GML_ID: newGmlId(), "srsName": kbs}):
+        for rings in polygons:
+            newline(level + 2)
+            with xf.element(gmlTag("surfaceMember")):
+                newline(level + 3)
+                with xf.element(
+                    gmlTag("Polygon"), {GML_ID: newGmlId(), "srsName": kbs}
+                ):
+                    for index, coordinates in enumerate(rings):
+                        newline(level + 4)
+                        with xf.element(
+                            gmlTag("exterior" if index == 0 else "interior")
+                        ):
+                            newline(level + 5)
+                            with xf.element(gmlTag("LinearRing")):
+                                newline(level + 6)
+                                writePosList(coordinates)
+                                newline(level + 5)
+                            newline(level + 4)
+                    newline(level + 3)
+                newline(level + 2)
+        newline(level + 1)
+    newline(level)
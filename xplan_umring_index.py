@@ -0,0 +1,248 @@
+"""
+***************************************************************************
+XPlan-Umring - Index
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import os
+
+from osgeo import ogr, osr
+
+from .xplan_umring_core import PLAN_DATE_FIELDS, XPlanUmringError, readPlanSummary
+
+# Index von XPlanGML und XPlan-Archiven als GeoPackage (mit R-Baum). Das
+# Modul hängt nur von GDAL/OGR ab, nicht von qgis.
+
+INDEX_LAYER = "xplan_index"
+
+INDEX_FIELDS = (
+    ("pfad", ogr.OFTString),
+    ("dateigroesse", ogr.OFTInteger64),
+    ("dateizeit_ns", ogr.OFTInteger64),
+    ("plankategorie", ogr.OFTString),
+    ("version", ogr.OFTString),
+    ("name", ogr.OFTString),
+    ("nummer", ogr.OFTString),
+    ("rechtsstand", ogr.OFTString),
+    ("ags", ogr.OFTString),
+    ("gemeindename", ogr.OFTString),
+    *((name, ogr.OFTDate) for name in PLAN_DATE_FIELDS),
+    ("kbs", ogr.OFTString),
+    ("fehler", ogr.OFTString),
+)
+
+
+def _spatialReference(kbs):
+    srs = osr.SpatialReference()
+    try:
+        if srs.SetFromUserInput(kbs) != 0:
+            return None
+    except RuntimeError:
+        return None
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def openIndex(index_path, kbs):
+    """
+    GeoPackage index_path öffnen bzw. mit dem Layer INDEX_LAYER im KBS kbs
+    anlegen. Ein vorhandener Index behält sein KBS.
+
+    Rückgabe ist (dataset, layer); dataset muss bis zum Ende offen bleiben.
+    """
+    try:
+        if os.path.exists(index_path):
+            dataset = ogr.Open(index_path, 1)
+        else:
+            dataset = ogr.GetDriverByName("GPKG").CreateDataSource(index_path)
+    except RuntimeError:
+        dataset = None
+    if dataset is None:
+        raise XPlanUmringError(
+            'Index "' + index_path + '" konnte nicht geöffnet werden.'
+        )
+
+    layer = dataset.GetLayerByName(INDEX_LAYER)
+    if layer is not None:
+        return dataset, layer
+
+    srs = _spatialReference(kbs)
+    if srs is None:
+        raise XPlanUmringError("Unbekanntes KBS: " + kbs)
+    layer = dataset.CreateLayer(
+        INDEX_LAYER,
+        srs,
+        ogr.wkbMultiPolygon,
+        ["SPATIAL_INDEX=YES", "FID=fid", "GEOMETRY_NAME=geom"],
+    )
+    for name, field_type in INDEX_FIELDS:
+        layer.CreateField(ogr.FieldDefn(name, field_type))
+    return dataset, layer
+
+
+def indexedFiles(layer):
+    """
+    Einträge des Index als {pfad: (fid, dateigroesse, dateizeit_ns)}.
+    """
+    layer.SetIgnoredFields(
+        ["OGR_GEOMETRY"]
+        + [
+            name
+            for name, _ in INDEX_FIELDS
+            if name not in ("pfad", "dateigroesse", "dateizeit_ns")
+        ]
+    )
+    layer.ResetReading()
+    entries = {
+        feature.GetField("pfad"): (
+            feature.GetFID(),
+            feature.GetField("dateigroesse"),
+            feature.GetField("dateizeit_ns"),
+        )
+        for feature in layer
+    }
+    layer.SetIgnoredFields([])
+    return entries
+
+
+def _indexGeometry(gml, kbs, target_srs, transforms):
+    # Kurven werden linearisiert, damit alle Geltungsbereiche in einen
+    # MultiPolygon-Layer passen
+    try:
+        geometry = ogr.CreateGeometryFromGML(gml.decode("UTF-8"))
+    except RuntimeError:
+        geometry = None
+    if geometry is None:
+        raise XPlanUmringError(
+            "Räumlicher Geltungsbereich konnte nicht gelesen werden."
+        )
+    geometry = ogr.ForceToMultiPolygon(geometry.GetLinearGeometry())
+
+    if kbs not in transforms:
+        source_srs = _spatialReference(kbs)
+        if source_srs is None:
+            raise XPlanUmringError("Unbekanntes KBS: " + kbs)
+        transforms[kbs] = (
+            None
+            if source_srs.IsSame(target_srs)
+            else osr.CoordinateTransformation(source_srs, target_srs)
+        )
+    if transforms[kbs] is not None:
+        try:
+            error = geometry.Transform(transforms[kbs])
+        except RuntimeError:
+            error = 1
+        if error != 0:
+            raise XPlanUmringError(
+                "Räumlicher Geltungsbereich konnte nicht transformiert werden."
+            )
+    return geometry
+
+
+def _indexFeature(layer, path, stat, target_srs, transforms):
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetField("pfad", path)
+    feature.SetField("dateigroesse", stat.st_size)
+    feature.SetField("dateizeit_ns", stat.st_mtime_ns)
+    try:
+        summary = readPlanSummary(path)
+        for field, key in (
+            ("plankategorie", "plan_category"),
+            ("version", "xplan_version"),
+            ("name", "name"),
+            ("nummer", "nummer"),
+            ("rechtsstand", "rechtsstand"),
+            ("ags", "ags"),
+            ("gemeindename", "gemeindename"),
+        ):
+            feature.SetField(field, summary[key])
+        for name, value in summary["dates"].items():
+            if value:
+                feature.SetField(name, value)
+        if summary["srs_name"] is not None:
+            feature.SetField("kbs", summary["srs_name"])
+            feature.SetGeometry(
+                _indexGeometry(
+                    summary["geltungsbereich_gml"],
+                    summary["srs_name"],
+                    target_srs,
+                    transforms,
+                )
+            )
+    except XPlanUmringError as e:
+        feature.SetField("fehler", str(e))
+    return feature
+
+
+def updateIndex(index_path, input_files, kbs="EPSG:25832"):
+    """
+    Index index_path für input_files (XPlanGML bzw. XPlan-Archive)
+    aktualisieren, siehe openIndex().
+
+    Eine Datei wird nur neu gelesen, wenn sie noch nicht im Index ist oder
+    sich Größe bzw. Änderungszeit geändert haben; Einträge von Dateien, die
+    es nicht mehr gibt, werden entfernt. Pläne, die nicht gelesen werden
+    können, werden ohne Geometrie mit der Meldung im Feld "fehler"
+    eingetragen und bei unveränderter Datei nicht erneut gelesen.
+
+    Als Generator liefert updateIndex() für jede Datei (pfad, status,
+    meldung) mit status "Neu", "Aktualisiert", "Unverändert", "Entfernt"
+    oder "Fehler". Wird der Generator vorzeitig geschlossen, bleiben die
+    bis dahin geschriebenen Einträge erhalten.
+    """
+    dataset, layer = openIndex(index_path, kbs)
+    target_srs = layer.GetSpatialRef()
+    indexed = indexedFiles(layer)
+    transforms = {}
+
+    dataset.StartTransaction()
+    try:
+        for input_file in input_files:
+            path = os.path.abspath(input_file)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                yield path, "Fehler", "Datei konnte nicht gelesen werden."
+                continue
+
+            entry = indexed.pop(path, None)
+            if entry is not None and entry[1:] == (stat.st_size, stat.st_mtime_ns):
+                yield path, "Unverändert", ""
+                continue
+
+            feature = _indexFeature(layer, path, stat, target_srs, transforms)
+            if entry is None:
+                layer.CreateFeature(feature)
+                status = "Neu"
+            else:
+                feature.SetFID(entry[0])
+                layer.SetFeature(feature)
+                status = "Aktualisiert"
+            error = feature.GetField("fehler")
+            if error:
+                yield path, "Fehler", error
+            else:
+                yield path, status, ""
+
+        for path, entry in sorted(indexed.items()):
+            if not os.path.isfile(path):
+                layer.DeleteFeature(entry[0])
+                yield path, "Entfernt", ""
+    finally:
+        dataset.CommitTransaction()
+        layer = None
+        dataset = None
@@ -0,0 +1,156 @@
+"""
+***************************************************************************
+XPlan-Umring - Parallel
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+from lxml import etree
+
+from .xplan_umring_core import XPlanUmringError, createXPlanArchive, replaceGeometry
+
+# Dieses Modul wird auch in den Worker-Prozessen importiert und darf daher
+# nicht von qgis abhängen.
+
+
+def _pythonExecutable():
+    """
+    Python-Interpreter für die Worker-Prozesse.
+
+    Innerhalb von QGIS zeigt sys.executable auf die QGIS-Anwendung selbst,
+    die dann für jeden Worker neu gestartet würde.
+    """
+    executable = sys.executable
+    if os.path.basename(executable).lower().startswith("python"):
+        return executable
+
+    if sys.platform == "win32":
+        names = ("pythonw.exe", "python.exe")
+    else:
+        names = ("python3", "python")
+    for directory in (sys.exec_prefix, os.path.join(sys.exec_prefix, "bin")):
+        for name in names:
+            candidate = os.path.join(directory, name)
+            if os.path.isfile(candidate):
+                return candidate
+
+    return shutil.which("python3") or shutil.which("python") or executable
+
+
+def processPool(processes):
+    """
+    ProcessPoolExecutor mit "spawn", damit keine Kopie des QGIS-Prozesses
+    (inkl. Qt-Threads) per fork entsteht.
+    """
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(_pythonExecutable())
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes, mp_context=context
+    )
+
+
+def runJobs(function, jobs, processes=1):
+    """
+    function(job) für alle jobs ausführen und die Ergebnisse in der
+    Reihenfolge der jobs liefern.
+
+    Bei processes > 1 laufen die Aufrufe in einem Prozesspool. jobs wird erst
+    nach und nach gelesen (höchstens zwei Aufträge je Prozess sind unterwegs),
+    so dass die Aufträge im aufrufenden Thread erzeugt werden können, während
+    die Worker bereits schreiben.
+    """
+    if processes <= 1:
+        for job in jobs:
+            yield function(job)
+        return
+
+    executor = processPool(processes)
+    try:
+        pending = collections.deque()
+        for job in jobs:
+            pending.append(executor.submit(function, job))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def writeArchiveJob(job):
+    """
+    Ein XPlan-Archiv aus einem Auftrag schreiben (auch im Worker-Prozess).
+
+    job ist ein dict mit "plan_type", "attributes", "polygons" bzw. "gml" und
+    "zip_path", siehe createXPlanArchive(). Rückgabe ist ein dict mit
+    "zip_path", "seconds" und "bytes_written" (für das Profiling).
+    """
+    start = time.perf_counter()
+    createXPlanArchive(
+        job["plan_type"],
+        job["attributes"],
+        job["zip_path"],
+        polygons=job["polygons"],
+        gml=job["gml"],
+    )
+    return {
+        "zip_path": job["zip_path"],
+        "seconds": time.perf_counter() - start,
+        "bytes_written": os.path.getsize(job["zip_path"]),
+    }
+
+
+def replaceGeometryJob(job):
+    """
+    Geometrie-Update einer XPlanGML bzw. eines XPlan-Archivs (auch im
+    Worker-Prozess).
+
+    job ist ein dict mit "input_file", "output_file", "polygons" bzw. "gml",
+    "lower_corner", "upper_corner", "mode" und optional "update_envelopes",
+    siehe replaceGeometry().
+    Fehler einer Datei brechen den Lauf nicht ab, sondern werden als
+    "error" zurückgegeben (None bei Erfolg).
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        replaceGeometry(
+            job["input_file"],
+            job["output_file"],
+            polygons=job["polygons"],
+            gml=job["gml"],
+            mode=job["mode"],
+            lower_corner=job["lower_corner"],
+            upper_corner=job["upper_corner"],
+            update_envelopes=job.get("update_envelopes", False),
+        )
+    except (XPlanUmringError, OSError, etree.LxmlError) as e:
+        # Auch unerwartete Lese- und Schreibfehler betreffen nur diese Datei
+        error = str(e)
+    return {
+        "input_file": job["input_file"],
+        "output_file": job["output_file"],
+        "error": error,
+        "seconds": time.perf_counter() - start,
+    }
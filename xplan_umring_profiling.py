@@ -0,0 +1,202 @@
+"""
+***************************************************************************
+XPlan-Umring - Profiling
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import json
+import os
+import time
+import tracemalloc
+
+# Umgebungsvariable hat Vorrang vor der Einstellung "xplan-umring/profiling"
+PROFILING_ENV = "XPLAN_UMRING_PROFILE"
+
+
+def profilingMode(setting=""):
+    """
+    Profiling-Modus aus Einstellung bzw. Umgebungsvariable: None (aus),
+    "log" (Ausgabe im Protokoll) oder "json" (zusätzlich JSON-Bericht).
+    """
+    value = os.environ.get(PROFILING_ENV, setting)
+    value = str(value or "").strip().lower()
+    if value in ("", "0", "false", "off", "nein"):
+        return None
+    if value == "json":
+        return "json"
+    return "log"
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def record(self, **values):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.values = {}
+
+    def __enter__(self):
+        # Ein anderer Lauf kann tracemalloc zwischendurch starten oder beenden
+        self.memory_start = None
+        if tracemalloc.is_tracing():
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        values = dict(self.values)
+        values["seconds"] = time.perf_counter() - self.start
+        if self.memory_start is not None and tracemalloc.is_tracing():
+            values["python_peak_bytes"] = max(
+                tracemalloc.get_traced_memory()[1] - self.memory_start, 0
+            )
+        self.profiler.add(self.name, values)
+        return False
+
+    def record(self, **values):
+        """
+        Kennzahlen der Stufe festhalten, z.B. vertices=..., bytes_written=...
+        """
+        self.values.update(values)
+
+
+class Profiler:
+    """
+    Laufzeit, Python-Speicherspitze (tracemalloc) und Kennzahlen je Stufe.
+
+    Mehrfach durchlaufene Stufen (z.B. je Plan im Batch) werden
+    zusammengefasst: Zeiten und Zähler summiert, Speicherspitze als Maximum.
+    Ausgeschaltet (mode None) liefert stage() einen gemeinsamen leeren
+    Kontextmanager, so dass die Messpunkte praktisch nichts kosten. Stufen
+    sollten nicht verschachtelt werden, da die Speicherspitze je Stufe
+    zurückgesetzt wird.
+
+    tracemalloc gilt für den ganzen Prozess; es wird nur gestartet, wenn es
+    noch nicht läuft, und nur dann auch wieder beendet. Als Kontextmanager
+    (with Profiler(...) as profiler) endet die Messung auch bei Fehler oder
+    Abbruch.
+    """
+
+    def __init__(self, mode=None, feedback=None):
+        self.mode = mode
+        self.feedback = feedback
+        self.stages = {}
+        self._tracing = False
+        if mode and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+        return False
+
+    def stop(self):
+        """
+        tracemalloc beenden, falls von diesem Profiler gestartet.
+        """
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    def stage(self, name):
+        if self.mode is None:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add(self, name, values):
+        stage = self.stages.get(name)
+        if stage is None:
+            self.stages[name] = dict(values, calls=1)
+            return
+        stage["calls"] += 1
+        for key, value in values.items():
+            if key == "python_peak_bytes":
+                stage[key] = max(stage.get(key, 0), value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                stage[key] = stage.get(key, 0) + value
+            else:
+                stage[key] = value
+
+    def report(self):
+        """
+        Bericht als dict (für JSON).
+        """
+        stages = [dict(stage=name, **values) for name, values in self.stages.items()]
+        return {
+            "stages": stages,
+            "seconds": sum(stage["seconds"] for stage in stages),
+        }
+
+    def finish(self, output_path=None):
+        """
+        Messung beenden, Ergebnis über feedback.pushInfo ausgeben und im Modus
+        "json" neben output_path als <output_path>.profile.json speichern.
+        """
+        if self.mode is None:
+            return None
+        self.stop()
+
+        report = self.report()
+        if self.feedback is not None:
+            for stage in report["stages"]:
+                self.feedback.pushInfo("Profil: " + formatStage(stage))
+            self.feedback.pushInfo("Profil: Gesamt %.3f s" % report["seconds"])
+
+        if self.mode != "json" or not output_path:
+            return None
+
+        report_path = output_path + ".profile.json"
+        with open(report_path, "w", encoding="UTF-8") as report_file:
+            json.dump(report, report_file, indent=2, ensure_ascii=False)
+        if self.feedback is not None:
+            self.feedback.pushInfo("Profil gespeichert: " + report_path)
+        return report_path
+
+
+NO_PROFILER = Profiler()
+
+
+def formatStage(stage):
+    text = stage["stage"] + ": %.3f s" % stage["seconds"]
+    if stage["calls"] > 1:
+        text += " (" + str(stage["calls"]) + "x)"
+    if "python_peak_bytes" in stage:
+        text += ", Speicher %.1f MB" % (stage["python_peak_bytes"] / 1048576)
+    for key, value in stage.items():
+        if key not in ("stage", "seconds", "calls", "python_peak_bytes"):
+            text += ", " + key + " " + str(value)
+    return text
@@ -33,9 +33,20 @@ from .xplan_umring_algorithm_bp_5_4 import XPlanUmringAlgorithmBP54
 from .xplan_umring_algorithm_bp_6_0 import XPlanUmringAlgorithmBP60
 from .xplan_umring_algorithm_fp_6_0 import XPlanUmringAlgorithmFP60
 from .xplan_umring_algorithm_lp_6_0 import XPlanUmringAlgorithmLP60
+from .xplan_umring_algorithm_batch import XPlanUmringAlgorithmBatch
 from .xplan_umring_algorithm_replace_geometry import XPlanUmringAlgorithmReplaceGeometry
+from .xplan_umring_algorithm_batch_replace_geometry import (
+    XPlanUmringAlgorithmBatchReplaceGeometry,
+)
+from .xplan_umring_algorithm_index import XPlanUmringAlgorithmIndex
 from .xplan_umring_algorithm_clip_raster import XPlanUmringAlgorithmClipRaster
-from .xplan_umring_algorithm_difference_raster import XPlanUmringAlgorithmDifferenceRaster
+from .xplan_umring_algorithm_difference_raster import (
+    XPlanUmringAlgorithmDifferenceRaster,
+)
+from .xplan_umring_algorithm_batch_clip_raster import (
+    XPlanUmringAlgorithmBatchClipRaster,
+)
+from .xplan_umring_settings import loadUmringSettings
 
 
 class XPlanUmringProvider(QgsProcessingProvider):
@@ -57,13 +68,20 @@ class XPlanUmringProvider(QgsProcessingProvider):
         """
         Loads all algorithms belonging to this provider.
         """
-        self.addAlgorithm(XPlanUmringAlgorithmBP54())
-        self.addAlgorithm(XPlanUmringAlgorithmBP60())
-        self.addAlgorithm(XPlanUmringAlgorithmFP60())
-        self.addAlgorithm(XPlanUmringAlgorithmLP60())
-        self.addAlgorithm(XPlanUmringAlgorithmReplaceGeometry())
-        self.addAlgorithm(XPlanUmringAlgorithmClipRaster())
-        self.addAlgorithm(XPlanUmringAlgorithmDifferenceRaster())
+        # Einstellungen einmalig lesen und an alle Algorithmen übergeben
+        settings = loadUmringSettings()
+
+        self.addAlgorithm(XPlanUmringAlgorithmBP54(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmBP60(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmFP60(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmLP60(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmBatch(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmReplaceGeometry(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmBatchReplaceGeometry(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmIndex(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmClipRaster(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmDifferenceRaster(settings))
+        self.addAlgorithm(XPlanUmringAlgorithmBatchClipRaster(settings))
 
     def id(self):
         """
@@ -0,0 +1,617 @@
+"""
+***************************************************************************
+XPlan-Umring - Raster
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import contextlib
+import itertools
+import os
+import time
+
+from osgeo import gdal, ogr, osr
+
+from .xplan_umring_core import XPlanUmringError
+
+# Hilfsfunktionen für die Raster-Werkzeuge; das Modul hängt nur von GDAL ab,
+# nicht von qgis.
+
+# Ausgabeprofile: (Anzeigename, Schlüssel)
+OUTPUT_PROFILES = [
+    ("GeoTIFF", "standard"),
+    ("GeoTIFF gekachelt mit Predictor und Übersichten", "tiled"),
+    ("Cloud Optimized GeoTIFF (COG)", "cog"),
+]
+
+BLOCK_SIZES = ["256", "512", "1024"]
+
+# Warp-Speicher je Thread (MB), entspricht der Voreinstellung von gdalwarp
+WARP_MEMORY_PER_THREAD = 64
+
+MAX_WARP_MEMORY = 2048
+
+RASTER_FILE_EXTENSIONS = (".tif", ".tiff", ".png", ".jpg", ".jpeg", ".jp2")
+
+# Eindeutige Namen für Schnittmasken in /vsimem/ (je Prozess)
+_cutline_numbers = itertools.count(1)
+
+
+def warpDefaults():
+    """
+    Voreinstellungen für gdalwarp nach Anzahl der Prozessorkerne: "threads"
+    (ein Thread je Kern), "warp_memory" (WARP_MEMORY_PER_THREAD je Thread,
+    höchstens MAX_WARP_MEMORY) und "cache" (GDAL_CACHEMAX, doppelter
+    Warp-Speicher, mindestens 256), Speicher jeweils in MB.
+    """
+    threads = os.cpu_count() or 1
+    warp_memory = min(WARP_MEMORY_PER_THREAD * threads, MAX_WARP_MEMORY)
+    return {
+        "threads": threads,
+        "warp_memory": warp_memory,
+        "cache": max(2 * warp_memory, 256),
+    }
+
+
+def warpArguments(threads, warp_memory, cache):
+    """
+    Zusätzliche Parameter für gdalwarp (EXTRA von
+    gdal:cliprasterbymasklayer, zusammen mit MULTITHREADING bzw. -multi).
+    """
+    return (
+        "-wo NUM_THREADS="
+        + str(threads)
+        + " -wm "
+        + str(warp_memory)
+        + " --config GDAL_CACHEMAX "
+        + str(cache)
+    )
+
+
+def creationOptionList(threads, profile="standard", block_size=512, predictor=None):
+    """
+    GeoTIFF-Erstellungsoptionen als Liste, DEFLATE-Kompression mit threads
+    Threads.
+
+    Für die Ausgabeprofile "tiled" und "cog" (Zwischenergebnis vor
+    writeOutputProfile()) gekachelt mit block_size und, falls angegeben,
+    mit predictor (siehe rasterProperties()).
+    """
+    options = ["COMPRESS=DEFLATE", "NUM_THREADS=" + str(threads)]
+    if profile != "standard":
+        options += [
+            "TILED=YES",
+            "BLOCKXSIZE=" + str(block_size),
+            "BLOCKYSIZE=" + str(block_size),
+            "BIGTIFF=IF_SAFER",
+        ]
+        if predictor is not None:
+            options.append("PREDICTOR=" + predictor)
+    return options
+
+
+def creationOptions(threads, profile="standard", block_size=512, predictor=None):
+    """
+    creationOptionList() für OPTIONS von gdal:cliprasterbymasklayer.
+    """
+    return "|".join(creationOptionList(threads, profile, block_size, predictor))
+
+
+def _openRaster(path, access=gdal.GA_ReadOnly):
+    try:
+        dataset = gdal.Open(path, access)
+    except RuntimeError:
+        dataset = None
+    if dataset is None:
+        raise XPlanUmringError('Raster "' + path + '" konnte nicht geöffnet werden.')
+    return dataset
+
+
+@contextlib.contextmanager
+def _configOptions(**options):
+    # GDAL-Konfiguration vorübergehend setzen
+    previous = {key: gdal.GetConfigOption(key) for key in options}
+    for key, value in options.items():
+        gdal.SetConfigOption(key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetConfigOption(key, value)
+
+
+def rasterProperties(path):
+    """
+    Eigenschaften eines Rasters für die Ausgabeprofile: "palette" (True bei
+    Farbpalette), "predictor" ("2" bei Ganzzahlen, "3" bei Gleitkommazahlen,
+    None bei Farbpalette, deren Indizes sich nicht sinnvoll differenzieren
+    lassen) und "resampling" für Übersichten ("NEAREST" bei Farbpalette,
+    sonst "AVERAGE").
+    """
+    band = _openRaster(path).GetRasterBand(1)
+    palette = band.GetColorTable() is not None
+    if palette:
+        predictor = None
+    elif gdal.GetDataTypeName(band.DataType).startswith(("Float", "CFloat")):
+        predictor = "3"
+    else:
+        predictor = "2"
+    return {
+        "palette": palette,
+        "predictor": predictor,
+        "resampling": "NEAREST" if palette else "AVERAGE",
+    }
+
+
+def rasterFiles(folder):
+    """
+    Rasterdateien (RASTER_FILE_EXTENSIONS) eines Ordners.
+    """
+    return sorted(
+        os.path.join(folder, file_name)
+        for file_name in os.listdir(folder)
+        if file_name.lower().endswith(RASTER_FILE_EXTENSIONS)
+        and os.path.isfile(os.path.join(folder, file_name))
+    )
+
+
+def rasterGrid(path):
+    """
+    Georeferenzierung eines Rasters: "extent" (xmin, ymin, xmax, ymax),
+    "pixel_size" (kleinere Pixelgröße) und "crs_wkt" (leer, wenn das Raster
+    kein KBS hat). Gedrehte Raster werden nicht unterstützt.
+    """
+    dataset = _openRaster(path)
+    x_origin, x_size, x_rotation, y_origin, y_rotation, y_size = (
+        dataset.GetGeoTransform()
+    )
+    if x_rotation != 0 or y_rotation != 0:
+        raise XPlanUmringError(
+            'Raster "' + path + '" ist gedreht und wird nicht unterstützt.'
+        )
+    x_end = x_origin + x_size * dataset.RasterXSize
+    y_end = y_origin + y_size * dataset.RasterYSize
+    return {
+        "extent": (
+            min(x_origin, x_end),
+            min(y_origin, y_end),
+            max(x_origin, x_end),
+            max(y_origin, y_end),
+        ),
+        "pixel_size": min(abs(x_size), abs(y_size)),
+        "crs_wkt": dataset.GetProjection(),
+    }
+
+
+def overviewFactors(width, height, block_size):
+    """
+    Faktoren 2, 4, 8, ... für Übersichten, bis eine Übersicht in eine Kachel
+    passt.
+    """
+    factors = []
+    factor = 2
+    while max(width, height) * 2 > block_size * factor:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def buildOverviews(path, resampling, threads, block_size, predictor=None):
+    """
+    Interne Übersichten (DEFLATE, gekachelt mit block_size) in das GeoTIFF
+    path schreiben. Rückgabe sind die Faktoren der Übersichten.
+    """
+    dataset = _openRaster(path, gdal.GA_Update)
+    factors = overviewFactors(dataset.RasterXSize, dataset.RasterYSize, block_size)
+    options = {
+        "COMPRESS_OVERVIEW": "DEFLATE",
+        "GDAL_NUM_THREADS": str(threads),
+        "GDAL_TIFF_OVR_BLOCKSIZE": str(block_size),
+    }
+    if predictor is not None:
+        options["PREDICTOR_OVERVIEW"] = predictor
+    try:
+        with _configOptions(**options):
+            error = dataset.BuildOverviews(resampling, factors)
+    except RuntimeError:
+        error = 1
+    dataset = None
+    if error != 0:
+        raise XPlanUmringError(
+            'Übersichten für "' + path + '" konnten nicht berechnet werden.'
+        )
+    return factors
+
+
+def translateToCog(source_path, output_path, properties, threads, block_size):
+    """
+    GeoTIFF source_path als Cloud Optimized GeoTIFF (inkl. Übersichten)
+    nach output_path schreiben.
+    """
+    options = [
+        "COMPRESS=DEFLATE",
+        "NUM_THREADS=" + str(threads),
+        "BLOCKSIZE=" + str(block_size),
+        "BIGTIFF=IF_SAFER",
+        "RESAMPLING=" + properties["resampling"],
+        "PREDICTOR=" + ("NO" if properties["predictor"] is None else "YES"),
+    ]
+    try:
+        dataset = gdal.Translate(
+            output_path, source_path, format="COG", creationOptions=options
+        )
+    except RuntimeError:
+        dataset = None
+    if dataset is None:
+        raise XPlanUmringError(
+            'Cloud Optimized GeoTIFF "'
+            + output_path
+            + '" konnte nicht geschrieben werden.'
+        )
+    dataset = None
+
+
+def writeOutputProfile(
+    profile, warp_path, output_path, properties, threads, block_size
+):
+    """
+    Ausgabeprofil nach gdalwarp anwenden: bei "tiled" Übersichten in
+    warp_path (= output_path) berechnen, bei "cog" das gekachelte
+    Zwischenergebnis warp_path als COG nach output_path schreiben.
+    """
+    if profile == "tiled":
+        buildOverviews(
+            output_path,
+            properties["resampling"],
+            threads,
+            block_size,
+            properties["predictor"],
+        )
+    elif profile == "cog":
+        translateToCog(warp_path, output_path, properties, threads, block_size)
+        os.remove(warp_path)
+
+
+def intermediatePath(output_file):
+    """
+    Gekacheltes Zwischenergebnis neben output_file für das Ausgabeprofil
+    "cog", wird von writeOutputProfile() entfernt.
+    """
+    return os.path.splitext(output_file)[0] + "_zwischenergebnis.tif"
+
+
+def _writeCutline(mask_wkb, srs):
+    # Schnittmaske als GeoPackage im Speicher (/vsimem/) für gdalwarp
+    path = (
+        "/vsimem/maske_"
+        + str(os.getpid())
+        + "_"
+        + str(next(_cutline_numbers))
+        + ".gpkg"
+    )
+    dataset = ogr.GetDriverByName("GPKG").CreateDataSource(path)
+    layer = dataset.CreateLayer("maske", srs, ogr.wkbMultiPolygon)
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(
+        ogr.ForceToMultiPolygon(ogr.CreateGeometryFromWkb(bytes(mask_wkb)))
+    )
+    layer.CreateFeature(feature)
+    feature = None
+    layer = None
+    dataset = None
+    return path
+
+
+def clipRaster(
+    input_file,
+    output_file,
+    mask_wkb,
+    no_data=None,
+    profile="standard",
+    block_size=512,
+    threads=1,
+    warp_memory=WARP_MEMORY_PER_THREAD,
+    cache=256,
+):
+    """
+    Raster input_file mit gdalwarp auf die Maske mask_wkb (Polygon bzw.
+    Multipolygon als WKB im KBS des Rasters) zuschneiden und mit dem
+    Ausgabeprofil profile als GeoTIFF nach output_file schreiben.
+
+    no_data ist der Leerwert außerhalb der Maske (z.B. 0 für den
+    Farbpalettenindex 0), ohne no_data gilt der Leerwert des Rasters.
+    """
+    source = _openRaster(input_file)
+    srs = source.GetSpatialRef()
+    if srs is not None:
+        srs = srs.Clone()
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    properties = rasterProperties(input_file) if profile != "standard" else None
+    warp_output = output_file
+    if profile == "cog":
+        warp_output = intermediatePath(output_file)
+
+    try:
+        cutline = _writeCutline(mask_wkb, srs)
+    except RuntimeError:
+        raise XPlanUmringError("Schnittmaske konnte nicht geschrieben werden.")
+    try:
+        with _configOptions(GDAL_CACHEMAX=str(cache)):
+            dataset = gdal.Warp(
+                warp_output,
+                source,
+                format="GTiff",
+                cutlineDSName=cutline,
+                cropToCutline=True,
+                dstNodata=no_data,
+                multithread=True,
+                warpOptions=["NUM_THREADS=" + str(threads)],
+                warpMemoryLimit=warp_memory,
+                creationOptions=creationOptionList(
+                    threads,
+                    profile,
+                    block_size,
+                    None if properties is None else properties["predictor"],
+                ),
+            )
+    except RuntimeError:
+        dataset = None
+    finally:
+        gdal.Unlink(cutline)
+    if dataset is None:
+        raise XPlanUmringError(
+            'Raster "'
+            + input_file
+            + '" konnte nicht zugeschnitten werden: '
+            + gdal.GetLastErrorMsg()
+        )
+    dataset = None
+    source = None
+
+    if profile != "standard":
+        writeOutputProfile(
+            profile, warp_output, output_file, properties, threads, block_size
+        )
+
+
+def _maskLayer(mask_wkb):
+    # Maske als OGR-Layer im Speicher, Koordinaten im KBS des Rasters
+    dataset = ogr.GetDriverByName("Memory").CreateDataSource("")
+    layer = dataset.CreateLayer("maske", None, ogr.wkbMultiPolygon)
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(ogr.CreateGeometryFromWkb(bytes(mask_wkb)))
+    layer.CreateFeature(feature)
+    return dataset
+
+
+def subtractMask(
+    input_file,
+    output_file,
+    mask_wkb,
+    no_data=None,
+    profile="standard",
+    block_size=512,
+    threads=1,
+    cache=256,
+    progress=None,
+):
+    """
+    Maske mask_wkb (Polygon bzw. Multipolygon als WKB im KBS des Rasters)
+    von Raster input_file abziehen und mit dem Ausgabeprofil profile als
+    GeoTIFF nach output_file schreiben.
+
+    Statt gdalwarp wird die Maske streifenweise (block_size Zeilen) im
+    Pixelraster der Quelle im Speicher rasterisiert (Pixelmittelpunkt in
+    der Maske) und auf den Streifen angewendet; Streifen außerhalb der
+    Maske werden unverändert kopiert. Pixel in der Maske erhalten den
+    Leerwert no_data (z.B. 0 für den Farbpalettenindex 0), ohne no_data den
+    Leerwert des Rasters bzw. 0. Ausdehnung und Pixelraster bleiben
+    erhalten.
+
+    progress(Anteil) wird nach jedem Streifen aufgerufen; liefert es False,
+    wird abgebrochen und output_file entfernt. Rückgabe ist (Anzahl
+    Streifen, Anzahl Streifen mit Maske) bzw. None bei Abbruch.
+    """
+    source = _openRaster(input_file)
+    width = source.RasterXSize
+    height = source.RasterYSize
+    geo_transform = source.GetGeoTransform()
+    if geo_transform[2] != 0 or geo_transform[4] != 0:
+        raise XPlanUmringError(
+            'Raster "' + input_file + '" ist gedreht und wird nicht unterstützt.'
+        )
+    properties = rasterProperties(input_file) if profile != "standard" else None
+    write_path = intermediatePath(output_file) if profile == "cog" else output_file
+
+    mask_dataset = _maskLayer(mask_wkb)
+    mask_layer = mask_dataset.GetLayer(0)
+    # Zeilenbereich der Maske, damit Streifen außerhalb nur kopiert werden
+    x_min, x_max, y_min, y_max = mask_layer.GetExtent()
+    rows = sorted((y - geo_transform[3]) / geo_transform[5] for y in (y_min, y_max))
+    first_row = max(int(rows[0]), 0)
+    last_row = min(int(rows[1]) + 1, height)
+
+    with _configOptions(GDAL_CACHEMAX=str(cache)):
+        try:
+            target = gdal.GetDriverByName("GTiff").Create(
+                write_path,
+                width,
+                height,
+                source.RasterCount,
+                source.GetRasterBand(1).DataType,
+                creationOptionList(
+                    threads,
+                    profile,
+                    block_size,
+                    None if properties is None else properties["predictor"],
+                ),
+            )
+        except RuntimeError:
+            target = None
+        if target is None:
+            raise XPlanUmringError(
+                'Raster "' + write_path + '" konnte nicht angelegt werden.'
+            )
+        target.SetGeoTransform(geo_transform)
+        target.SetProjection(source.GetProjection())
+
+        fill_values = []
+        for number in range(1, source.RasterCount + 1):
+            source_band = source.GetRasterBand(number)
+            target_band = target.GetRasterBand(number)
+            value = no_data if no_data is not None else source_band.GetNoDataValue()
+            if value is not None:
+                target_band.SetNoDataValue(value)
+            fill_values.append(0 if value is None else value)
+            target_band.SetColorInterpretation(source_band.GetColorInterpretation())
+            color_table = source_band.GetColorTable()
+            if color_table is not None:
+                target_band.SetColorTable(color_table)
+
+        strips = 0
+        masked_strips = 0
+        strip_mask = None
+        try:
+            for row in range(0, height, block_size):
+                strip_height = min(block_size, height - row)
+                data = source.ReadAsArray(0, row, width, strip_height)
+                if data is None:
+                    raise XPlanUmringError(
+                        'Raster "'
+                        + input_file
+                        + '" konnte nicht gelesen werden: '
+                        + gdal.GetLastErrorMsg()
+                    )
+                if data.ndim == 2:
+                    data = data[None]
+                if row < last_row and row + strip_height > first_row:
+                    if strip_mask is None or strip_mask.RasterYSize != strip_height:
+                        strip_mask = gdal.GetDriverByName("MEM").Create(
+                            "", width, strip_height, 1, gdal.GDT_Byte
+                        )
+                    strip_mask.SetGeoTransform(
+                        (
+                            geo_transform[0],
+                            geo_transform[1],
+                            0,
+                            geo_transform[3] + row * geo_transform[5],
+                            0,
+                            geo_transform[5],
+                        )
+                    )
+                    mask_band = strip_mask.GetRasterBand(1)
+                    mask_band.Fill(0)
+                    gdal.RasterizeLayer(strip_mask, [1], mask_layer, burn_values=[1])
+                    inside = mask_band.ReadAsArray().astype(bool)
+                    if inside.any():
+                        masked_strips += 1
+                        for band_data, value in zip(data, fill_values):
+                            band_data[inside] = value
+                for number, band_data in enumerate(data, 1):
+                    target.GetRasterBand(number).WriteArray(band_data, 0, row)
+                strips += 1
+                if (
+                    progress is not None
+                    and progress((row + strip_height) / height) is False
+                ):
+                    target = None
+                    gdal.GetDriverByName("GTiff").Delete(write_path)
+                    return None
+        except RuntimeError as e:
+            target = None
+            raise XPlanUmringError(
+                'Maske konnte nicht auf "'
+                + input_file
+                + '" angewendet werden: '
+                + str(e)
+            )
+        target.FlushCache()
+        target = None
+    source = None
+    mask_layer = None
+    mask_dataset = None
+
+    if profile != "standard":
+        writeOutputProfile(
+            profile, write_path, output_file, properties, threads, block_size
+        )
+    return strips, masked_strips
+
+
+def clipRasterJob(job):
+    """
+    Raster aus einem Auftrag zuschneiden (auch im Worker-Prozess).
+
+    job ist ein dict mit "operation" ("clip" für clipRaster(), "difference"
+    für subtractMask()), "input_file", "output_file", "mask_wkb",
+    "no_data", "profile", "block_size", "threads", "warp_memory" (nur
+    "clip") und "cache". Fehler eines Rasters brechen den Lauf nicht ab,
+    sondern werden als "error" zurückgegeben (None bei Erfolg).
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        if job["operation"] == "difference":
+            subtractMask(
+                job["input_file"],
+                job["output_file"],
+                job["mask_wkb"],
+                no_data=job["no_data"],
+                profile=job["profile"],
+                block_size=job["block_size"],
+                threads=job["threads"],
+                cache=job["cache"],
+            )
+        else:
+            clipRaster(
+                job["input_file"],
+                job["output_file"],
+                job["mask_wkb"],
+                no_data=job["no_data"],
+                profile=job["profile"],
+                block_size=job["block_size"],
+                threads=job["threads"],
+                warp_memory=job["warp_memory"],
+                cache=job["cache"],
+            )
+    except (XPlanUmringError, OSError) as e:
+        error = str(e)
+    return {
+        "input_file": job["input_file"],
+        "output_file": job["output_file"],
+        "error": error,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def warpSummary(seconds, threads, warp_memory, cache):
+    """
+    Meldung zu Laufzeit und Einstellungen (Threads, Warp-Speicher,
+    GDAL_CACHEMAX) eines gdalwarp-Laufs. Der tatsächliche Speicherbedarf
+    des gdalwarp-Prozesses lässt sich über gdal:cliprasterbymasklayer nicht
+    je Lauf ermitteln und wird daher nicht ausgegeben.
+    """
+    return (
+        "gdalwarp: "
+        + format(seconds, ".1f")
+        + " s mit "
+        + str(threads)
+        + " Threads, Warp-Speicher "
+        + str(warp_memory)
+        + " MB, GDAL_CACHEMAX "
+        + str(cache)
+        + " MB"
+    )
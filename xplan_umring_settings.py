@@ -0,0 +1,45 @@
+"""
+***************************************************************************
+XPlan-Umring - Settings
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+from qgis.core import QgsSettings
+
+from .xplan_umring_profiling import profilingMode
+
+
+def loadUmringSettings():
+    """
+    Voreinstellungen des Plugins (Kommune, AGS, Profiling) einmalig aus den
+    QGIS-Einstellungen lesen; die Algorithmen erhalten sie über den Provider.
+    """
+    settings = QgsSettings()
+    kommune = settings.value("xplan-umring/kommune", "")
+    ags = settings.value("xplan-umring/ags", "")
+
+    # Kreis Viersen und Nachbarn: Ortsteilname mit Kommune vorbelegen
+    ortsteilname = ""
+    if ags.startswith(("05114", "05154", "05158", "05166", "05170")):
+        ortsteilname = kommune
+
+    return {
+        "kommune": kommune,
+        "ags": ags,
+        "ortsteilname": ortsteilname,
+        "profiling": profilingMode(settings.value("xplan-umring/profiling", "")),
+    }
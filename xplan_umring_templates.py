@@ -0,0 +1,436 @@
+"""
+***************************************************************************
+XPlan-Umring - Templates
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import copy
+import functools
+import re
+import uuid
+
+from lxml import etree
+
+from .xplan_umring_gml import GML_ID, GML_NS
+
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+TEMPLATE_BP_5_4 = """<xplan:XPlanAuszug xmlns:adv="http://www.adv-online.de/nas" xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:xplan="http://www.xplanung.de/xplangml/5/4" xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:wfs="http://www.opengis.net/wfs/2.0" gml:id="">
+  <gml:boundedBy>
+    <gml:Envelope srsName="">
+      <gml:lowerCorner></gml:lowerCorner>
+      <gml:upperCorner></gml:upperCorner>
+    </gml:Envelope>
+  </gml:boundedBy>
+  <gml:featureMember>
+    <xplan:BP_Bereich gml:id="">
+      <xplan:nummer>0</xplan:nummer>
+      <xplan:name></xplan:name>
+      <xplan:gehoertZuPlan xlink:href=""></xplan:gehoertZuPlan>
+    </xplan:BP_Bereich>
+  </gml:featureMember>
+  <gml:featureMember>
+    <xplan:BP_Plan gml:id="">
+      <gml:boundedBy>
+        <gml:Envelope srsName="">
+          <gml:lowerCorner></gml:lowerCorner>
+          <gml:upperCorner></gml:upperCorner>
+        </gml:Envelope>
+      </gml:boundedBy>
+      <xplan:name></xplan:name>
+      <xplan:nummer></xplan:nummer>
+      <xplan:raeumlicherGeltungsbereich></xplan:raeumlicherGeltungsbereich>
+      <xplan:gemeinde>
+        <xplan:XP_Gemeinde>
+          <xplan:ags></xplan:ags>
+          <xplan:gemeindeName></xplan:gemeindeName>
+          <xplan:ortsteilName></xplan:ortsteilName>
+        </xplan:XP_Gemeinde>
+      </xplan:gemeinde>
+      <xplan:plangeber>
+        <xplan:XP_Plangeber>
+          <xplan:name></xplan:name>
+        </xplan:XP_Plangeber>
+      </xplan:plangeber>
+      <xplan:planArt></xplan:planArt>
+      <xplan:rechtsstand></xplan:rechtsstand>
+      <xplan:aenderungenBisDatum></xplan:aenderungenBisDatum>
+      <xplan:aufstellungsbeschlussDatum></xplan:aufstellungsbeschlussDatum>
+      <xplan:inkrafttretensDatum></xplan:inkrafttretensDatum>
+      <xplan:satzungsbeschlussDatum></xplan:satzungsbeschlussDatum>
+      <xplan:bereich xlink:href=""></xplan:bereich>
+    </xplan:BP_Plan>
+  </gml:featureMember>
+</xplan:XPlanAuszug>"""
+
+TEMPLATE_BP_6_0 = """<xplan:XPlanAuszug xmlns:adv="http://www.adv-online.de/nas" xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:xplan="http://www.xplanung.de/xplangml/6/0" xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:wfs="http://www.opengis.net/wfs/2.0" gml:id="">
+  <gml:boundedBy>
+    <gml:Envelope srsName="">
+      <gml:lowerCorner></gml:lowerCorner>
+      <gml:upperCorner></gml:upperCorner>
+    </gml:Envelope>
+  </gml:boundedBy>
+  <gml:featureMember>
+    <xplan:BP_Bereich gml:id="">
+      <xplan:nummer>0</xplan:nummer>
+      <xplan:name></xplan:name>
+      <xplan:gehoertZuPlan xlink:href=""></xplan:gehoertZuPlan>
+    </xplan:BP_Bereich>
+  </gml:featureMember>
+  <gml:featureMember>
+    <xplan:BP_Plan gml:id="">
+      <gml:boundedBy>
+        <gml:Envelope srsName="">
+          <gml:lowerCorner></gml:lowerCorner>
+          <gml:upperCorner></gml:upperCorner>
+        </gml:Envelope>
+      </gml:boundedBy>
+      <xplan:name></xplan:name>
+      <xplan:nummer></xplan:nummer>
+      <xplan:technHerstellDatum></xplan:technHerstellDatum>
+      <xplan:erstellungsMassstab></xplan:erstellungsMassstab>
+      <xplan:raeumlicherGeltungsbereich></xplan:raeumlicherGeltungsbereich>
+      <xplan:gemeinde>
+        <xplan:XP_Gemeinde>
+          <xplan:ags></xplan:ags>
+          <xplan:gemeindeName></xplan:gemeindeName>
+          <xplan:ortsteilName></xplan:ortsteilName>
+        </xplan:XP_Gemeinde>
+      </xplan:gemeinde>
+      <xplan:plangeber>
+        <xplan:XP_Plangeber>
+          <xplan:name></xplan:name>
+        </xplan:XP_Plangeber>
+      </xplan:plangeber>
+      <xplan:planArt></xplan:planArt>
+      <xplan:rechtsstand></xplan:rechtsstand>
+      <xplan:aenderungenBisDatum></xplan:aenderungenBisDatum>
+      <xplan:aufstellungsbeschlussDatum></xplan:aufstellungsbeschlussDatum>
+      <xplan:inkrafttretensDatum></xplan:inkrafttretensDatum>
+      <xplan:satzungsbeschlussDatum></xplan:satzungsbeschlussDatum>
+      <xplan:bereich xlink:href=""></xplan:bereich>
+    </xplan:BP_Plan>
+  </gml:featureMember>
+</xplan:XPlanAuszug>"""
+
+TEMPLATE_FP_6_0 = """<xplan:XPlanAuszug xmlns:adv="http://www.adv-online.de/nas" xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:xplan="http://www.xplanung.de/xplangml/6/0" xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:wfs="http://www.opengis.net/wfs/2.0" gml:id="">
+  <gml:boundedBy>
+    <gml:Envelope srsName="">
+      <gml:lowerCorner></gml:lowerCorner>
+      <gml:upperCorner></gml:upperCorner>
+    </gml:Envelope>
+  </gml:boundedBy>
+  <gml:featureMember>
+    <xplan:FP_Bereich gml:id="">
+      <xplan:nummer>0</xplan:nummer>
+      <xplan:name></xplan:name>
+      <xplan:gehoertZuPlan xlink:href=""></xplan:gehoertZuPlan>
+    </xplan:FP_Bereich>
+  </gml:featureMember>
+  <gml:featureMember>
+    <xplan:FP_Plan gml:id="">
+      <gml:boundedBy>
+        <gml:Envelope srsName="">
+          <gml:lowerCorner></gml:lowerCorner>
+          <gml:upperCorner></gml:upperCorner>
+        </gml:Envelope>
+      </gml:boundedBy>
+      <xplan:name></xplan:name>
+      <xplan:nummer></xplan:nummer>
+      <xplan:beschreibung></xplan:beschreibung>
+      <xplan:kommentar></xplan:kommentar>
+      <xplan:untergangsDatum></xplan:untergangsDatum>
+      <xplan:technHerstellDatum></xplan:technHerstellDatum>
+      <xplan:erstellungsMassstab></xplan:erstellungsMassstab>
+      <xplan:raeumlicherGeltungsbereich></xplan:raeumlicherGeltungsbereich>
+      <xplan:gemeinde>
+        <xplan:XP_Gemeinde>
+          <xplan:ags></xplan:ags>
+          <xplan:gemeindeName></xplan:gemeindeName>
+          <xplan:ortsteilName></xplan:ortsteilName>
+        </xplan:XP_Gemeinde>
+      </xplan:gemeinde>
+      <xplan:planArt></xplan:planArt>
+      <xplan:rechtsstand></xplan:rechtsstand>
+      <xplan:aufstellungsbeschlussDatum></xplan:aufstellungsbeschlussDatum>
+      <xplan:entwurfsbeschlussDatum></xplan:entwurfsbeschlussDatum>
+      <xplan:wirksamkeitsDatum></xplan:wirksamkeitsDatum>
+      <xplan:bereich xlink:href=""></xplan:bereich>
+    </xplan:FP_Plan>
+  </gml:featureMember>
+</xplan:XPlanAuszug>"""
+
+TEMPLATE_LP_6_0 = """<xplan:XPlanAuszug xmlns:adv="http://www.adv-online.de/nas" xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:xplan="http://www.xplanung.de/xplangml/6/0" xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:wfs="http://www.opengis.net/wfs/2.0" gml:id="">
+  <gml:boundedBy>
+    <gml:Envelope srsName="">
+      <gml:lowerCorner></gml:lowerCorner>
+      <gml:upperCorner></gml:upperCorner>
+    </gml:Envelope>
+  </gml:boundedBy>
+  <gml:featureMember>
+    <xplan:LP_Bereich gml:id="">
+      <xplan:nummer>0</xplan:nummer>
+      <xplan:name></xplan:name>
+      <xplan:gehoertZuPlan xlink:href=""></xplan:gehoertZuPlan>
+    </xplan:LP_Bereich>
+  </gml:featureMember>
+  <gml:featureMember>
+    <xplan:LP_Plan gml:id="">
+      <gml:boundedBy>
+        <gml:Envelope srsName="">
+          <gml:lowerCorner></gml:lowerCorner>
+          <gml:upperCorner></gml:upperCorner>
+        </gml:Envelope>
+      </gml:boundedBy>
+      <xplan:name></xplan:name>
+      <xplan:nummer></xplan:nummer>
+      <xplan:untergangsDatum></xplan:untergangsDatum>
+      <xplan:technHerstellDatum></xplan:technHerstellDatum>
+      <xplan:erstellungsMassstab></xplan:erstellungsMassstab>
+      <xplan:raeumlicherGeltungsbereich></xplan:raeumlicherGeltungsbereich>
+      <xplan:bundesland></xplan:bundesland>
+      <xplan:rechtlicheAussenwirkung></xplan:rechtlicheAussenwirkung>
+      <xplan:planArt></xplan:planArt>
+      <xplan:gemeinde>
+        <xplan:XP_Gemeinde>
+          <xplan:ags></xplan:ags>
+          <xplan:gemeindeName></xplan:gemeindeName>
+          <xplan:ortsteilName></xplan:ortsteilName>
+        </xplan:XP_Gemeinde>
+      </xplan:gemeinde>
+      <xplan:plangeber>
+        <xplan:XP_Plangeber>
+          <xplan:name></xplan:name>
+        </xplan:XP_Plangeber>
+      </xplan:plangeber>
+      <xplan:rechtsstand></xplan:rechtsstand>
+      <xplan:aufstellungsbeschlussDatum></xplan:aufstellungsbeschlussDatum>
+      <xplan:inkrafttretenDatum></xplan:inkrafttretenDatum>
+      <xplan:bereich xlink:href=""></xplan:bereich>
+    </xplan:LP_Plan>
+  </gml:featureMember>
+</xplan:XPlanAuszug>"""
+
+# Plantyp: (Template, Plankategorie)
+PLAN_TYPES = {
+    "bp54": (TEMPLATE_BP_5_4, "BP"),
+    "bp60": (TEMPLATE_BP_6_0, "BP"),
+    "fp60": (TEMPLATE_FP_6_0, "FP"),
+    "lp60": (TEMPLATE_LP_6_0, "LP"),
+}
+
+# Datumsattribut je Rechtsstand
+DATUM_ELEMENTS = {
+    "BP": {
+        "1000": "aufstellungsbeschlussDatum",
+        "2000": "aenderungenBisDatum",
+        "3000": "satzungsbeschlussDatum",
+        "4000": "inkrafttretensDatum",
+    },
+    "FP": {
+        "1000": "aufstellungsbeschlussDatum",
+        "2000": "entwurfsbeschlussDatum",
+        "4000": "wirksamkeitsDatum",
+        "5000": "untergangsDatum",
+    },
+    "LP": {
+        "1000": "aufstellungsbeschlussDatum",
+        "4000": "inkrafttretenDatum",
+        "5000": "untergangsDatum",
+    },
+}
+
+# Elemente, die bei leerem Wert entfernt werden
+OPTIONAL_ELEMENTS = {
+    "BP": ("ortsteilName", "technHerstellDatum", "erstellungsMassstab"),
+    "FP": ("technHerstellDatum", "erstellungsMassstab"),
+    "LP": ("technHerstellDatum", "erstellungsMassstab"),
+}
+
+# Element: Schlüssel in attributes
+TEXT_ELEMENTS = {
+    "nummer": "nummer",
+    "beschreibung": "beschreibung",
+    "kommentar": "kommentar",
+    "technHerstellDatum": "herstellungsdatum",
+    "erstellungsMassstab": "erstellungsmassstab",
+    "bundesland": "bundesland",
+    "rechtlicheAussenwirkung": "rechtliche_aussenwirkung",
+    "planArt": "planart",
+    "rechtsstand": "rechtsstand",
+    "ags": "ags",
+    "gemeindeName": "gemeindename",
+    "ortsteilName": "ortsteilname",
+    "plangeber_name": "plangeber",
+}
+
+
+PLAN_NAME_CHARS = re.compile(r"^[A-Za-z0-9.()_\-äüöÄÜÖß\s]*$")
+
+
+def planNameWarnings(name):
+    """
+    Hinweise, falls der Planname nicht den Vorgaben der xPlanBox entspricht.
+    """
+    messages = []
+    if not PLAN_NAME_CHARS.match(name):
+        messages.append(
+            "XPlan-Umring - Ungültige Zeichen im Plannamen für die Verwendung in der xPlanBox gefunden. Erlaubt sind dort nur: A-Z a-z 0-9 . () _ - ä ü ö Ä Ü Ö ß und Leerzeichen"
+        )
+    if len(name) > 100:
+        messages.append(
+            "XPlan-Umring - Der Planname hat mehr als 100 Zeichen. Dies ist für die Verwendung in der xPlanBox nicht erlaubt."
+        )
+    return messages
+
+
+def _localName(element):
+    return etree.QName(element).localname
+
+
+def _elementPath(root, element):
+    path = []
+    while element is not root:
+        parent = element.getparent()
+        path.append(parent.index(element))
+        element = parent
+    return tuple(reversed(path))
+
+
+class PlanSkeleton:
+    """
+    Einmal geparstes Plangerüst eines Plantyps.
+
+    Die Positionen aller zu befüllenden Elemente werden beim Parsen als
+    Indexpfade gespeichert, so dass eine Kopie ohne Suche im Baum befüllt
+    werden kann.
+    """
+
+    def __init__(self, template, plan_category):
+        self.plan_category = plan_category
+        self.root = etree.fromstring(template)
+        self.xplan_ns = self.root.nsmap["xplan"]
+
+        namespaces = {"gml": GML_NS, "xplan": self.xplan_ns}
+        bereich = self.root.find(
+            "gml:featureMember/xplan:" + plan_category + "_Bereich", namespaces
+        )
+        plan = self.root.find(
+            "gml:featureMember/xplan:" + plan_category + "_Plan", namespaces
+        )
+
+        handles = {
+            "XPlanAuszug": self.root,
+            "XPlanAuszug_envelope": self.root.find(
+                "gml:boundedBy/gml:Envelope", namespaces
+            ),
+            "Bereich": bereich,
+            "Bereich_name": bereich.find("xplan:name", namespaces),
+            "gehoertZuPlan": bereich.find("xplan:gehoertZuPlan", namespaces),
+            "Plan": plan,
+            "Plan_envelope": plan.find("gml:boundedBy/gml:Envelope", namespaces),
+        }
+        for child in plan.iterchildren("{" + self.xplan_ns + "}*"):
+            handles[_localName(child)] = child
+        for child in plan.iterfind("xplan:gemeinde/xplan:XP_Gemeinde/*", namespaces):
+            handles[_localName(child)] = child
+        plangeber_name = plan.find(
+            "xplan:plangeber/xplan:XP_Plangeber/xplan:name", namespaces
+        )
+        if plangeber_name is not None:
+            handles["plangeber_name"] = plangeber_name
+
+        self.paths = {
+            key: _elementPath(self.root, element) for key, element in handles.items()
+        }
+
+    def instantiate(self):
+        """
+        Kopie des Gerüsts mit direkten Referenzen auf die Elemente.
+        """
+        root = copy.deepcopy(self.root)
+        handles = {}
+        for key, path in self.paths.items():
+            element = root
+            for index in path:
+                element = element[index]
+            handles[key] = element
+        return root, handles
+
+
+@functools.lru_cache(maxsize=None)
+def loadSkeleton(plan_type):
+    template, plan_category = PLAN_TYPES[plan_type]
+    return PlanSkeleton(template, plan_category)
+
+
+def buildPlan(plan_type, attributes):
+    """
+    XPlanAuszug eines Plantyps ("bp54", "bp60", "fp60", "lp60") befüllen.
+
+    attributes enthält die Werte als Zeichenketten (fehlende Schlüssel gelten
+    als leer), dazu "kbs", "lower_corner" und "upper_corner". Rückgabe ist das
+    eingerückte Wurzelelement und das (leere) raeumlicherGeltungsbereich-
+    Element, in das die Geometrie beim Schreiben eingefügt wird.
+    """
+    skeleton = loadSkeleton(plan_type)
+    plan_category = skeleton.plan_category
+    root, handles = skeleton.instantiate()
+
+    def value(key):
+        return attributes.get(key) or ""
+
+    uuid_1 = "GML_" + str(uuid.uuid4())
+    uuid_2 = "ID_" + str(uuid.uuid4())
+    uuid_3 = "ID_" + str(uuid.uuid4())
+
+    handles["XPlanAuszug"].attrib[GML_ID] = uuid_1
+    handles["Bereich"].attrib[GML_ID] = uuid_2
+    handles["bereich"].attrib[XLINK_HREF] = "#" + uuid_2
+    handles["Plan"].attrib[GML_ID] = uuid_3
+    handles["gehoertZuPlan"].attrib[XLINK_HREF] = "#" + uuid_3
+
+    for key in ("XPlanAuszug_envelope", "Plan_envelope"):
+        envelope = handles[key]
+        envelope.attrib["srsName"] = value("kbs")
+        envelope[0].text = value("lower_corner")
+        envelope[1].text = value("upper_corner")
+
+    handles["name"].text = value("name")
+    handles["Bereich_name"].text = value("name")
+
+    for element_name, key in TEXT_ELEMENTS.items():
+        if element_name in handles:
+            handles[element_name].text = value(key)
+
+    datum = value("datum")
+    datum_element_name = DATUM_ELEMENTS[plan_category].get(value("rechtsstand"))
+    for element_name in DATUM_ELEMENTS[plan_category].values():
+        element = handles[element_name]
+        if len(datum) > 0 and element_name == datum_element_name:
+            element.text = datum
+        else:
+            element.getparent().remove(element)
+
+    for element_name in OPTIONAL_ELEMENTS[plan_category]:
+        if element_name in handles and value(TEXT_ELEMENTS[element_name]) == "":
+            element = handles[element_name]
+            element.getparent().remove(element)
+
+    etree.indent(root, space="\t", level=0)
+
+    return root, handles["raeumlicherGeltungsbereich"]
@@ -0,0 +1,107 @@
+"""
+***************************************************************************
+XPlan-Umring - Writer
+
+        begin                : October 2026
+        Copyright            : (C) 2026 by Kreis Viersen
+        Email                : open@kreis-viersen.de
+
+***************************************************************************
+
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import re
+import zipfile
+
+from lxml import etree
+
+
+def archiveName(name):
+    """
+    Dateiname (ohne Endung) für das XPlan-Archiv aus dem Plannamen ableiten.
+    """
+    translation_table = str.maketrans(
+        {
+            "ä": "ae",
+            "Ä": "Ae",
+            "ö": "oe",
+            "Ö": "Oe",
+            "ü": "ue",
+            "Ü": "Ue",
+            "ß": "ss",
+        }
+    )
+
+    name = name.translate(translation_table)
+    name = re.sub(r"[^a-zA-Z0-9-_]", "_", name)
+    name = re.sub("_+", "_", name)
+    name = re.sub(r"^[\_]+", "", name)
+    name = re.sub(r"[\_]+$", "", name)
+
+    return name
+
+
+def writeElement(xf, element, placeholder=None, writePlaceholder=None, level=0):
+    """
+    Element mit allen Kindern inkrementell über etree.xmlfile schreiben.
+
+    Statt des Inhalts von placeholder wird writePlaceholder(xf, level)
+    aufgerufen, so dass z.B. die Geometrie direkt in den Ausgabestrom
+    geschrieben wird, ohne vorher im Baum zu liegen.
+    """
+    nsmap = element.nsmap if level == 0 else None
+    with xf.element(element.tag, element.attrib, nsmap=nsmap):
+        if element is placeholder:
+            writePlaceholder(xf, level)
+        else:
+            if element.text:
+                xf.write(element.text)
+            for child in element:
+                writeElement(xf, child, placeholder, writePlaceholder, level + 1)
+    if element.tail:
+        xf.write(element.tail)
+
+
+def elementWriter(element):
+    """
+    Schreibfunktion für writeXPlanGml(), die ein fertiges Element (z.B. eine
+    Geometrie) eingerückt an Stelle des Platzhalters schreibt.
+    """
+
+    def write(xf, level):
+        etree.indent(element, space="\t", level=level + 1)
+        xf.write("\n" + "\t" * (level + 1))
+        writeElement(xf, element, level=level + 1)
+        xf.write("\n" + "\t" * level)
+
+    return write
+
+
+def writeXPlanGml(output, root, placeholder=None, writePlaceholder=None):
+    """
+    XPlanAuszug (bereits eingerückt, ohne Geometrie) als XPlanGML in einen
+    Datei- oder Zip-Strom schreiben.
+    """
+    with etree.xmlfile(output, encoding="UTF-8") as xf:
+        xf.write_declaration()
+        writeElement(xf, root, placeholder, writePlaceholder)
+
+
+def writeXPlanArchive(zip_path, root, placeholder=None, writePlaceholder=None):
+    """
+    XPlan-Archiv mit xplan.gml schreiben, direkt in den Zip-Eintrag.
+
+    Gibt die (unkomprimierte) Größe der xplan.gml in Bytes zurück.
+    """
+    with zipfile.ZipFile(zip_path, "w") as myzip:
+        with myzip.open("xplan.gml", "w") as myfile:
+            writeXPlanGml(myfile, root, placeholder, writePlaceholder)
+        return myzip.getinfo("xplan.gml").file_size